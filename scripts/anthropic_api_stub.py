@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Local stub of the Anthropic Messages and Message Batches endpoints.
+
+POST /v1/messages answers immediately with a canned Stage-1 JSON reply
+(as server-sent events when the request asks to stream); --fail-every
+answers every Nth of them with 529 overloaded_error so the client's
+retry and circuit-breaker paths can be exercised. Replies carry
+--confidence, so model routing can be made to accept or escalate.
+POST /v1/messages/batches accepts a batch that "ends" --delay seconds
+later; retrieving it reports in_progress until then, and the results
+endpoint streams one JSONL line per request (every --error-every'th
+request is reported as errored). Enough to exercise ClaudeService's
+deferred batch path without spending tokens.
+
+Usage:
+    python scripts/anthropic_api_stub.py --port 8200 --delay 5
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8200 ANTHROPIC_BATCH_WINDOW_SECONDS=2 \
+        ANTHROPIC_BATCH_POLL_SECONDS=1 python -m src.main
+
+    curl http://127.0.0.1:8200/v1/messages/batches/<batch_id>
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    """Batches shared by all request threads."""
+
+    def __init__(self, delay: float, error_every: int, fail_every: int, confidence: float):
+        self.delay = delay
+        self.confidence = confidence
+        self.error_every = error_every
+        self.fail_every = fail_every
+        self.batches: dict[str, dict] = {}
+        self.requests = 0
+        self.messages = 0
+        self.lock = threading.Lock()
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _last_user_text(params: dict) -> str:
+    """Text of the last user message (content may be a string or content blocks)."""
+    content = params["messages"][-1]["content"]
+    if isinstance(content, str):
+        return content
+    return "\n".join(block.get("text", "") for block in content if block.get("type") == "text")
+
+
+def _message(params: dict, confidence: float) -> dict:
+    text = _last_user_text(params)
+    task = text.rsplit("## Joey 的任務", 1)[-1].strip().split("\n", 1)[0][:200]
+    reply = {
+        "difficulty": "simple",
+        "title": f"stub: {task[:30]}",
+        "simple_result": {"summary": "stub summary", "result": f"stub result for: {task}"},
+        "memory_updates": [],
+        "line_message": f"stub reply: {task}",
+        "confidence": confidence,
+        "cacheable": True,
+    }
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "stub"),
+        "content": [{"type": "text", "text": json.dumps(reply, ensure_ascii=False)}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": len(text) // 2, "output_tokens": 50},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState = None
+
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _batch_view(self, batch: dict) -> dict:
+        ended = time.time() >= batch["ends_at"]
+        total = len(batch["results"])
+        errored = sum(1 for r in batch["results"] if r["result"]["type"] == "errored")
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total - errored if ended else 0,
+                "errored": errored if ended else 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": _iso(batch["created_at"]),
+            "expires_at": _iso(batch["created_at"] + timedelta(days=1).total_seconds()),
+            "ended_at": _iso(batch["ends_at"]) if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": (
+                f"http://{self.headers['Host']}/v1/messages/batches/{batch['id']}/results" if ended else None
+            ),
+        }
+
+    def _stream(self, message: dict):
+        """Send the message as server-sent events, text split over several deltas."""
+        text = message["content"][0]["text"]
+        events = [
+            ("message_start", {"message": {**message, "content": [], "stop_reason": None}}),
+            ("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}}),
+            *(
+                ("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": text[i:i + 16]}})
+                for i in range(0, len(text), 16)
+            ),
+            ("content_block_stop", {"index": 0}),
+            ("message_delta", {"delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                               "usage": {"output_tokens": message["usage"]["output_tokens"]}}),
+            ("message_stop", {}),
+        ]
+        data = "".join(
+            f"event: {name}\ndata: {json.dumps({'type': name, **payload}, ensure_ascii=False)}\n\n"
+            for name, payload in events
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        state = self.state
+        match = re.fullmatch(r"/v1/messages/batches/([^/]+)(/results)?", self.path)
+        batch = state.batches.get(match.group(1)) if match else None
+        if batch is None:
+            self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": "Not found"}})
+            return
+        if not match.group(2):
+            self._send(200, self._batch_view(batch))
+            return
+
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch["results"]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/binary")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        state = self.state
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/v1/messages":
+            with state.lock:
+                state.messages += 1
+                fail = state.fail_every and state.messages % state.fail_every == 0
+            if fail:
+                self._send(529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+            elif body.get("stream"):
+                self._stream(_message(body, state.confidence))
+            else:
+                self._send(200, _message(body, state.confidence))
+            return
+        if self.path != "/v1/messages/batches":
+            self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": "Not found"}})
+            return
+
+        results = []
+        with state.lock:
+            for request in body["requests"]:
+                state.requests += 1
+                if state.error_every and state.requests % state.error_every == 0:
+                    result = {
+                        "type": "errored",
+                        "error": {"type": "error", "error": {"type": "api_error", "message": "stub error"}},
+                    }
+                else:
+                    result = {"type": "succeeded", "message": _message(request["params"], state.confidence)}
+                results.append({"custom_id": request["custom_id"], "result": result})
+            now = time.time()
+            batch = {
+                "id": f"msgbatch_{uuid.uuid4().hex[:24]}",
+                "created_at": now,
+                "ends_at": now + state.delay,
+                "results": results,
+            }
+            state.batches[batch["id"]] = batch
+        print(f"batch {batch['id']} -> {len(results)} request(s), ends in {state.delay:.0f}s")
+        self._send(200, self._batch_view(batch))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--delay", type=float, default=5, help="Seconds until a submitted batch ends")
+    parser.add_argument("--error-every", type=int, default=0, help="Report every Nth batch request as errored")
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every Nth /v1/messages call with 529")
+    parser.add_argument("--confidence", type=float, default=0.9, help="Confidence reported in canned replies")
+    args = parser.parse_args()
+
+    StubHandler.state = StubState(args.delay, args.error_every, args.fail_every, args.confidence)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    print(f"Anthropic API stub on http://127.0.0.1:{args.port} (batches end after {args.delay:.0f}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
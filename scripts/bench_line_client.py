@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-call LINE API latency, previous SDK path vs pooled client.
+
+Starts a local stub of the Messaging API (HTTP/1.1 keep-alive, optional
+artificial latency) and sends reply messages through:
+  - the previous code path: line-bot-sdk's synchronous ApiClient opened per
+    call inside asyncio.to_thread (new connection pool, and against the real
+    API a new TLS handshake, every time; one thread per in-flight call)
+  - LineService's shared connection-pooled async client
+
+--tls serves the stub over HTTPS with a throwaway self-signed certificate
+(needs the openssl CLI), so the old path pays a TLS handshake per call as it
+does against api.line.me. Without it, loopback connections are nearly free
+and the comparison mostly measures per-request client overhead.
+
+Usage:
+    python scripts/bench_line_client.py
+    python scripts/bench_line_client.py --calls 500 --concurrency 10 --latency-ms 5 --tls
+"""
+
+import argparse
+import asyncio
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Dummy credentials so src.config can load without a .env
+for key in ("LINE_CHANNEL_SECRET", "LINE_CHANNEL_ACCESS_TOKEN", "JOEY_LINE_USER_ID",
+            "NOTION_API_KEY", "NOTION_INBOX_DB_ID", "NOTION_REVIEW_DB_ID",
+            "NOTION_MEMORY_DB_ID", "ANTHROPIC_API_KEY"):
+    os.environ.setdefault(key, "bench")
+
+from linebot.v3.messaging import (
+    ApiClient,
+    Configuration,
+    MessagingApi,
+    ReplyMessageRequest,
+    TextMessage,
+)
+
+from src.services.line_service import LineService
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Accepts any POST and answers 200 like the reply endpoint, over a kept-alive connection."""
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; without TCP_NODELAY the body waits
+    # on the client's delayed ACK (~40 ms) on kept-alive connections only.
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_GET(self):
+        # Quota endpoints polled by LineService.start()
+        self._respond(b'{"type": "none", "totalUsage": 0}')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.latency:
+            time.sleep(self.latency)
+        self._respond(b'{"sentMessages": [{"id": "1", "quoteToken": "q"}]}')
+
+    def _respond(self, body: bytes):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_certificate(directory: str) -> tuple[str, str]:
+    """Create a self-signed certificate for 127.0.0.1, returning (cert, key) paths."""
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1"],
+        check=True, capture_output=True
+    )
+    return cert, key
+
+
+def start_stub(latency_ms: float, certificate: tuple[str, str] = None) -> ThreadingHTTPServer:
+    StubHandler.latency = latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    if certificate:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*certificate)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def timed_calls(call, calls: int, concurrency: int) -> list[float]:
+    """Run `calls` requests with bounded concurrency, returning per-call ms."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await call(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies
+
+
+def report(label: str, latencies: list[float], elapsed: float):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<22} mean {statistics.mean(latencies):7.2f} ms   "
+          f"p95 {p95:7.2f} ms   {len(latencies) / elapsed:8.1f} req/s")
+
+
+async def run(args):
+    certificate = None
+    if args.tls:
+        certificate = make_certificate(tempfile.mkdtemp())
+        # httpx reads SSL_CERT_FILE when the pooled client is built
+        os.environ["SSL_CERT_FILE"] = certificate[0]
+    server = start_stub(args.latency_ms, certificate)
+    scheme = "https" if args.tls else "http"
+    base_url = f"{scheme}://127.0.0.1:{server.server_address[1]}"
+    payload = {"replyToken": "0" * 32, "messages": [{"type": "text", "text": "benchmark"}]}
+
+    configuration = Configuration(access_token="bench", host=base_url)
+    if certificate:
+        configuration.ssl_ca_cert = certificate[0]
+
+    def sdk_reply(reply_token: str, text: str):
+        # Same as the previous LineService._sync_reply_message
+        with ApiClient(configuration) as api_client:
+            MessagingApi(api_client).reply_message(
+                ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=text)])
+            )
+
+    async def sdk_to_thread(i: int):
+        await asyncio.to_thread(sdk_reply, payload["replyToken"], "benchmark")
+
+    service = LineService(api_base_url=base_url, data_api_base_url=base_url)
+    await service.start()
+
+    async def pooled_client(i: int):
+        await service.reply_message(payload["replyToken"], "benchmark")
+
+    print(f"{args.calls} calls, concurrency {args.concurrency}, stub latency {args.latency_ms} ms, "
+          f"{'HTTPS' if args.tls else 'HTTP'}")
+    for label, call in (("SDK + to_thread (old)", sdk_to_thread), ("pooled client", pooled_client)):
+        await timed_calls(call, min(args.calls, 20), args.concurrency)  # warm-up
+        start = time.perf_counter()
+        latencies = await timed_calls(call, args.calls, args.concurrency)
+        report(label, latencies, time.perf_counter() - start)
+
+    await service.close()
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--tls", action="store_true", help="serve the stub over HTTPS")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
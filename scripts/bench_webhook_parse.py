@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: webhook signature verification + JSON parsing.
+
+Compares the previous inline implementation (decode to str, json.loads,
+re-encode for HMAC, `!=` comparison, dict access) with
+src/services/webhook_parser.parse_webhook on realistic multi-event payloads.
+
+Usage:
+    python scripts/bench_webhook_parse.py
+    python scripts/bench_webhook_parse.py --events 1 5 20 --number 20000
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services import webhook_parser
+from src.services.webhook_parser import parse_webhook
+
+CHANNEL_SECRET = "bench_channel_secret_0123456789abcdef"
+
+
+def build_payload(event_count: int) -> bytes:
+    """Build a webhook body with a mix of text and file events."""
+    now = int(datetime.now().timestamp() * 1000)
+    events = []
+    for i in range(event_count):
+        message = (
+            {"type": "file", "id": f"{now}{i}", "fileName": f"content-{i}.md", "fileSize": 48213}
+            if i % 4 == 3 else
+            {"type": "text", "id": f"{now}{i}", "quoteToken": "q" * 44,
+             "text": f"幫我整理第 {i} 份客戶需求，重點放在交期與報價，並附上建議的下一步。"}
+        )
+        events.append({
+            "type": "message",
+            "message": message,
+            "webhookEventId": f"01H{now}{i:06d}",
+            "deliveryContext": {"isRedelivery": False},
+            "timestamp": now,
+            "source": {"type": "user", "userId": f"U{i % 3:032x}"},
+            "replyToken": f"{i:032x}",
+            "mode": "active",
+        })
+    return json.dumps({"destination": "U" + "0" * 32, "events": events}, ensure_ascii=False).encode("utf-8")
+
+
+def sign(body: bytes) -> str:
+    digest = hmac.new(CHANNEL_SECRET.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+def legacy_parse(body: bytes, signature: str) -> list:
+    """The handler's original verify-and-parse code path."""
+    body_str = body.decode("utf-8")
+    body_json = json.loads(body_str)
+    hash_value = hmac.new(
+        CHANNEL_SECRET.encode("utf-8"),
+        body_str.encode("utf-8"),
+        hashlib.sha256
+    ).digest()
+    computed_signature = base64.b64encode(hash_value).decode("utf-8")
+    if signature != computed_signature:
+        raise ValueError("Invalid signature")
+    parsed = []
+    for event in body_json.get("events", []):
+        parsed.append((
+            event.get("type"),
+            event.get("message", {}).get("type"),
+            event.get("replyToken"),
+            event.get("source", {}).get("userId"),
+            event.get("message", {}).get("text", ""),
+        ))
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, nargs="+", default=[1, 5, 20, 100])
+    parser.add_argument("--number", type=int, default=10000)
+    args = parser.parse_args()
+
+    secret = CHANNEL_SECRET.encode("utf-8")
+    decoder = "orjson" if webhook_parser.orjson is not None else "json (orjson not installed)"
+    print(f"JSON decoder: {decoder}")
+    print(f"{'events':>7} {'bytes':>8} {'legacy µs':>10} {'new µs':>10} {'speedup':>8}")
+
+    for count in args.events:
+        body = build_payload(count)
+        signature = sign(body)
+        assert len(legacy_parse(body, signature)) == len(parse_webhook(body, signature, secret)) == count
+
+        legacy = min(timeit.repeat(lambda: legacy_parse(body, signature), number=args.number, repeat=5))
+        new = min(timeit.repeat(lambda: parse_webhook(body, signature, secret), number=args.number, repeat=5))
+        legacy_us = legacy / args.number * 1e6
+        new_us = new / args.number * 1e6
+        print(f"{count:>7} {len(body):>8} {legacy_us:>10.2f} {new_us:>10.2f} {legacy_us / new_us:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -430,7 +430,7 @@ class EvolutionController:
 
 錯誤：{error_msg[:200] if error_msg else 'Unknown error'}"""
 
-            await line_service.push_to_joey(report)
+            await line_service.push_to_joey(report, urgent=True)
             print(f"[Notification] Report sent via LINE")
         except Exception as e:
             print(f"[Notification] Failed to send LINE report: {e}")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Local stub of the LINE Messaging API endpoints the agent calls.
+
+Serves reply / push / multicast, message content download and the
+quota / consumption endpoints. Push and multicast count against an
+in-memory monthly quota (one message per recipient, like LINE), repeated
+X-Line-Retry-Key values get 409, and --fail-every injects 429s with
+Retry-After so retry and degraded-notification paths can be exercised
+without touching the real channel.
+
+Usage:
+    python scripts/line_api_stub.py --port 8100 --limit 200 --usage 150
+    LINE_API_BASE_URL=http://127.0.0.1:8100 python -m src.main
+
+    curl http://127.0.0.1:8100/v2/bot/message/quota/consumption
+"""
+
+import argparse
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    """Quota counters shared by all request threads."""
+
+    def __init__(self, limit: int, usage: int, fail_every: int):
+        self.limit = limit
+        self.usage = usage
+        self.fail_every = fail_every
+        self.requests = 0
+        self.retry_keys: set[str] = set()
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState = None
+
+    def _send(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        state = self.state
+        if self.path == "/v2/bot/message/quota":
+            self._send(200, {"type": "limited", "value": state.limit} if state.limit else {"type": "none"})
+        elif self.path == "/v2/bot/message/quota/consumption":
+            self._send(200, {"totalUsage": state.usage})
+        elif re.fullmatch(r"/v2/bot/message/[^/]+/content", self.path):
+            data = "stub file content\n".encode("utf-8") * 64
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send(404, {"message": "Not found"})
+
+    def do_POST(self):
+        state = self.state
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/v2/bot/message/reply":
+            self._send(200, {})
+            return
+        if self.path not in ("/v2/bot/message/push", "/v2/bot/message/multicast"):
+            self._send(404, {"message": "Not found"})
+            return
+
+        recipients = body["to"] if isinstance(body["to"], list) else [body["to"]]
+        retry_key = self.headers.get("X-Line-Retry-Key")
+        with state.lock:
+            state.requests += 1
+            if state.fail_every and state.requests % state.fail_every == 0:
+                self._send(429, {"message": "Too Many Requests"}, {"Retry-After": "1"})
+                return
+            if retry_key and retry_key in state.retry_keys:
+                self._send(409, {"message": "The retry key is already accepted"})
+                return
+            if state.limit and state.usage + len(recipients) > state.limit:
+                self._send(429, {"message": "You have reached your monthly limit."})
+                return
+            state.usage += len(recipients)
+            if retry_key:
+                state.retry_keys.add(retry_key)
+        print(f"{self.path} -> {len(recipients)} recipient(s), {len(body['messages'])} message(s), "
+              f"usage {state.usage}/{state.limit or '∞'}")
+        self._send(200, {})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--limit", type=int, default=200, help="Monthly message quota (0 = unlimited)")
+    parser.add_argument("--usage", type=int, default=0, help="Messages already used this month")
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every Nth push with 429 + Retry-After")
+    args = parser.parse_args()
+
+    StubHandler.state = StubState(args.limit, args.usage, args.fail_every)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StubHandler)
+    print(f"LINE API stub on http://127.0.0.1:{args.port} (quota {args.limit or 'unlimited'}, used {args.usage})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -62,7 +62,9 @@ def main():
                     "userId": joey_user_id
                 },
                 "replyToken": "test_reply_token_" + str(int(datetime.now().timestamp())),
-                "mode": "active"
+                "mode": "active",
+                "webhookEventId": "test_event_" + str(int(datetime.now().timestamp() * 1000)),
+                "deliveryContext": {"isRedelivery": False}
             }
         ]
     }
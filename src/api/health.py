@@ -1,8 +1,33 @@
-from fastapi import APIRouter
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+
+from src.config import settings
+from src.constants import ADMIN_LOOPBACK_HOSTS, ADMIN_PROXY_HEADERS
+from src.services.claude_service import claude_service
+from src.services.line_quota import line_quota
+from src.services.metrics import metrics
+from src.services.response_cache import response_cache
+from src.services.task_queue import task_queue, stage2_queue, event_queue, outbound_queue
+
+QUEUES = {queue.name: queue for queue in (task_queue, stage2_queue, event_queue, outbound_queue)}
 
 router = APIRouter(tags=["health"])
 
 
+def require_admin(request: Request, x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """管理端點驗證：設定 ADMIN_API_TOKEN 時比對 X-Admin-Token，否則只接受本機直接連線"""
+    if settings.admin_api_token:
+        if x_admin_token and hmac.compare_digest(x_admin_token, settings.admin_api_token):
+            return
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    client_host = request.client.host if request.client else None
+    if client_host in ADMIN_LOOPBACK_HOSTS and not any(h in request.headers for h in ADMIN_PROXY_HEADERS):
+        return
+    raise HTTPException(status_code=403, detail="Admin endpoints are limited to localhost")
+
+
 @router.get("/")
 async def root():
     """Root endpoint."""
@@ -13,3 +38,28 @@ async def root():
 async def health_check():
     """Health check endpoint."""
     return {"status": "healthy"}
+
+
+@router.get("/metrics", dependencies=[Depends(require_admin)])
+async def get_metrics():
+    """Internal metrics: latency histograms, counters, queue depth, response cache size and per-model Claude circuit state."""
+    return {
+        **metrics.snapshot(),
+        "queues": {name: await queue.stats() for name, queue in QUEUES.items()},
+        "response_cache": response_cache.stats(),
+        "claude": claude_service.resilience_snapshot(),
+    }
+
+
+@router.get("/dead-letters", dependencies=[Depends(require_admin)])
+async def get_dead_letters(queue: str = "outbound", limit: int = 50):
+    """Failed jobs (e.g. LINE pushes that ran out of retries), newest first; ids, errors and attempts only."""
+    if queue not in QUEUES:
+        raise HTTPException(status_code=404, detail=f"Unknown queue: {queue}")
+    return {"queue": queue, "jobs": await QUEUES[queue].failed_jobs(limit)}
+
+
+@router.get("/quota", dependencies=[Depends(require_admin)])
+async def get_quota():
+    """LINE monthly message quota: estimated usage and current notification policy."""
+    return line_quota.snapshot()
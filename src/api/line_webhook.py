@@ -1,30 +1,43 @@
+import asyncio
 import logging
-import json
-import hashlib
-import hmac
-import base64
+import math
+import time
 from pathlib import Path
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
+from typing import Optional
+from fastapi import APIRouter, Request, HTTPException
 
 from src.services.line_service import line_service
 from src.services.task_processor import task_processor
+from src.services.task_queue import JobCheckpoint, RetryJob, task_queue, event_queue
+from src.services.metrics import metrics
+from src.services.event_dedupe import event_dedupe
+from src.services.audit_log import audit_log
+from src.services.attachment_store import attachment_store, AttachmentTooLargeError
+from src.services.admission_control import admission_control, AdmissionDecision
+from src.services.webhook_parser import parse_webhook, WebhookSignatureError, WebhookPayloadError
+from src.models.attachment import Attachment
+from src.models.line_event import LineEvent
 from src.config import settings
 from src.constants import (
     LINE_MESSAGE_PREVIEW_LENGTH,
     LINE_LOG_MESSAGE_LENGTH,
     LINE_FILE_LOG_MESSAGE_LENGTH,
-    USER_IDS_LOG_FILENAME,
+    LINE_COALESCE_MAX_WAIT_SECONDS,
+    LINE_DEFERRED_PREFIX,
 )
 
-# 專案根目錄（從 src/api/ 往上兩層）
-PROJECT_ROOT = Path(__file__).parent.parent.parent
-
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["line"])
 
+# Channel secret（簽名驗證用，預先轉為 bytes）
+CHANNEL_SECRET = settings.line_channel_secret.encode("utf-8")
+
 # 總管理員（Joey）
 ADMIN_USER_ID = settings.joey_line_user_id
 
+# 收到其他使用者請求時要通知的管理員
+ADMIN_NOTIFY_USER_IDS = [ADMIN_USER_ID]
+
 # 授權使用者清單（ID -> 名稱）
 AUTHORIZED_USERS = {
     settings.joey_line_user_id: "Joey",
@@ -36,17 +49,83 @@ async def process_message_background(
     user_input: str,
     user_id: str,
     user_name: str,
-    page_content: str = None
+    page_content: str = None,
+    attachments: list[dict] = None,
+    reply_token: str = None,
+    deferred: bool = False,
+    job_id: int = None
 ):
-    """Background task to process LINE message."""
+    """Queued job to process LINE message (failures are recorded by task_queue).
+
+    deferred=True runs Stage 1 through the Message Batches API (for jobs nobody is waiting on).
+    job_id keys the task's checkpoint, so a re-run job does not repeat finished steps.
+    """
+    attachment_models = [Attachment(**a) for a in attachments or []]
     try:
         await task_processor.process_task(
             user_input=user_input,
             source="line",
-            page_content=page_content
+            reply_token=reply_token,
+            page_content=page_content,
+            attachments=attachment_models,
+            deferred=deferred,
+            job_id=job_id
         )
-    except Exception as e:
-        logger.error(f"Background task failed: {e}", exc_info=True)
+    except (asyncio.CancelledError, RetryJob):
+        # 服務關閉或等待 batch 結果時任務會再次執行，附件需保留到下次執行
+        raise
+    except Exception:
+        await attachment_store.delete(attachment_models)
+        raise
+    await attachment_store.delete(attachment_models)
+
+
+def merge_line_messages(existing: dict, new: dict) -> dict:
+    """合併 debounce 期間同一使用者的連續訊息（文字與附件）為單一任務"""
+    page_contents = [c for c in (existing.get("page_content"), new.get("page_content")) if c]
+    return {
+        **existing,
+        "user_input": f"{existing['user_input']}\n{new['user_input']}",
+        "page_content": "\n\n---\n\n".join(page_contents) or None,
+        "attachments": (existing.get("attachments") or []) + (new.get("attachments") or []),
+        # 較新的 reply token 剩餘有效時間較長；較舊的 token 逾時後會自行回覆確認訊息
+        "reply_token": new.get("reply_token") or existing.get("reply_token"),
+        # 任一則訊息需要即時處理時，合併後的任務就不延後
+        "deferred": bool(existing.get("deferred") and new.get("deferred")),
+    }
+
+
+task_queue.register("line_message", process_message_background, merge=merge_line_messages, pass_job_id=True)
+
+
+async def enqueue_line_message(
+    user_input: str,
+    user_id: str,
+    user_name: str,
+    page_content: str = None,
+    attachments: list[Attachment] = None,
+    reply_token: str = None,
+    deferred: bool = False,
+    unique_key: Optional[str] = None
+):
+    """排入任務佇列；啟用 debounce 時，同一使用者在時間窗內的訊息會合併為一個任務
+
+    unique_key（見 task_unique_key）讓重新執行的事件 job 不會再排入第二個任務。
+    """
+    await task_queue.enqueue(
+        "line_message",
+        unique_key=unique_key,
+        delay=settings.line_coalesce_window_seconds,
+        coalesce_key=user_id,
+        max_delay=LINE_COALESCE_MAX_WAIT_SECONDS,
+        user_input=user_input,
+        user_id=user_id,
+        user_name=user_name,
+        page_content=page_content,
+        attachments=[a.model_dump() for a in attachments or []],
+        reply_token=reply_token,
+        deferred=deferred
+    )
 
 
 # 支援的文字檔案類型
@@ -59,19 +138,77 @@ async def notify_admin(user_name: str, user_input: str):
         # 截斷過長的訊息
         preview = user_input[:LINE_MESSAGE_PREVIEW_LENGTH] + "..." if len(user_input) > LINE_MESSAGE_PREVIEW_LENGTH else user_input
         notification = f"📢 {user_name} 提出請求：\n\n{preview}"
-        await line_service.push_to_joey(notification)
-        logger.info(f"Admin notified about {user_name}'s request")
+        result = await line_service.multicast(ADMIN_NOTIFY_USER_IDS, notification, optional=True)
+        if result.failed:
+            logger.error(f"Failed to notify admins {list(result.failed)} about {user_name}'s request")
+        elif result.queued:
+            logger.info(f"Admin notification about {user_name}'s request queued for {len(result.queued)} admin(s)")
+        elif result.sent:
+            logger.info(f"Admin notified about {user_name}'s request")
     except Exception as e:
         logger.error(f"Failed to notify admin: {e}")
 
 
-async def handle_file_message(event: dict, reply_token: str, user_id: str, background_tasks):
-    """處理檔案類型的 LINE 訊息"""
-    message = event.get("message", {})
-    file_name = message.get("fileName", "unknown")
-    file_size = message.get("fileSize", 0)
-    message_id = message.get("id")
+def admission_reply(decision: AdmissionDecision, user_name: str) -> str:
+    """依准入結果組成回覆訊息（使用免費的 reply token）"""
+    if decision.reason == "queue_full":
+        return f"🚦 {user_name}，目前排隊中的任務較多（{decision.queue_position} 件），請稍後再傳送。"
+    if decision.reason == "rate_limited":
+        wait_minutes = max(1, math.ceil(decision.retry_after_seconds / 60))
+        return f"⏳ {user_name}，訊息有點太密集了，請約 {wait_minutes} 分鐘後再傳送。"
+    if decision.queue_position:
+        return f"📝 收到，{user_name}！目前排在第 {decision.queue_position} 位，輪到時會開始處理。"
+    return f"📝 收到，{user_name}！處理中..."
+
+
+def task_unique_key(event: LineEvent) -> Optional[str]:
+    """事件對應的任務 unique_key（沒有 webhookEventId 時為 None）"""
+    return f"task:{event.webhook_event_id}" if event.webhook_event_id else None
+
 
+def split_deferred_prefix(user_input: str) -> tuple[str, bool]:
+    """去掉 LINE_DEFERRED_PREFIX，回傳 (訊息, 是否延後處理)；前綴後沒有內容時視為一般訊息"""
+    rest = user_input[len(LINE_DEFERRED_PREFIX):].strip()
+    if user_input.startswith(LINE_DEFERRED_PREFIX) and rest:
+        return rest, True
+    return user_input, False
+
+
+def can_hold_reply(user_id: str, decision: AdmissionDecision) -> bool:
+    """
+    是否保留 reply token 給任務結果使用
+
+    結果是推送給管理員，所以只有管理員自己的訊息適用；任務需排隊或 debounce 時間窗
+    超過保留時間時，結果不可能在時間內完成，直接回覆確認訊息。
+    """
+    return (
+        user_id == ADMIN_USER_ID
+        and not decision.queue_position
+        and line_service.reply_hold_seconds > settings.line_coalesce_window_seconds
+    )
+
+
+async def acknowledge(user_id: str, reply_token: str, decision: AdmissionDecision, message: str) -> Optional[str]:
+    """回覆確認訊息，或保留 reply token；回傳保留中的 reply token（未保留時為 None）"""
+    if can_hold_reply(user_id, decision):
+        line_service.hold_reply_token(reply_token, message)
+        return reply_token
+    try:
+        await line_service.reply_message(reply_token=reply_token, message=message)
+    except Exception as e:
+        logger.error(f"Failed to send reply: {e}")
+    return None
+
+
+async def handle_file_message(event: LineEvent, checkpoint: JobCheckpoint):
+    """處理檔案類型的 LINE 訊息（checkpoint 見 process_line_event）"""
+    reply_token = event.reply_token
+    user_id = event.user_id
+    file_name = event.file_name
+    file_size = event.file_size
+    message_id = event.message_id
+
+    audit_log.record("file", user_id=user_id, file_name=file_name, file_size=file_size)
     logger.info(f"Received file from {user_id}: {file_name} ({file_size} bytes)")
 
     # 檢查使用者授權
@@ -97,48 +234,74 @@ async def handle_file_message(event: dict, reply_token: str, user_id: str, backg
         )
         return
 
-    # 檢查檔案大小（限制 1MB）
-    if file_size > 1024 * 1024:
-        await line_service.reply_message(
-            reply_token=reply_token,
-            message="⚠️ 檔案太大，請限制在 1MB 以內。"
-        )
+    # 檢查檔案大小（下載時也會再檢查實際大小）
+    max_bytes = settings.line_max_file_bytes
+    too_large_message = f"⚠️ 檔案太大，請限制在 {max_bytes // (1024 * 1024)}MB 以內。"
+    if file_size > max_bytes:
+        await line_service.reply_message(reply_token=reply_token, message=too_large_message)
         return
 
-    try:
-        # 下載檔案內容
-        file_content = await line_service.get_message_content(message_id)
-
-        # 解碼為文字
-        try:
-            text_content = file_content.decode('utf-8')
-        except UnicodeDecodeError:
-            text_content = file_content.decode('utf-8', errors='replace')
-
-        # RawInput 只存檔名，完整內容存到 page_content
-        user_input = f"📎 檔案：{file_name}"
+    acknowledged = checkpoint.get("acknowledged")
+    if not acknowledged:
+        # 准入控制（在下載檔案前檢查）
+        decision = await admission_control.admit(user_id)
+        if not decision.admitted:
+            await line_service.reply_message(
+                reply_token=reply_token,
+                message=admission_reply(decision, user_name)
+            )
+            return
 
-        # 回覆確認訊息
-        await line_service.reply_message(
-            reply_token=reply_token,
-            message=f"📎 收到檔案 {file_name}，{user_name}！處理中..."
-        )
+    attachment = None
+    try:
+        if acknowledged:
+            # 重新執行的事件 job：沿用已下載的附件，不再回覆與通知
+            attachment = Attachment(**checkpoint.get("attachment"))
+            held_reply_token = checkpoint.get("held_reply_token")
+        else:
+            # 串流下載並逐塊解碼到暫存檔
+            try:
+                attachment = await attachment_store.save_stream(
+                    file_name,
+                    line_service.iter_message_content(message_id),
+                    max_bytes
+                )
+            except AttachmentTooLargeError:
+                await line_service.reply_message(reply_token=reply_token, message=too_large_message)
+                return
+
+            # 回覆確認訊息（或保留 reply token 給任務結果）
+            held_reply_token = await acknowledge(
+                user_id,
+                reply_token,
+                decision,
+                f"📎 收到檔案 {file_name}，{user_name}！目前排在第 {decision.queue_position} 位。"
+                if decision.queue_position else
+                f"📎 收到檔案 {file_name}，{user_name}！處理中..."
+            )
 
-        # 如果不是管理員，通知管理員
-        if user_id != ADMIN_USER_ID:
-            await notify_admin(user_name, f"[檔案] {file_name}")
+            # 如果不是管理員，通知管理員
+            if user_id != ADMIN_USER_ID:
+                await notify_admin(user_name, f"[檔案] {file_name}")
+            await checkpoint.save(
+                acknowledged=True, attachment=attachment.model_dump(), held_reply_token=held_reply_token
+            )
 
-        # 背景處理任務（完整內容傳到 page_content）
-        background_tasks.add_task(
-            process_message_background,
-            user_input=user_input,
+        # 排入任務佇列（RawInput 只存檔名，完整內容以附件檔傳遞；附件檔由任務完成後刪除）
+        await enqueue_line_message(
+            user_input=f"📎 檔案：{file_name}",
             user_id=user_id,
             user_name=user_name,
-            page_content=text_content
+            attachments=[attachment],
+            reply_token=held_reply_token,
+            unique_key=task_unique_key(event)
         )
+        await checkpoint.save(task_queued=True)
 
     except Exception as e:
         logger.error(f"Failed to process file: {e}", exc_info=True)
+        if attachment is not None:
+            await attachment_store.delete([attachment])
         try:
             await line_service.reply_message(
                 reply_token=reply_token,
@@ -148,102 +311,187 @@ async def handle_file_message(event: dict, reply_token: str, user_id: str, backg
             pass
 
 
-@router.post("/webhook/line")
-async def line_webhook(request: Request, background_tasks: BackgroundTasks):
-    """LINE Webhook endpoint with user authorization."""
-
-    signature = request.headers.get("X-Line-Signature", "")
-    if not signature:
-        raise HTTPException(status_code=400, detail="Missing signature")
-
-    body = await request.body()
-    body_str = body.decode("utf-8")
+async def process_line_event(event: LineEvent, checkpoint: Optional[JobCheckpoint] = None):
+    """處理單一 LINE 事件：授權檢查、回覆確認、通知管理員、排入任務佇列
 
-    try:
-        body_json = json.loads(body_str)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid JSON")
+    checkpoint 是 event_queue job 的進度：租約逾期後重新執行的事件 job 不再重複回覆、
+    通知與下載附件，任務已排入時直接結束（任務本身另以 task_unique_key 去重）。
+    """
+    if event.type != "message":
+        return
+    if checkpoint is None:
+        checkpoint = await event_queue.load_checkpoint(None)
+    if checkpoint.get("task_queued"):
+        logger.info(f"事件 {event.webhook_event_id} 的任務已排入佇列，略過")
+        return
 
-    # Verify signature
-    try:
-        channel_secret = settings.line_channel_secret
-        hash_value = hmac.new(
-            channel_secret.encode("utf-8"),
-            body_str.encode("utf-8"),
-            hashlib.sha256
-        ).digest()
-        computed_signature = base64.b64encode(hash_value).decode("utf-8")
-
-        if signature != computed_signature:
-            raise HTTPException(status_code=400, detail="Invalid signature")
-    except Exception as e:
-        logger.error(f"Signature verification failed: {e}")
-        raise HTTPException(status_code=400, detail="Invalid signature")
+    reply_token = event.reply_token
+    user_id = event.user_id
 
-    events = body_json.get("events", [])
+    # 處理檔案訊息
+    if event.message_type == "file":
+        await handle_file_message(event, checkpoint)
+        return
 
-    for event in events:
-        if event.get("type") != "message":
-            continue
+    # 處理文字訊息
+    if event.message_type != "text":
+        return
 
-        message_type = event.get("message", {}).get("type")
-        reply_token = event.get("replyToken")
-        user_id = event.get("source", {}).get("userId")
+    user_input = event.text
 
-        # 處理檔案訊息
-        if message_type == "file":
-            await handle_file_message(event, reply_token, user_id, background_tasks)
-            continue
+    # Log all incoming messages
+    audit_log.record("text", user_id=user_id, message=user_input[:LINE_FILE_LOG_MESSAGE_LENGTH])
 
-        # 處理文字訊息
-        if message_type != "text":
-            continue
+    logger.info(f"Received message from {user_id}: {user_input[:LINE_LOG_MESSAGE_LENGTH]}...")
 
-        user_input = event.get("message", {}).get("text", "")
+    if not user_input:
+        return
 
-        # Log all incoming messages
-        log_file = PROJECT_ROOT / USER_IDS_LOG_FILENAME
-        with open(log_file, "a") as f:
-            f.write(f"User ID: {user_id}, Message: {user_input[:LINE_FILE_LOG_MESSAGE_LENGTH]}\n")
+    # 檢查使用者是否授權
+    if user_id not in AUTHORIZED_USERS:
+        logger.warning(f"Unauthorized user: {user_id}")
+        try:
+            await line_service.reply_message(
+                reply_token=reply_token,
+                message="抱歉，你目前沒有使用權限。請聯繫管理員。"
+            )
+        except Exception as e:
+            logger.error(f"Failed to send unauthorized reply: {e}")
+        return
 
-        logger.info(f"Received message from {user_id}: {user_input[:LINE_LOG_MESSAGE_LENGTH]}...")
+    # 取得使用者名稱
+    user_name = AUTHORIZED_USERS[user_id]
+    message_text = user_input
+    user_input, deferred = split_deferred_prefix(user_input)
+
+    if checkpoint.get("acknowledged"):
+        # 重新執行的事件 job：確認訊息與通知已送出
+        held_reply_token = checkpoint.get("held_reply_token")
+    else:
+        # 准入控制：超過頻率或佇列已滿時直接回覆，不建立任務
+        decision = await admission_control.admit(user_id)
+        if not decision.admitted:
+            try:
+                await line_service.reply_message(
+                    reply_token=reply_token,
+                    message=admission_reply(decision, user_name)
+                )
+            except Exception as e:
+                logger.error(f"Failed to send backpressure reply: {e}")
+            return
 
-        if not user_input:
-            continue
+        # 如果不是管理員，通知管理員有人提出請求
+        if user_id != ADMIN_USER_ID:
+            await notify_admin(user_name, message_text)
 
-        # 檢查使用者是否授權
-        if user_id not in AUTHORIZED_USERS:
-            logger.warning(f"Unauthorized user: {user_id}")
+        # 延後處理的訊息：結果數分鐘到數小時後才會完成，直接回覆確認訊息，不保留 reply token
+        if deferred:
             try:
                 await line_service.reply_message(
                     reply_token=reply_token,
-                    message="抱歉，你目前沒有使用權限。請聯繫管理員。"
+                    message=f"🌙 收到，{user_name}！這則會以批次方式處理（可能需要數小時），完成後通知你。"
                 )
             except Exception as e:
-                logger.error(f"Failed to send unauthorized reply: {e}")
-            continue
+                logger.error(f"Failed to send reply: {e}")
+            held_reply_token = None
+        else:
+            # 授權使用者 - 回覆確認訊息（含排隊位置），或保留 reply token 給任務結果
+            held_reply_token = await acknowledge(
+                user_id, reply_token, decision, admission_reply(decision, user_name)
+            )
+        await checkpoint.save(acknowledged=True, held_reply_token=held_reply_token)
 
-        # 取得使用者名稱
-        user_name = AUTHORIZED_USERS[user_id]
+    await enqueue_line_message(
+        user_input=user_input,
+        user_id=user_id,
+        user_name=user_name,
+        reply_token=held_reply_token,
+        deferred=deferred,
+        unique_key=task_unique_key(event)
+    )
+    await checkpoint.save(task_queued=True)
 
-        # 如果不是管理員，通知管理員有人提出請求
-        if user_id != ADMIN_USER_ID:
-            await notify_admin(user_name, user_input)
 
-        # 授權使用者 - 回覆確認訊息
+async def process_queued_line_event(event: dict, job_id: Optional[int] = None):
+    """event_queue handler：佇列中保存的是原始事件 dict，進度記錄在該 job 的 checkpoint"""
+    checkpoint = await event_queue.load_checkpoint(job_id)
+    await process_line_event(LineEvent.from_dict(event), checkpoint)
+
+
+event_queue.register("line_event", process_queued_line_event, pass_job_id=True)
+
+
+async def process_line_events(events: list[LineEvent]) -> None:
+    """
+    並行處理同一個 webhook 內的多個事件。
+
+    同一個 userId 的事件依原始順序逐一處理，不同使用者之間並行，
+    同時處理中的事件數量以 settings.line_max_inflight_events 為上限。
+    """
+    semaphore = asyncio.Semaphore(settings.line_max_inflight_events)
+    by_user: dict[Optional[str], list[LineEvent]] = {}
+    for event in events:
+        by_user.setdefault(event.user_id, []).append(event)
+
+    async def run_in_order(user_events: list[LineEvent]) -> None:
+        for event in user_events:
+            async with semaphore:
+                try:
+                    await process_line_event(event)
+                except Exception as e:
+                    logger.error(f"Failed to process event: {e}", exc_info=True)
+
+    await asyncio.gather(*(run_in_order(user_events) for user_events in by_user.values()))
+
+
+@router.post("/webhook/line")
+async def line_webhook(request: Request):
+    """LINE Webhook endpoint with user authorization.
+
+    Fast-ack 模式（預設）只驗證簽名並將事件寫入 event_queue 即返回，
+    回覆、通知與記錄都在 event worker 中處理，避免 LINE 因回應過慢而重送；
+    同時處理中的事件數量即 event worker 數量（settings.line_event_workers）。
+    """
+    started = time.perf_counter()
+    try:
+        signature = request.headers.get("X-Line-Signature", "")
+        if not signature:
+            raise HTTPException(status_code=400, detail="Missing signature")
+
+        body = await request.body()
+
+        # 在原始 bytes 上驗證簽名並解析為 LineEvent
         try:
-            await line_service.reply_message(
-                reply_token=reply_token,
-                message=f"📝 收到，{user_name}！處理中..."
-            )
-        except Exception as e:
-            logger.error(f"Failed to send reply: {e}")
+            events = parse_webhook(body, signature, CHANNEL_SECRET)
+        except WebhookSignatureError:
+            logger.error("Signature verification failed")
+            raise HTTPException(status_code=400, detail="Invalid signature")
+        except WebhookPayloadError:
+            raise HTTPException(status_code=400, detail="Invalid JSON")
 
-        background_tasks.add_task(
-            process_message_background,
-            user_input=user_input,
-            user_id=user_id,
-            user_name=user_name
-        )
+        redeliveries = sum(1 for event in events if event.is_redelivery)
+        if redeliveries:
+            metrics.incr("webhook_redeliveries", redeliveries)
 
-    return {"status": "ok"}
+        # 去重：LINE 重送的事件在任何 Notion / Anthropic 呼叫前就丟棄
+        if settings.line_fast_ack:
+            events = event_dedupe.filter(events)
+            try:
+                # order_key 讓同一使用者的事件在多個 event worker 之間仍維持順序；
+                # unique_key 讓重啟後才抵達的重送在寫入佇列的同一個交易內被擋下
+                await event_queue.enqueue_many(
+                    "line_event",
+                    [{"event": event.raw} for event in events],
+                    [event.user_id for event in events],
+                    [event.webhook_event_id for event in events]
+                )
+            except Exception:
+                event_dedupe.release(events)
+                raise
+        else:
+            events = await event_dedupe.reserve(events)
+            await process_line_events(events)
+
+        return {"status": "ok"}
+    finally:
+        metrics.histogram("webhook_line_ms").observe((time.perf_counter() - started) * 1000)
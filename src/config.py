@@ -1,6 +1,12 @@
+from pathlib import Path
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
+# 專案根目錄（從 src/ 往上一層）
+PROJECT_ROOT = Path(__file__).parent.parent
+
 
 class Settings(BaseSettings):
     # LINE Bot
@@ -24,6 +30,109 @@ class Settings(BaseSettings):
         default="claude-sonnet-4-20250514",
         description="Claude model to use"
     )
+    anthropic_fast_model: str = Field(
+        default="claude-3-5-haiku-20241022",
+        description="Small model that handles Stage 1 first; empty disables model routing"
+    )
+    anthropic_fast_min_confidence: float = Field(
+        default=0.8,
+        description="Fast-model answers below this self-reported confidence are escalated to anthropic_model"
+    )
+    anthropic_prompt_cache: bool = Field(
+        default=True,
+        description="Mark the system prompt and memory block as prompt-cache breakpoints"
+    )
+    anthropic_stream_stage1: bool = Field(
+        default=True,
+        description="Stream Stage-1 responses so dependent work starts once difficulty and title are known"
+    )
+    anthropic_base_url: Optional[str] = Field(
+        default=None,
+        description="Override the Anthropic API base URL (e.g. scripts/anthropic_api_stub.py for local testing)"
+    )
+    anthropic_batch_window_seconds: float = Field(
+        default=300.0,
+        description="How long deferred Claude requests accumulate before they are submitted as one message batch"
+    )
+    anthropic_batch_max_requests: int = Field(
+        default=100,
+        description="Submit a message batch early once this many deferred requests are waiting"
+    )
+    anthropic_batch_poll_seconds: float = Field(
+        default=60.0,
+        description="Polling interval for in-progress message batches"
+    )
+    anthropic_timeout_seconds: float = Field(
+        default=120.0,
+        description="Timeout for a single Claude API request"
+    )
+    anthropic_max_retries: int = Field(
+        default=2,
+        description="Retries per Claude API call for retryable errors (429, 529, 5xx, connection)"
+    )
+    anthropic_retry_budget_ratio: float = Field(
+        default=0.2,
+        description="Global retry budget: retries (including hedges) allowed per Claude API call over time"
+    )
+    anthropic_circuit_failure_threshold: int = Field(
+        default=5,
+        description="Consecutive retryable Claude API failures that open the circuit breaker"
+    )
+    anthropic_circuit_reset_seconds: float = Field(
+        default=30.0,
+        description="How long the open circuit fails fast before a probe request is allowed"
+    )
+    anthropic_hedge_requests: bool = Field(
+        default=False,
+        description="Send a second request when a Claude API call exceeds its p95 latency and use the first to finish"
+    )
+    anthropic_max_concurrency: int = Field(
+        default=4,
+        description="Maximum concurrent Claude API requests (also the connection pool size)"
+    )
+    anthropic_input_token_budget: int = Field(
+        default=150000,
+        description="Estimated input-token budget for a Stage-1 prompt; lower-priority sections are trimmed to fit"
+    )
+    attachment_digest_threshold_tokens: int = Field(
+        default=20000,
+        description="Attachments estimated above this many tokens are summarized in parallel chunks before Stage 1 (0 disables)"
+    )
+    attachment_digest_concurrency: int = Field(
+        default=4,
+        description="Maximum attachment chunks summarized concurrently"
+    )
+    attachment_digest_max_chunks: int = Field(
+        default=16,
+        description="Maximum chunks summarized per task; the middle of longer attachments is skipped"
+    )
+    response_cache_enabled: bool = Field(
+        default=True,
+        description="Serve repeated simple tasks from the Stage-1 response cache"
+    )
+    response_cache_ttl_seconds: int = Field(
+        default=3600,
+        description="How long a cached Stage-1 response stays valid"
+    )
+    response_cache_max_entries: int = Field(
+        default=500,
+        description="Maximum cached Stage-1 responses (least recently used are evicted)"
+    )
+    response_cache_near_duplicate: bool = Field(
+        default=False,
+        description="Also match near-duplicate inputs by MinHash similarity"
+    )
+    response_cache_similarity_threshold: float = Field(
+        default=0.9,
+        description="Minimum estimated Jaccard similarity for a near-duplicate hit"
+    )
+
+    # Admin endpoints
+    admin_api_token: str = Field(
+        default="",
+        description="Shared secret required in the X-Admin-Token header for /metrics, /dead-letters and /quota; "
+                    "when empty these endpoints only answer direct (non-proxied) requests from localhost"
+    )
 
     # Claude Code
     claude_code_oauth_token: str = Field(
@@ -45,6 +154,108 @@ class Settings(BaseSettings):
         description="Render API Key for deployment"
     )
 
+    # Task Queue
+    data_dir: str = Field(
+        default="data",
+        description="Directory for local state such as the task queue (relative to project root)"
+    )
+    task_queue_workers: int = Field(
+        default=2,
+        description="Number of workers draining the durable task queue"
+    )
+    task_queue_stage2_workers: int = Field(
+        default=1,
+        description="Workers running Claude Code (Stage 2) jobs, separate from the Stage-1 task workers"
+    )
+    task_queue_max_attempts: int = Field(
+        default=3,
+        description="How many times a job may be claimed before it is marked failed"
+    )
+
+    # LINE HTTP client
+    line_api_base_url: Optional[str] = Field(
+        default=None,
+        description="Override the LINE API base URL, e.g. a local stub (scripts/line_api_stub.py)"
+    )
+    line_http2: bool = Field(
+        default=True,
+        description="Use HTTP/2 for LINE API calls when the h2 package is installed"
+    )
+    line_http_timeout_seconds: float = Field(
+        default=10.0,
+        description="Timeout for LINE API calls"
+    )
+    line_http_max_connections: int = Field(
+        default=20,
+        description="Connection pool size for LINE API calls"
+    )
+    line_outbound_workers: int = Field(
+        default=2,
+        description="Number of workers sending queued LINE pushes"
+    )
+    line_outbound_max_attempts: int = Field(
+        default=8,
+        description="Send attempts for a LINE push before it is kept as a dead letter"
+    )
+    line_outbound_rate_per_second: float = Field(
+        default=10.0,
+        description="Channel-wide rate limit for LINE push requests"
+    )
+    line_reply_hold_seconds: float = Field(
+        default=20.0,
+        description="Hold the reply token this long so a fast result can be sent as a free reply (0 disables)"
+    )
+    line_quota_reduced_ratio: float = Field(
+        default=0.8,
+        description="Share of the monthly message quota after which optional pushes are skipped"
+    )
+    line_push_coalesce_window_seconds: float = Field(
+        default=3.0,
+        description="Delay non-urgent pushes in the outbound queue for this long, merging pushes to the same recipient into one request (0 disables)"
+    )
+
+    # LINE Webhook
+    line_fast_ack: bool = Field(
+        default=True,
+        description="Only verify and enqueue webhook events, handle replies/logging out-of-band"
+    )
+    line_event_workers: int = Field(
+        default=4,
+        description="Number of workers handling queued webhook events"
+    )
+    line_max_inflight_events: int = Field(
+        default=8,
+        description="Max events of one webhook body processed concurrently when fast-ack is off"
+    )
+    line_max_file_bytes: int = Field(
+        default=20 * 1024 * 1024,
+        description="Maximum size of a LINE file attachment (streamed to disk)"
+    )
+    line_coalesce_window_seconds: float = Field(
+        default=0,
+        description="Debounce window for merging a user's consecutive messages into one task (0 disables)"
+    )
+    line_user_burst: int = Field(
+        default=5,
+        description="Messages a user may send in a burst before rate limiting kicks in"
+    )
+    line_user_rate_per_minute: float = Field(
+        default=2,
+        description="Sustained per-user message rate (token bucket refill per minute)"
+    )
+    line_max_pending_tasks: int = Field(
+        default=20,
+        description="Reject new tasks while this many tasks are waiting in the queue"
+    )
+    line_dedupe_ttl_seconds: int = Field(
+        default=86400,
+        description="How long a webhookEventId is remembered for deduplication"
+    )
+    line_dedupe_max_entries: int = Field(
+        default=10000,
+        description="Maximum webhookEventIds kept in the in-memory dedupe cache"
+    )
+
     # App
     app_env: str = Field(default="development", description="Application environment")
     host: str = Field(default="0.0.0.0", description="Server host")
@@ -55,5 +266,13 @@ class Settings(BaseSettings):
         env_file_encoding = "utf-8"
         extra = "ignore"  # Ignore any extra env vars not defined here
 
+    @property
+    def data_path(self) -> Path:
+        """Resolved directory for local state files."""
+        path = Path(self.data_dir)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+        return path
+
 
 settings = Settings()
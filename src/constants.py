@@ -9,11 +9,49 @@
 # Notion API 富文字欄位的最大長度限制（留餘量避免 Unicode 問題）
 NOTION_MAX_TEXT_LENGTH = 1990
 
+# Notion 單次請求最多可建立 / 附加的 block 數量
+NOTION_MAX_BLOCKS_PER_REQUEST = 100
+
 # ==================== Claude API 相關常數 ====================
 
-# Claude API 回應的最大 token 數
+# Claude API 回應的最大 token 數（依回應類型選擇的 max_tokens 不超過此值）
 CLAUDE_MAX_TOKENS = 4096
 
+# 短問題（估計輸入不超過 CLAUDE_SHORT_INPUT_TOKENS）且沒有附件時的 max_tokens
+CLAUDE_SHORT_REPLY_MAX_TOKENS = 1024
+CLAUDE_SHORT_INPUT_TOKENS = 200
+
+# 一般任務的 max_tokens；有附件時再加上附件的估計 token 數
+CLAUDE_DEFAULT_REPLY_MAX_TOKENS = 2048
+
+# Claude API 建立連線的逾時秒數（整體逾時見 settings.anthropic_timeout_seconds）
+CLAUDE_CONNECT_TIMEOUT_SECONDS = 10
+
+# Claude API 連線池閒置連線保留時間（秒）
+CLAUDE_HTTP_KEEPALIVE_SECONDS = 120
+
+# Claude API 重試的指數退避起始秒數與上限（full jitter）
+CLAUDE_RETRY_BASE_SECONDS = 1
+CLAUDE_RETRY_MAX_SECONDS = 20
+
+# 全域重試預算的 token 上限（也是啟動時的初始值）
+CLAUDE_RETRY_BUDGET_MAX_TOKENS = 10
+
+# Hedging 以成功嘗試的第幾百分位延遲作為送出第二個請求的時間點
+CLAUDE_HEDGE_PERCENTILE = 95
+
+# 延遲樣本數達此值才啟用 hedging
+CLAUDE_HEDGE_MIN_SAMPLES = 20
+
+# Hedging 計算百分位時保留的最近成功嘗試延遲筆數（每個操作）
+CLAUDE_HEDGE_WINDOW_SIZE = 200
+
+# Message Batches 請求與結果的 SQLite 檔名（位於 settings.data_path）
+CLAUDE_BATCH_DB_FILENAME = "claude_batches.db"
+
+# 已完成的 batch 請求保留天數
+CLAUDE_BATCH_RETENTION_DAYS = 7
+
 # ==================== LINE 相關常數 ====================
 
 # LINE 訊息預覽長度（用於截斷通知）
@@ -25,10 +63,131 @@ LINE_LOG_MESSAGE_LENGTH = 50
 # LINE 檔案記錄的最大訊息長度
 LINE_FILE_LOG_MESSAGE_LENGTH = 100
 
-# ==================== 路徑相關常數 ====================
+# LINE Messaging API
+LINE_API_BASE_URL = "https://api.line.me"
+
+# LINE 檔案內容下載 API
+LINE_DATA_API_BASE_URL = "https://api-data.line.me"
+
+# LINE 連線池閒置連線保留時間（秒）
+LINE_HTTP_KEEPALIVE_SECONDS = 120
+
+# 單則文字訊息的字數上限（LINE API 限制，以 UTF-16 計算）
+LINE_TEXT_MAX_CHARS = 5000
+
+# 單次 reply / push 請求可包含的訊息則數上限（LINE API 限制）
+LINE_MAX_MESSAGES_PER_REQUEST = 5
+
+# 單次 multicast 請求的收件者上限（LINE API 限制）
+LINE_MULTICAST_MAX_RECIPIENTS = 500
+
+# 直接發送（未經 outbound_queue）時同時送出的 multicast 請求數上限
+LINE_MULTICAST_CONCURRENCY = 4
+
+# LINE 訊息額度校正間隔（秒）
+LINE_QUOTA_RECONCILE_INTERVAL_SECONDS = 600
+
+# 額度政策為 reduced 時的 push 合併時間窗（秒）
+LINE_QUOTA_REDUCED_PUSH_WINDOW_SECONDS = 60
+
+# reply token 有效時間（秒），保留 reply token 時需在此之前使用
+LINE_REPLY_TOKEN_TTL_SECONDS = 60
+
+# 保留 reply token 時預留的安全時間（秒）
+LINE_REPLY_TOKEN_SAFETY_MARGIN_SECONDS = 10
+
+# 連續訊息合併（debounce）時，任務最多延後到第一則訊息後幾秒
+LINE_COALESCE_MAX_WAIT_SECONDS = 60
+
+# 以此前綴開頭的文字訊息不急著回覆：Stage 1 以 Message Batches 處理（半價，數分鐘到數小時）
+LINE_DEFERRED_PREFIX = "/later"
+
+# ==================== 附件相關常數 ====================
+
+# 附件暫存目錄名稱（位於 settings.data_path）
+ATTACHMENTS_DIRNAME = "attachments"
+
+# 交給 Stage 2（Claude Code）的附件原文目錄名稱（位於附件暫存目錄下，Stage 2 結束後刪除）
+ATTACHMENTS_STAGE2_DIRNAME = "stage2"
+
+# Claude Code 任務資料夾中放附件原文的子目錄名稱
+CLAUDE_CODE_ATTACHMENTS_DIRNAME = "attachments"
 
-# 使用者 ID 記錄檔名稱
-USER_IDS_LOG_FILENAME = "user_ids.log"
+# 交給 Stage 2 的文字訊息內容（page_content）檔名
+STAGE2_MESSAGE_FILENAME = "message.txt"
+
+# 串流下載時每個 chunk 的大小（bytes）
+ATTACHMENT_DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+# 讀取暫存附件時每個 chunk 的字元數
+ATTACHMENT_READ_CHUNK_CHARS = 64 * 1024
+
+# Notion Inbox 頁面只寫入附件開頭的預覽字元數（Inbox 頁面在任務完成後即刪除）
+ATTACHMENT_NOTION_PREVIEW_CHARS = 4000
+
+# Stage 1 最多從每個附件讀入的字元數（超過的部分不載入記憶體）
+ATTACHMENT_STAGE1_MAX_CHARS = 1_000_000
+
+# 大型附件摘要時每段的估計 token 數
+ATTACHMENT_DIGEST_CHUNK_TOKENS = 8000
+
+# 每段摘要的 max_tokens
+ATTACHMENT_DIGEST_MAX_TOKENS = 1024
+
+# ==================== 稽核記錄相關常數 ====================
+
+# 訊息稽核記錄檔名（JSONL，位於 settings.data_path）
+AUDIT_LOG_FILENAME = "audit_log.jsonl"
+
+# 記憶體內待寫入紀錄上限，超過即丟棄並計數
+AUDIT_LOG_QUEUE_SIZE = 10000
+
+# 每批寫入的最大筆數
+AUDIT_LOG_BATCH_SIZE = 200
+
+# 批次寫入間隔（秒）
+AUDIT_LOG_FLUSH_INTERVAL_SECONDS = 1
+
+# 單一記錄檔大小上限（bytes，10 MB），超過即輪替
+AUDIT_LOG_MAX_BYTES = 10 * 1024 * 1024
+
+# 保留的輪替檔數量
+AUDIT_LOG_BACKUP_COUNT = 14
+
+# ==================== 任務佇列相關常數 ====================
+
+# 任務佇列 SQLite 檔名（位於 settings.data_path）
+TASK_QUEUE_DB_FILENAME = "task_queue.db"
+
+# Worker 取得任務後的租約時間（秒），逾期未續約即視為 worker 已死亡並回收
+TASK_QUEUE_LEASE_SECONDS = 120
+
+# 佇列空閒時的輪詢間隔（秒）
+TASK_QUEUE_POLL_INTERVAL_SECONDS = 5
+
+# 已完成 / 失敗任務的保留天數
+TASK_QUEUE_RETENTION_DAYS = 7
+
+# RetryJob 未指定等待時間時的指數退避起始秒數與上限
+TASK_QUEUE_RETRY_BASE_SECONDS = 2
+TASK_QUEUE_RETRY_MAX_SECONDS = 300
+
+# Webhook 事件去重 SQLite 檔名（位於 settings.data_path）
+DEDUPE_DB_FILENAME = "webhook_events.db"
+
+# 寫入去重紀錄時，距上次清除超過此秒數就順便清除過期紀錄
+DEDUPE_PRUNE_INTERVAL_SECONDS = 3600
+
+# ==================== 回應快取相關常數 ====================
+
+# Stage 1 回應快取 SQLite 檔名（位於 settings.data_path）
+RESPONSE_CACHE_DB_FILENAME = "response_cache.db"
+
+# 近似比對使用的字元 shingle 長度
+RESPONSE_CACHE_SHINGLE_SIZE = 3
+
+# MinHash 簽章長度（排列數），越長估計越準、比對越慢
+RESPONSE_CACHE_MINHASH_PERMUTATIONS = 64
 
 # ==================== Claude Code 服務相關常數 ====================
 
@@ -46,3 +205,11 @@ TASK_DEFAULT_TIMEOUT_SECONDS = 21600
 
 # 預設單次執行超時時間（秒，1 小時）
 TASK_EXECUTION_TIMEOUT_SECONDS = 3600
+
+# ==================== 管理端點相關常數 ====================
+
+# 未設定 ADMIN_API_TOKEN 時允許存取管理端點的來源位址
+ADMIN_LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+# 反向代理（例如 Cloudflare Tunnel）加上的標頭：這類請求同樣來自 localhost，不視為本機請求
+ADMIN_PROXY_HEADERS = ("x-forwarded-for", "cf-connecting-ip", "forwarded")
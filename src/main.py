@@ -5,6 +5,12 @@ from contextlib import asynccontextmanager
 from src.config import settings
 from src.api.health import router as health_router
 from src.api.line_webhook import router as line_router
+from src.services.task_queue import task_queue, stage2_queue, event_queue, outbound_queue
+from src.services.event_dedupe import event_dedupe
+from src.services.response_cache import response_cache
+from src.services.audit_log import audit_log
+from src.services.line_service import line_service
+from src.services.claude_service import claude_service
 
 # Configure logging
 logging.basicConfig(
@@ -19,8 +25,25 @@ async def lifespan(app: FastAPI):
     """Application lifespan handler."""
     logger.info(f"Starting Joey's AI Agent in {settings.app_env} mode")
     logger.info(f"Server: {settings.host}:{settings.port}")
+    await line_service.start()
+    await claude_service.start()
+    await audit_log.start()
+    await event_dedupe.load()
+    await response_cache.load()
+    await task_queue.start()
+    await stage2_queue.start()
+    await event_queue.start()
+    await outbound_queue.start()
     yield
     logger.info("Shutting down Joey's AI Agent")
+    await event_queue.stop()
+    await task_queue.stop()
+    await stage2_queue.stop()
+    await audit_log.stop()
+    await outbound_queue.stop()
+    # 暫存中的 push 會寫入 outbound_queue，下次啟動時送出
+    await line_service.close()
+    await claude_service.close()
 
 
 app = FastAPI(
@@ -0,0 +1,37 @@
+from pathlib import Path
+from typing import Iterator, Optional
+
+from pydantic import BaseModel, Field
+
+from src.constants import ATTACHMENT_READ_CHUNK_CHARS
+
+
+class Attachment(BaseModel):
+    """Attachment spooled to disk as decoded UTF-8 text."""
+    file_name: str = Field(..., description="Original file name from LINE")
+    path: str = Field(..., description="Path of the spooled UTF-8 text file")
+    size_bytes: int = Field(..., description="Downloaded size in bytes")
+
+    def iter_text(self, chunk_chars: int = ATTACHMENT_READ_CHUNK_CHARS) -> Iterator[str]:
+        """Yield the text in chunks without loading the whole file."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            while True:
+                chunk = f.read(chunk_chars)
+                if not chunk:
+                    break
+                yield chunk
+
+    def read_text(self, max_chars: Optional[int] = None) -> str:
+        """Read the text, or only its first max_chars characters."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            return f.read(-1 if max_chars is None else max_chars)
+
+    def size_label(self) -> str:
+        """Human-readable file size."""
+        if self.size_bytes >= 1024 * 1024:
+            return f"{self.size_bytes / (1024 * 1024):.1f} MB"
+        return f"{self.size_bytes / 1024:.1f} KB"
+
+    def delete(self) -> None:
+        """Remove the spooled file."""
+        Path(self.path).unlink(missing_ok=True)
@@ -1,5 +1,5 @@
 from typing import Optional, Literal
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class MemoryUpdate(BaseModel):
@@ -46,3 +46,17 @@ class ClaudeResponse(BaseModel):
 
     # Message to send to Joey via LINE
     line_message: str = Field(..., description="Message to send via LINE")
+
+    # Self-reported confidence (requested from the fast routing model only)
+    confidence: Optional[float] = Field(None, description="Confidence in the classification and answer (0-1)")
+
+    # Whether the same answer stays correct if asked again soon (no dates, live data or variety wanted)
+    cacheable: bool = Field(False, description="Safe to serve from the response cache")
+
+    # Set when the model output was not valid JSON and this is the fallback response
+    _is_fallback: bool = PrivateAttr(default=False)
+
+    @property
+    def is_fallback(self) -> bool:
+        """True when built from unparseable output instead of the model's JSON."""
+        return self._is_fallback
@@ -0,0 +1,37 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(slots=True)
+class LineEvent:
+    """Typed view of a LINE webhook event (only the fields the agent uses)."""
+    type: str
+    webhook_event_id: Optional[str]
+    is_redelivery: bool
+    reply_token: Optional[str]
+    user_id: Optional[str]
+    message_type: Optional[str]
+    message_id: Optional[str]
+    text: str
+    file_name: str
+    file_size: int
+    # Original event dict, kept for queueing and forward compatibility
+    raw: dict
+
+    @classmethod
+    def from_dict(cls, event: dict) -> "LineEvent":
+        """Build from a decoded webhook event."""
+        message = event.get("message") or {}
+        return cls(
+            type=event.get("type", ""),
+            webhook_event_id=event.get("webhookEventId"),
+            is_redelivery=bool((event.get("deliveryContext") or {}).get("isRedelivery")),
+            reply_token=event.get("replyToken"),
+            user_id=(event.get("source") or {}).get("userId"),
+            message_type=message.get("type"),
+            message_id=message.get("id"),
+            text=message.get("text", ""),
+            file_name=message.get("fileName", "unknown"),
+            file_size=message.get("fileSize", 0),
+            raw=event,
+        )
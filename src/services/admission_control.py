@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from src.config import settings
+from src.services.metrics import metrics
+from src.services.task_queue import task_queue
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class AdmissionDecision:
+    """Result of an admission check."""
+    admitted: bool
+    # "rate_limited" or "queue_full" when rejected
+    reason: Optional[str] = None
+    retry_after_seconds: float = 0
+    # Pending tasks ahead of this one (0 means a worker is free)
+    queue_position: int = 0
+
+
+class TokenBucket:
+    """每位使用者的 token bucket：容量為可連續送出的訊息數，依固定速率補充"""
+
+    __slots__ = ("capacity", "refill_per_second", "tokens", "updated_at")
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def try_consume(self) -> float:
+        """嘗試取用一個 token，成功回傳 0，否則回傳需等待的秒數"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.refill_per_second <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.refill_per_second
+
+    async def acquire(self) -> None:
+        """等待直到取得一個 token（用於限制對外請求速率）"""
+        while True:
+            wait = self.try_consume()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class AdmissionController:
+    """
+    任務建立前的准入控制
+
+    - 全域：任務佇列中等待的任務數達 line_max_pending_tasks 時拒絕新任務
+    - 每位使用者：token bucket 限制訊息頻率
+    被拒絕的訊息不會建立任務，由呼叫端以免費的 reply token 告知使用者。
+    """
+
+    def __init__(self):
+        self.burst = settings.line_user_burst
+        self.refill_per_second = settings.line_user_rate_per_minute / 60
+        self.max_pending = settings.line_max_pending_tasks
+        self._buckets: dict[str, TokenBucket] = {}
+
+    def _bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, self.refill_per_second)
+            self._buckets[user_id] = bucket
+        return bucket
+
+    async def admit(self, user_id: str) -> AdmissionDecision:
+        """檢查是否接受此使用者的新任務"""
+        # 只計算可執行的任務：等待 batch 結果或延後重試的任務不佔用 worker，也不影響排隊順位
+        backlog = await task_queue.backlog()
+        pending = backlog["pending"]
+        running = backlog["running"]
+
+        if pending >= self.max_pending:
+            metrics.incr("admission_rejected_queue_full")
+            logger.warning(f"任務佇列已滿（等待中 {pending} 件），拒絕 {user_id[:8]}... 的任務")
+            return AdmissionDecision(False, reason="queue_full", queue_position=pending)
+
+        retry_after = self._bucket(user_id).try_consume()
+        if retry_after > 0:
+            metrics.incr("admission_rejected_rate_limited")
+            logger.warning(f"使用者 {user_id[:8]}... 訊息過於頻繁，需等待 {retry_after:.0f} 秒")
+            return AdmissionDecision(False, reason="rate_limited", retry_after_seconds=retry_after)
+
+        metrics.incr("admission_admitted")
+        position = pending + 1 if running >= task_queue.worker_count else 0
+        return AdmissionDecision(True, queue_position=position)
+
+
+admission_control = AdmissionController()
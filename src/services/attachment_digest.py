@@ -0,0 +1,145 @@
+"""
+大型附件的 map-reduce 摘要（Stage 1 之前）
+
+附件估計超過 attachment_digest_threshold_tokens 時，依段落切成約
+ATTACHMENT_DIGEST_CHUNK_TOKENS 的段落，以 attachment_digest_concurrency 為上限並行摘要（map），
+再依原順序合併為精簡的摘要（reduce）交給 Stage 1。
+耗時約為 段數 / 並行數 次摘要呼叫，而不是與附件總長度成正比；段數超過
+attachment_digest_max_chunks 時先保留頭尾、截掉中段再切分。
+Stage 1 只看到摘要，原文由呼叫端保留，並在複雜任務時以檔案交給 Claude Code。
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from src.config import settings
+from src.constants import ATTACHMENT_DIGEST_CHUNK_TOKENS, ATTACHMENT_DIGEST_MAX_TOKENS
+from src.services.claude_service import claude_service
+from src.services.metrics import metrics
+from src.services.token_budget import estimate_tokens, truncate_middle
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class AttachmentDigest:
+    """Stage 1 使用的內容與原文"""
+    content: str
+    original: str
+    chunks: int = 0
+    omitted_tokens: int = 0
+
+
+def split_chunks(text: str, chunk_tokens: int = ATTACHMENT_DIGEST_CHUNK_TOKENS) -> list[str]:
+    """依段落切分，每段估計不超過 chunk_tokens（過長的段落依字元切分）"""
+    chunks: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+    for paragraph in text.split("\n\n"):
+        for piece in _split_long(paragraph, chunk_tokens):
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > chunk_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _split_long(paragraph: str, chunk_tokens: int) -> list[str]:
+    tokens = estimate_tokens(paragraph)
+    if tokens <= chunk_tokens:
+        return [paragraph]
+    size = max(1, len(paragraph) * chunk_tokens // tokens)
+    return [paragraph[i:i + size] for i in range(0, len(paragraph), size)]
+
+
+class AttachmentDigester:
+    """並行摘要大型附件"""
+
+    def __init__(self):
+        self.threshold_tokens = settings.attachment_digest_threshold_tokens
+        self.concurrency = settings.attachment_digest_concurrency
+        self.max_chunks = settings.attachment_digest_max_chunks
+
+    def needs_digest(self, page_content: Optional[str]) -> bool:
+        return bool(page_content) and 0 < self.threshold_tokens < estimate_tokens(page_content)
+
+    def prepare_chunks(self, page_content: str) -> tuple[list[str], int]:
+        """切分為摘要段落；超過 max_chunks 段時先截掉中段，回傳 (段落, 略過的估計 tokens)"""
+        max_tokens = self.max_chunks * ATTACHMENT_DIGEST_CHUNK_TOKENS
+        tokens = estimate_tokens(page_content)
+        omitted = 0
+        if tokens > max_tokens:
+            # 先截到段數上限的 token 數，避免切分整份超大附件
+            page_content = truncate_middle(page_content, max_tokens)
+            omitted = tokens - estimate_tokens(page_content)
+        chunks = split_chunks(page_content)
+        if len(chunks) > self.max_chunks:
+            # 段落邊界使實際段數仍可能超過上限：保留頭尾的段落
+            head = (self.max_chunks + 1) // 2
+            tail = self.max_chunks - head
+            omitted += sum(estimate_tokens(chunk) for chunk in chunks[head:len(chunks) - tail])
+            chunks = chunks[:head] + chunks[len(chunks) - tail:]
+        return chunks, omitted
+
+    async def digest(self, page_content: Optional[str]) -> Optional[AttachmentDigest]:
+        """附件過大時回傳摘要，否則回傳 None（直接使用原文）"""
+        # 估計與切分需要掃過整份文字，在 thread 中進行以免阻塞 event loop
+        if not await asyncio.to_thread(self.needs_digest, page_content):
+            return None
+
+        chunks, omitted = await asyncio.to_thread(self.prepare_chunks, page_content)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        logger.info(
+            f"附件約 {len(page_content)} 字，分 {len(chunks)} 段並行摘要"
+            f"（並行上限 {self.concurrency}）"
+        )
+        if omitted:
+            metrics.incr("attachment_digest_truncated")
+            logger.warning(f"附件超過 {self.max_chunks} 段，中段約 {omitted} tokens 未摘要")
+
+        async def summarize(index: int, chunk: str) -> str:
+            async with semaphore:
+                try:
+                    return await claude_service.summarize_chunk(chunk, index, len(chunks))
+                except Exception as e:
+                    # 單段失敗不影響其他段：改用截斷後的原文
+                    metrics.incr("attachment_digest_chunk_failures")
+                    logger.warning(f"附件第 {index} 段摘要失敗，改用截斷的原文: {e}")
+                    return truncate_middle(chunk, ATTACHMENT_DIGEST_MAX_TOKENS)
+
+        summaries = await asyncio.gather(
+            *(summarize(index, chunk) for index, chunk in enumerate(chunks, start=1))
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.histogram("attachment_digest_ms").observe(elapsed_ms)
+        metrics.incr("attachment_digest_chunks", len(chunks))
+
+        sections = "\n\n".join(
+            f"### 第 {index}/{len(chunks)} 段摘要\n\n{summary}"
+            for index, summary in enumerate(summaries, start=1)
+        )
+        truncated_note = (
+            f"附件過長，中段約 {omitted} tokens 未摘要（摘要只涵蓋開頭與結尾）。" if omitted else ""
+        )
+        content = (
+            f"（附件原文約 {len(page_content)} 字，以下為分段摘要。{truncated_note}"
+            "原文會以檔案交給 Claude Code（任務資料夾的 attachments/ 目錄），prompt 中不需要重複原文。）\n\n"
+            f"{sections}"
+        )
+        logger.info(
+            f"附件摘要完成（{elapsed_ms:.0f} ms）: {len(page_content)} 字 → {len(content)} 字"
+        )
+        return AttachmentDigest(
+            content=content, original=page_content, chunks=len(chunks), omitted_tokens=omitted
+        )
+
+
+attachment_digest = AttachmentDigester()
@@ -0,0 +1,95 @@
+import asyncio
+import codecs
+import logging
+import shutil
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from src.config import settings
+from src.constants import ATTACHMENTS_DIRNAME, ATTACHMENTS_STAGE2_DIRNAME, STAGE2_MESSAGE_FILENAME
+from src.models.attachment import Attachment
+
+logger = logging.getLogger(__name__)
+
+
+class AttachmentTooLargeError(Exception):
+    """附件超過大小上限"""
+
+
+class AttachmentStore:
+    """
+    附件暫存區
+
+    以串流方式把下載的內容逐塊解碼（UTF-8，無效位元組以替代字元取代）並寫入磁碟，
+    記憶體中只保留一個 chunk。檔案存放在 data 目錄下，任務完成後由呼叫端刪除，
+    因此服務重啟後仍在佇列中的任務可以繼續使用。
+    """
+
+    def __init__(self):
+        self.root = settings.data_path / ATTACHMENTS_DIRNAME
+
+    async def save_stream(
+        self,
+        file_name: str,
+        chunks: AsyncIterator[bytes],
+        max_bytes: int
+    ) -> Attachment:
+        """將位元組串流解碼後寫入暫存檔，超過 max_bytes 時中止並刪除"""
+        await asyncio.to_thread(self.root.mkdir, parents=True, exist_ok=True)
+        path = self.root / f"{uuid.uuid4().hex}.txt"
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        size = 0
+
+        f = await asyncio.to_thread(open, path, "w", encoding="utf-8")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise AttachmentTooLargeError(f"{file_name} exceeds {max_bytes} bytes")
+                await asyncio.to_thread(f.write, decoder.decode(chunk))
+            await asyncio.to_thread(f.write, decoder.decode(b"", final=True))
+        except BaseException:
+            await asyncio.to_thread(f.close)
+            path.unlink(missing_ok=True)
+            raise
+        await asyncio.to_thread(f.close)
+
+        logger.info(f"附件已暫存: {file_name} ({size} bytes) -> {path.name}")
+        return Attachment(file_name=file_name, path=str(path), size_bytes=size)
+
+    async def delete(self, attachments: list[Attachment]) -> None:
+        """刪除任務使用完畢的附件"""
+        for attachment in attachments:
+            try:
+                await asyncio.to_thread(attachment.delete)
+            except Exception as e:
+                logger.warning(f"刪除附件失敗 {attachment.path}: {e}")
+
+    async def keep_for_stage2(self, page_content: Optional[str], attachments: Optional[list[Attachment]]) -> str:
+        """將原文複製到 Stage 2 目錄（附件暫存檔在 Stage 1 後即刪除），回傳目錄路徑"""
+        return await asyncio.to_thread(self._sync_keep_for_stage2, page_content, attachments)
+
+    def _sync_keep_for_stage2(self, page_content: Optional[str], attachments: Optional[list[Attachment]]) -> str:
+        directory = self.root / ATTACHMENTS_STAGE2_DIRNAME / uuid.uuid4().hex
+        directory.mkdir(parents=True)
+        if page_content:
+            (directory / STAGE2_MESSAGE_FILENAME).write_text(page_content, encoding="utf-8")
+        for index, attachment in enumerate(attachments or [], start=1):
+            # 只取檔名部分，並加上序號避免同名附件互相覆蓋
+            name = Path(attachment.file_name).name or "attachment.txt"
+            shutil.copyfile(attachment.path, directory / f"{index:02d}_{name}")
+        logger.info(f"附件原文已保留給 Stage 2: {directory.name}")
+        return str(directory)
+
+    async def delete_stage2(self, directory: Optional[str]) -> None:
+        """刪除 Stage 2 使用完畢的原文目錄"""
+        if not directory:
+            return
+        try:
+            await asyncio.to_thread(shutil.rmtree, directory, ignore_errors=True)
+        except Exception as e:
+            logger.warning(f"刪除 Stage 2 附件失敗 {directory}: {e}")
+
+
+attachment_store = AttachmentStore()
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+from datetime import date, datetime
+from typing import Optional
+
+from src.config import settings
+from src.constants import (
+    AUDIT_LOG_FILENAME,
+    AUDIT_LOG_QUEUE_SIZE,
+    AUDIT_LOG_BATCH_SIZE,
+    AUDIT_LOG_FLUSH_INTERVAL_SECONDS,
+    AUDIT_LOG_MAX_BYTES,
+    AUDIT_LOG_BACKUP_COUNT,
+)
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLog:
+    """
+    非阻塞的訊息稽核記錄（JSONL）
+
+    呼叫端只把紀錄放進有上限的記憶體佇列，由背景 writer 批次寫入磁碟：
+    - 每批最多 AUDIT_LOG_BATCH_SIZE 筆，或每 AUDIT_LOG_FLUSH_INTERVAL_SECONDS 秒寫入一次
+    - 檔案超過 AUDIT_LOG_MAX_BYTES 或跨日時輪替，保留 AUDIT_LOG_BACKUP_COUNT 個舊檔
+    - 佇列滿時丟棄新紀錄並計數，下一次寫入時回報遺失筆數
+    """
+
+    def __init__(self):
+        self.path = settings.data_path / AUDIT_LOG_FILENAME
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=AUDIT_LOG_QUEUE_SIZE)
+        self._writer: Optional[asyncio.Task] = None
+        self._dropped = 0
+        self._file_day: Optional[date] = None
+
+    # ==================== 公開 API ====================
+
+    def record(self, event_type: str, **fields) -> None:
+        """記錄一筆事件（不等待磁碟 I/O）"""
+        entry = {"ts": datetime.now().isoformat(timespec="milliseconds"), "type": event_type, **fields}
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self._dropped += 1
+            metrics.incr("audit_log_dropped")
+
+    async def start(self) -> None:
+        """啟動背景 writer（於 app lifespan 呼叫）"""
+        self._writer = asyncio.create_task(self._writer_loop())
+        logger.info(f"稽核記錄啟動: {self.path}")
+
+    async def stop(self) -> None:
+        """停止 writer 並寫出佇列中所有剩餘紀錄（逐批寫入直到佇列清空）"""
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        while batch := self._drain():
+            await self._flush(batch)
+        # 只有遺失筆數待回報時也寫出
+        await self._flush([])
+
+    # ==================== Writer ====================
+
+    def _drain(self, first: Optional[dict] = None) -> list[dict]:
+        """從佇列取出目前所有紀錄（最多一批）"""
+        batch = [first] if first is not None else []
+        while len(batch) < AUDIT_LOG_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _writer_loop(self) -> None:
+        while True:
+            first = await self._queue.get()
+            try:
+                # 等待一小段時間讓同一波紀錄一起寫入
+                if self._queue.qsize() < AUDIT_LOG_BATCH_SIZE:
+                    await asyncio.sleep(AUDIT_LOG_FLUSH_INTERVAL_SECONDS)
+            except asyncio.CancelledError:
+                self._queue.put_nowait(first)
+                raise
+            await self._flush(self._drain(first))
+
+    async def _flush(self, batch: list[dict]) -> None:
+        if self._dropped:
+            batch.append({
+                "ts": datetime.now().isoformat(timespec="milliseconds"),
+                "type": "audit_log_overflow",
+                "dropped": self._dropped,
+            })
+            logger.warning(f"稽核記錄佇列已滿，遺失 {self._dropped} 筆紀錄")
+            self._dropped = 0
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self._sync_write, batch)
+        except Exception as e:
+            logger.error(f"寫入稽核記錄失敗（{len(batch)} 筆）: {e}")
+
+    def _sync_write(self, batch: list[dict]) -> None:
+        """同步寫入一批紀錄（內部使用）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._rotate_if_needed()
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        if self._file_day is None:
+            self._file_day = date.today()
+
+    def _rotate_if_needed(self) -> None:
+        """依大小或日期輪替記錄檔"""
+        if not self.path.exists():
+            self._file_day = None
+            return
+
+        stat = self.path.stat()
+        if self._file_day is None:
+            self._file_day = date.fromtimestamp(stat.st_mtime)
+
+        if stat.st_size < AUDIT_LOG_MAX_BYTES and self._file_day == date.today():
+            return
+
+        suffix = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        rotated = self.path.with_name(f"{self.path.stem}-{suffix}{self.path.suffix}")
+        self.path.rename(rotated)
+        self._file_day = None
+        logger.info(f"稽核記錄已輪替: {rotated.name}")
+
+        backups = sorted(self.path.parent.glob(f"{self.path.stem}-*{self.path.suffix}"))
+        for old in backups[:-AUDIT_LOG_BACKUP_COUNT]:
+            old.unlink(missing_ok=True)
+
+
+audit_log = AuditLog()
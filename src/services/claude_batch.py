@@ -0,0 +1,274 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from anthropic import AsyncAnthropic
+from anthropic.types import Message
+
+from src.config import settings
+from src.constants import CLAUDE_BATCH_DB_FILENAME, CLAUDE_BATCH_RETENTION_DAYS
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batch_requests (
+    custom_id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    batch_id TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_batch_requests_status ON batch_requests (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_batch_requests_batch ON batch_requests (batch_id);
+"""
+
+
+class BatchRequestError(Exception):
+    """批次中的單一請求沒有成功（errored / canceled / expired 或批次本身失敗）"""
+
+
+class MessageBatcher:
+    """
+    可延後的 Claude 請求以 Message Batches API 送出
+
+    - submit() 將請求（以呼叫端提供的 custom_id 為 key）寫入 SQLite，達
+      anthropic_batch_max_requests 筆或最早的請求等待 anthropic_batch_window_seconds 後合併成一個 batch 送出
+    - result() 查詢請求的結果：batch 進行中回傳 None，呼叫端稍後再查
+      （同一個 batch 最多每 anthropic_batch_poll_seconds 向 API 查詢一次）；
+      batch 結束後逐筆寫回結果
+    - batch 費用為一般呼叫的一半，且不佔用互動呼叫的並行上限與 rate limit
+
+    請求、batch ID 與結果都存在磁碟上，呼叫端不需要等待（不佔用 worker），
+    重啟後以同一個 custom_id 查詢即可接續。
+    """
+
+    def __init__(self, client_factory: Callable[[], AsyncAnthropic]):
+        self._client_factory = client_factory
+        self.db_path = settings.data_path / CLAUDE_BATCH_DB_FILENAME
+        self.window_seconds = settings.anthropic_batch_window_seconds
+        self.max_requests = settings.anthropic_batch_max_requests
+        self.poll_seconds = settings.anthropic_batch_poll_seconds
+        self._flush_timer: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._checked_at: dict[str, float] = {}
+        self._initialized = False
+
+    # ==================== SQLite 輔助方法 ====================
+
+    @contextmanager
+    def _connect(self):
+        """開啟 SQLite 連線（每次操作獨立連線，供 to_thread 使用）"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _ensure_db(self) -> None:
+        """建立資料表並清除過期的已完成請求"""
+        if self._initialized:
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            cutoff = time.time() - CLAUDE_BATCH_RETENTION_DAYS * 86400
+            conn.execute(
+                "DELETE FROM batch_requests WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                (cutoff,)
+            )
+        self._initialized = True
+
+    def _sync_submit(self, custom_id: str, params: dict) -> bool:
+        """寫入請求，已存在時不覆寫；回傳是否為新請求"""
+        self._ensure_db()
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO batch_requests (custom_id, params, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (custom_id, json.dumps(params, ensure_ascii=False), now, now)
+            )
+        return cursor.rowcount > 0
+
+    def _sync_pending_summary(self) -> tuple[int, Optional[float]]:
+        """尚未送出的請求數與最早的建立時間"""
+        self._ensure_db()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM batch_requests WHERE status = 'pending'"
+            ).fetchone()
+        return row[0], row[1]
+
+    def _sync_take_pending(self) -> list[sqlite3.Row]:
+        self._ensure_db()
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT custom_id, params FROM batch_requests WHERE status = 'pending' "
+                "ORDER BY created_at LIMIT ?",
+                (self.max_requests,)
+            ).fetchall()
+
+    def _sync_mark_submitted(self, custom_ids: list[str], batch_id: str) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE batch_requests SET status = 'submitted', batch_id = ?, updated_at = ? "
+                "WHERE custom_id = ? AND status = 'pending'",
+                [(batch_id, time.time(), custom_id) for custom_id in custom_ids]
+            )
+
+    def _sync_mark_failed(self, custom_ids: list[str], error: str) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE batch_requests SET status = 'failed', error = ?, updated_at = ? "
+                "WHERE custom_id = ? AND status IN ('pending', 'submitted')",
+                [(error, time.time(), custom_id) for custom_id in custom_ids]
+            )
+
+    def _sync_store_results(self, batch_id: str, results: list[tuple[str, str, Optional[str], Optional[str]]]) -> None:
+        """寫回 batch 的結果 (custom_id, status, result, error)，沒有結果的請求標記為失敗"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE batch_requests SET status = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE custom_id = ? AND batch_id = ? AND status = 'submitted'",
+                [(status, result, error, now, custom_id, batch_id) for custom_id, status, result, error in results]
+            )
+            conn.execute(
+                "UPDATE batch_requests SET status = 'failed', error = ?, updated_at = ? "
+                "WHERE batch_id = ? AND status = 'submitted'",
+                (f"batch {batch_id} 沒有回傳此請求的結果", now, batch_id)
+            )
+            conn.execute("COMMIT")
+
+    def _sync_get(self, custom_id: str) -> Optional[sqlite3.Row]:
+        self._ensure_db()
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT batch_id, status, result, error, created_at FROM batch_requests WHERE custom_id = ?",
+                (custom_id,)
+            ).fetchone()
+
+    # ==================== 公開方法 ====================
+
+    async def submit(self, custom_id: str, params: dict) -> None:
+        """加入下一個 batch（同一個 custom_id 只會送出一次）"""
+        if await asyncio.to_thread(self._sync_submit, custom_id, params):
+            metrics.incr("claude_batch_requests")
+        await self._flush_if_due()
+
+    async def submitted(self, custom_id: str) -> bool:
+        """請求是否已寫入（submit 過，不論是否已送出或完成）"""
+        return await asyncio.to_thread(self._sync_get, custom_id) is not None
+
+    async def result(self, custom_id: str) -> Optional[Message]:
+        """回傳請求的 Message；尚未完成時回傳 None，請求失敗時拋出 BatchRequestError"""
+        row = await asyncio.to_thread(self._sync_get, custom_id)
+        if row is None:
+            raise BatchRequestError(f"batch 請求 {custom_id} 不存在")
+        if row["status"] == "pending":
+            await self._flush_if_due()
+            return None
+        if row["status"] == "submitted":
+            await self._refresh(row["batch_id"])
+            row = await asyncio.to_thread(self._sync_get, custom_id)
+        if row["status"] == "succeeded":
+            metrics.histogram("claude_batch_ms").observe((time.time() - row["created_at"]) * 1000)
+            return Message.model_validate_json(row["result"])
+        if row["status"] == "failed":
+            raise BatchRequestError(row["error"] or f"batch 請求 {custom_id} 未成功")
+        return None
+
+    async def _flush_if_due(self) -> None:
+        """請求數達上限或最早的請求已等待 window_seconds 時送出，否則排定送出時間"""
+        count, oldest = await asyncio.to_thread(self._sync_pending_summary)
+        if not count:
+            return
+        wait = oldest + self.window_seconds - time.time()
+        if count >= self.max_requests or wait <= 0:
+            await self.flush()
+        elif self._flush_timer is None:
+            # 程序重啟後計時器消失：下一次 result() 查詢時會補送
+            self._flush_timer = asyncio.create_task(self._flush_later(wait))
+
+    async def _flush_later(self, wait: float) -> None:
+        await asyncio.sleep(wait)
+        self._flush_timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """立即將尚未送出的請求合併為 batch 送出"""
+        if self._flush_timer is not None and self._flush_timer is not asyncio.current_task():
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            while rows := await asyncio.to_thread(self._sync_take_pending):
+                custom_ids = [row["custom_id"] for row in rows]
+                try:
+                    created = await self._client_factory().messages.batches.create(
+                        requests=[
+                            {"custom_id": row["custom_id"], "params": json.loads(row["params"])}
+                            for row in rows
+                        ]
+                    )
+                except Exception as e:
+                    logger.error(f"建立 message batch 失敗（{len(rows)} 筆）: {e}", exc_info=True)
+                    await asyncio.to_thread(self._sync_mark_failed, custom_ids, f"建立 batch 失敗: {e}"[:500])
+                    continue
+
+                await asyncio.to_thread(self._sync_mark_submitted, custom_ids, created.id)
+                metrics.incr("claude_batches_submitted")
+                logger.info(f"已送出 message batch {created.id}（{len(rows)} 筆）")
+
+    async def _refresh(self, batch_id: str) -> None:
+        """查詢 batch 狀態（每個 batch 最多每 poll_seconds 一次），結束後寫回所有結果"""
+        now = time.monotonic()
+        if now - self._checked_at.get(batch_id, float("-inf")) < self.poll_seconds:
+            return
+        self._checked_at[batch_id] = now
+
+        client = self._client_factory()
+        try:
+            batch = await client.messages.batches.retrieve(batch_id)
+            if batch.processing_status != "ended":
+                return
+
+            results = []
+            async for entry in await client.messages.batches.results(batch_id):
+                result = entry.result
+                if result.type == "succeeded":
+                    results.append((entry.custom_id, "succeeded", result.message.model_dump_json(), None))
+                else:
+                    metrics.incr("claude_batch_failures")
+                    detail = getattr(getattr(result, "error", None), "error", None)
+                    message = getattr(detail, "message", None) or result.type
+                    results.append(
+                        (entry.custom_id, "failed", None, f"batch 請求未成功（{result.type}）: {message}"[:500])
+                    )
+        except Exception as e:
+            # 暫時性錯誤：保留 submitted 狀態，下次查詢時重試
+            logger.warning(f"查詢 message batch {batch_id} 失敗: {e}")
+            return
+
+        await asyncio.to_thread(self._sync_store_results, batch_id, results)
+        self._checked_at.pop(batch_id, None)
+        logger.info(f"message batch {batch_id} 已完成（{len(results)} 筆結果）")
+
+    async def close(self) -> None:
+        """取消排定的送出（尚未送出的請求留在磁碟上，重啟後由下一次查詢送出）"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
@@ -1,11 +1,13 @@
 import asyncio
 import logging
 import os
+import shutil
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
 from src.config import settings
+from src.constants import CLAUDE_CODE_ATTACHMENTS_DIRNAME
 
 logger = logging.getLogger(__name__)
 
@@ -36,11 +38,28 @@ class ClaudeCodeService:
         task_folder.mkdir(parents=True)
         return task_folder
 
+    @staticmethod
+    def _copy_attachments(attachments_dir: str, task_folder: Path) -> str:
+        """Copy the original attachment files into the task folder and describe them for the prompt."""
+        target = task_folder / CLAUDE_CODE_ATTACHMENTS_DIRNAME
+        shutil.copytree(attachments_dir, target)
+        files = "\n".join(
+            f"- {CLAUDE_CODE_ATTACHMENTS_DIRNAME}/{path.name}（{path.stat().st_size} bytes）"
+            for path in sorted(target.iterdir())
+        )
+        # 原文以檔案提供，不放進 -p 參數（避免超過命令列長度上限）
+        return (
+            "\n\n## 附件原文\n\n"
+            "完整原文在任務資料夾的以下檔案（上方只有摘要），需要原文時請直接讀取：\n"
+            f"{files}"
+        )
+
     async def execute_task(
         self,
         prompt: str,
         title: str,
-        on_progress: Optional[callable] = None
+        on_progress: Optional[callable] = None,
+        attachments_dir: Optional[str] = None
     ) -> dict:
         """
         Execute a task using Claude Code CLI.
@@ -49,6 +68,7 @@ class ClaudeCodeService:
             prompt: The structured prompt for Claude Code
             title: Task title for folder naming
             on_progress: Optional callback for progress updates
+            attachments_dir: Optional directory of original attachment files to copy into the task folder
 
         Returns:
             dict with keys: success, output, folder_path, error
@@ -56,6 +76,8 @@ class ClaudeCodeService:
         task_folder = self._create_task_folder(title)
         skills_dir = self.project_dir / "skills"  # skills 絕對路徑，供 prompt 引用
         logger.info(f"Created task folder: {task_folder}")
+        if attachments_dir:
+            prompt += await asyncio.to_thread(self._copy_attachments, attachments_dir, task_folder)
 
         # Add automated execution prefix to prompt
         # 使用 {SKILLS_DIR} 佔位符，稍後替換為實際路徑（避免 f-string 與 CSS 花括號衝突）
@@ -511,12 +533,13 @@ NEXT_ACTION: [下一步要做什麼]
         prompt: str,
         title: str,
         timeout_seconds: int = 3600,
-        on_progress: Optional[callable] = None
+        on_progress: Optional[callable] = None,
+        attachments_dir: Optional[str] = None
     ) -> dict:
         """Execute task with a timeout."""
         try:
             return await asyncio.wait_for(
-                self.execute_task(prompt, title, on_progress),
+                self.execute_task(prompt, title, on_progress, attachments_dir),
                 timeout=timeout_seconds
             )
         except asyncio.TimeoutError:
@@ -534,7 +557,8 @@ NEXT_ACTION: [下一步要做什麼]
         title: str,
         max_retries: int = 10,
         timeout_seconds: int = 21600,  # 6 小時
-        on_progress: Optional[callable] = None
+        on_progress: Optional[callable] = None,
+        attachments_dir: Optional[str] = None
     ) -> dict:
         """
         Execute task with automatic retry on failure (Ralph Wiggum pattern).
@@ -547,6 +571,7 @@ NEXT_ACTION: [下一步要做什麼]
             max_retries: Maximum retry attempts (default 10)
             timeout_seconds: Timeout per attempt (default 6 hours = 21600 seconds)
             on_progress: Progress callback
+            attachments_dir: Directory of original attachment files, copied into every attempt's folder
 
         Returns:
             dict with execution result
@@ -576,7 +601,9 @@ NEXT_ACTION: [下一步要做什麼]
 
             try:
                 result = await asyncio.wait_for(
-                    self.execute_task(retry_prompt, f"{title}_attempt{attempt}", on_progress),
+                    self.execute_task(
+                        retry_prompt, f"{title}_attempt{attempt}", on_progress, attachments_dir
+                    ),
                     timeout=timeout_seconds
                 )
 
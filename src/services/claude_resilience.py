@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import anthropic
+
+from src.config import settings
+from src.constants import (
+    CLAUDE_HEDGE_MIN_SAMPLES,
+    CLAUDE_HEDGE_PERCENTILE,
+    CLAUDE_HEDGE_WINDOW_SIZE,
+    CLAUDE_RETRY_BASE_SECONDS,
+    CLAUDE_RETRY_BUDGET_MAX_TOKENS,
+    CLAUDE_RETRY_MAX_SECONDS,
+)
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 斷路器狀態
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Claude API 斷路器開啟中，直接失敗不送出請求"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Claude API 暫時無法使用（連續失敗，約 {retry_after:.0f} 秒後再試）")
+
+
+def classify_error(error: Exception) -> Optional[str]:
+    """
+    將 Claude API 錯誤分類，回傳 None 表示不可重試（請求本身的問題，例如 400 / 401）
+
+    - rate_limited：429
+    - overloaded：529
+    - server：其他 5xx
+    - connection：連線失敗或逾時
+    """
+    if isinstance(error, anthropic.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, anthropic.APIStatusError):
+        if error.status_code == 529:
+            return "overloaded"
+        if error.status_code >= 500:
+            return "server"
+        return None
+    if isinstance(error, anthropic.APIConnectionError):
+        return "connection"
+    return None
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """429 / 529 回應的 retry-after header"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RetryBudget:
+    """
+    全域重試預算：每次呼叫存入 ratio 個 token，每次重試（含 hedge）取出 1 個
+
+    長期而言重試次數不超過呼叫數的 ratio 倍，避免服務異常時重試放大流量。
+    """
+
+    def __init__(self, ratio: float, max_tokens: float = CLAUDE_RETRY_BUDGET_MAX_TOKENS):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """
+    連續 failure_threshold 次可重試的錯誤後開啟，reset_seconds 內的呼叫直接失敗；
+    之後進入 half-open，只放行一個探測請求，成功即關閉、失敗再次開啟。
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float, name: str = "Claude API"):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def check(self) -> None:
+        """請求前呼叫，斷路器開啟時拋出 CircuitOpenError"""
+        if self.state == CIRCUIT_CLOSED:
+            return
+        remaining = self.opened_at + self.reset_seconds - time.monotonic()
+        if self.state == CIRCUIT_OPEN and remaining <= 0:
+            self.state = CIRCUIT_HALF_OPEN
+            logger.info(f"{self.name} 斷路器 half-open，放行一個探測請求")
+        if self.state == CIRCUIT_HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        metrics.incr("claude_circuit_rejections")
+        raise CircuitOpenError(max(remaining, 1))
+
+    def record_success(self) -> None:
+        if self.state != CIRCUIT_CLOSED:
+            logger.info(f"{self.name} 斷路器關閉（探測請求成功）")
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def release(self) -> None:
+        """探測請求沒有結果（例如被取消）時，讓下一個請求重新探測"""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != CIRCUIT_OPEN:
+                metrics.incr("claude_circuit_opened")
+                logger.error(f"{self.name} 斷路器開啟（連續失敗 {self.failures} 次），{self.reset_seconds:.0f} 秒內直接失敗")
+            self.state = CIRCUIT_OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class ClaudeResilience:
+    """
+    Claude API 呼叫的韌性層（取代 SDK 內建的重試）
+
+    - 依錯誤分類重試（429 / 529 / 5xx / 連線錯誤），指數退避加 full jitter，有 retry-after 時依其等待
+    - 重試受全域 RetryBudget 限制，服務異常時不會放大流量
+    - CircuitBreaker 在持續失敗時直接失敗，不讓每個任務各自等到逾時
+    - anthropic_hedge_requests 開啟時，單次請求超過該操作的 p95 延遲即送出第二個請求，取先完成者
+    每次嘗試的次數、延遲與失敗分類記錄於 /metrics（claude_<operation>_attempt_ms 等）。
+
+    每個模型各有一個實例（見 ClaudeService），一個模型故障不會開啟另一個模型的斷路器或耗盡其重試預算。
+    """
+
+    def __init__(self, name: str = "Claude API"):
+        self.max_retries = settings.anthropic_max_retries
+        self.hedging = settings.anthropic_hedge_requests
+        self.budget = RetryBudget(settings.anthropic_retry_budget_ratio)
+        self.breaker = CircuitBreaker(
+            settings.anthropic_circuit_failure_threshold,
+            settings.anthropic_circuit_reset_seconds,
+            name=name,
+        )
+        # 各操作最近成功嘗試的延遲（毫秒），計算 hedge 的時間點
+        self._latencies: dict[str, deque[float]] = {}
+
+    async def call(self, operation: str, attempt: Callable[[], Awaitable[T]], hedge: bool = False) -> T:
+        """執行 attempt()，依錯誤分類重試；hedge=True 且啟用 hedging 時可能同時送出兩個請求"""
+        self.budget.deposit()
+        retries = 0
+        while True:
+            self.breaker.check()
+            try:
+                if hedge and self.hedging:
+                    result = await self._hedged(operation, attempt)
+                else:
+                    result = await self._attempt(operation, attempt)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                kind = classify_error(e)
+                if kind is None:
+                    if isinstance(e, anthropic.APIStatusError):
+                        # API 有回應（例如 400），服務本身正常
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                if retries >= self.max_retries or self.breaker.state == CIRCUIT_OPEN:
+                    raise
+                if not self.budget.withdraw():
+                    metrics.incr("claude_retry_budget_exhausted")
+                    logger.warning(f"Claude API 重試預算用盡，不再重試: {e}")
+                    raise
+                delay = _retry_after_seconds(e)
+                if delay is None:
+                    delay = random.uniform(0, min(CLAUDE_RETRY_MAX_SECONDS, CLAUDE_RETRY_BASE_SECONDS * 2 ** retries))
+                retries += 1
+                metrics.incr("claude_retries")
+                logger.warning(f"Claude API {operation} 失敗（{kind}），{delay:.1f} 秒後第 {retries} 次重試: {e}")
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _attempt(self, operation: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        """單次嘗試，記錄次數、延遲與失敗分類"""
+        metrics.incr(f"claude_{operation}_attempts")
+        started = time.perf_counter()
+        try:
+            result = await attempt()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.incr(f"claude_{operation}_attempt_failures_{classify_error(e) or 'client'}")
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.histogram(f"claude_{operation}_attempt_ms").observe(elapsed_ms)
+        window = self._latencies.get(operation)
+        if window is None:
+            window = self._latencies[operation] = deque(maxlen=CLAUDE_HEDGE_WINDOW_SIZE)
+        window.append(elapsed_ms)
+        return result
+
+    def _hedge_delay(self, operation: str) -> Optional[float]:
+        """
+        該操作最近成功嘗試的 p95 延遲（秒），樣本不足時不 hedge
+
+        以實際樣本計算（nearest-rank），不用 /metrics 直方圖的 bucket 上限，否則 hedge 會晚到下一個 bucket 邊界
+        """
+        window = self._latencies.get(operation)
+        if window is None or len(window) < CLAUDE_HEDGE_MIN_SAMPLES:
+            return None
+        samples = sorted(window)
+        rank = math.ceil(CLAUDE_HEDGE_PERCENTILE / 100 * len(samples))
+        return samples[rank - 1] / 1000
+
+    async def _hedged(self, operation: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        """超過 p95 仍未完成時送出第二個請求，回傳先成功者並取消另一個"""
+        delay = self._hedge_delay(operation)
+        if delay is None:
+            return await self._attempt(operation, attempt)
+
+        primary = asyncio.create_task(self._attempt(operation, attempt))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            if not self.budget.withdraw():
+                metrics.incr("claude_retry_budget_exhausted")
+                return await primary
+
+            metrics.incr(f"claude_{operation}_hedges")
+            logger.info(f"Claude API {operation} 超過 p95（{delay:.1f} 秒），送出 hedge 請求")
+            hedge = asyncio.create_task(self._attempt(operation, attempt))
+            tasks.add(hedge)
+            first_error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.incr(f"claude_{operation}_hedge_wins")
+                        return task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def snapshot(self) -> dict:
+        """供 /metrics 使用"""
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "hedging": self.hedging,
+        }
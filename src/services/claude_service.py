@@ -1,22 +1,114 @@
 import asyncio
+import hashlib
 import json
 import logging
+import time
 from pathlib import Path
-from anthropic import Anthropic
+from typing import Callable, Optional
+
+import httpx
+import anthropic
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
 
 from src.config import settings
-from src.constants import CLAUDE_MAX_TOKENS
+from src.constants import (
+    ATTACHMENT_DIGEST_MAX_TOKENS,
+    CLAUDE_MAX_TOKENS,
+    CLAUDE_CONNECT_TIMEOUT_SECONDS,
+    CLAUDE_HTTP_KEEPALIVE_SECONDS,
+)
 from src.models.claude_response import ClaudeResponse
+from src.services.claude_batch import MessageBatcher
+from src.services.claude_resilience import CircuitOpenError, ClaudeResilience
+from src.services.json_stream import TopLevelFieldScanner
+from src.services.metrics import metrics
+from src.services.notion_service import NotionService
+from src.services.task_queue import RetryJob
+from src.services.token_budget import token_budget
 
 logger = logging.getLogger(__name__)
 
+# on_classified(difficulty, title)：Stage 1 串流中一得知難度與標題就呼叫
+ClassifiedCallback = Callable[[str, str], None]
+
+# 模型路由：附加在小模型請求的最後，要求回報 confidence
+FAST_ROUTE_INSTRUCTION = (
+    "另外請在 JSON 中加上 \"confidence\" 欄位（0 到 1 的數字），"
+    "表示你對難度判斷與回答正確性的把握；需要深入推理、最新資訊或你不確定時請給較低的值。"
+)
+
 
 class ClaudeService:
-    """Claude API 服務"""
+    """Claude API 服務
+
+    使用 AsyncAnthropic（不佔用 to_thread 的執行緒池），連線池於 app lifespan 中
+    start() / close()；同時進行中的呼叫數以 anthropic_max_concurrency 為上限。
+
+    Prompt caching：system prompt 與記憶區塊是每次呼叫幾乎不變的前綴，各自標記
+    cache_control 斷點（記憶放在 user message 的第一個 content block）。快取以內容比對，
+    記憶變動時該斷點之後自動重新寫入快取，system prompt 的快取不受影響。
+    """
     def __init__(self):
-        self.client = Anthropic(api_key=settings.anthropic_api_key)
         self.model = settings.anthropic_model
+        self.max_concurrency = settings.anthropic_max_concurrency
+        self._client: Optional[AsyncAnthropic] = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
         self._system_prompt = None
+        self.prompt_cache = settings.anthropic_prompt_cache
+        self.stream_stage1 = settings.anthropic_stream_stage1
+        self.fast_model = settings.anthropic_fast_model
+        self.fast_min_confidence = settings.anthropic_fast_min_confidence
+        self._memories_digest: Optional[str] = None
+        # 每個模型各自的斷路器與重試預算（小模型故障時仍可改由大模型處理）
+        self.resilience: dict[str, ClaudeResilience] = {
+            model: ClaudeResilience(name=model) for model in (self.model, self.fast_model) if model
+        }
+        # Batch 請求不經過韌性層，由 SDK 重試；請求與結果存在磁碟上
+        self.batcher = MessageBatcher(
+            lambda: self.client.with_options(max_retries=settings.anthropic_max_retries)
+        )
+
+    # ==================== 連線管理 ====================
+
+    def _build_client(self) -> AsyncAnthropic:
+        """建立長駐的 async client（連線池大小與並行上限一致，hedging 時加倍）
+
+        重試由 ClaudeResilience 處理，SDK 本身不重試。
+        """
+        pool_size = self.max_concurrency * (2 if settings.anthropic_hedge_requests else 1)
+        return AsyncAnthropic(
+            api_key=settings.anthropic_api_key,
+            base_url=settings.anthropic_base_url,
+            timeout=httpx.Timeout(
+                settings.anthropic_timeout_seconds, connect=CLAUDE_CONNECT_TIMEOUT_SECONDS
+            ),
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size,
+                    keepalive_expiry=CLAUDE_HTTP_KEEPALIVE_SECONDS,
+                )
+            ),
+        )
+
+    @property
+    def client(self) -> AsyncAnthropic:
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    async def start(self) -> None:
+        """建立連線池（於 app lifespan 呼叫）"""
+        self.client
+        logger.info(f"Claude client 啟動（模型 {self.model}，並行上限 {self.max_concurrency}）")
+
+    async def close(self) -> None:
+        """關閉連線池（尚未完成的 batch 請求留在磁碟上，重啟後接續）"""
+        await self.batcher.close()
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
 
     @property
     def system_prompt(self) -> str:
@@ -29,13 +121,36 @@ class ClaudeService:
     async def process_task(
         self,
         user_input: str,
-        memories: str,
-        page_content: str = None
+        memories: list[dict],
+        page_content: str = None,
+        on_classified: Optional[ClassifiedCallback] = None,
+        deferred_id: Optional[str] = None
     ) -> ClaudeResponse:
-        """Process a task with Claude and return structured response."""
+        """Process a task with Claude and return structured response.
+
+        memories 與 page_content 先經 token_budget 縮減到 anthropic_input_token_budget 以內，
+        max_tokens 依預期回應類型選擇；回應因 max_tokens 被截斷時以 CLAUDE_MAX_TOKENS 重試一次。
+
+        有 on_classified 時以串流方式呼叫，JSON 的 difficulty 與 title 一出現就呼叫
+        on_classified(difficulty, title)，讓呼叫端提前開始後續工作；
+        完整回應仍在最後統一解析與驗證（結果可能與提前得知的值不同）。
+
+        有 deferred_id 時以此為 custom_id 透過 Message Batches 送出（見 create_deferred），
+        不串流也不呼叫 on_classified；batch 尚未完成時拋出 RetryJob，呼叫端以同一個 deferred_id 重新執行。
+
+        模型路由（anthropic_fast_model）：互動呼叫先由小模型處理，小模型判定為複雜任務、
+        confidence 低於 anthropic_fast_min_confidence、JSON 無效、API 呼叫失敗或小模型的斷路器開啟時，
+        改由 anthropic_model 重新處理（兩個模型的斷路器與重試預算分開）。
+        """
         logger.info(f"呼叫 Claude API，模型: {self.model}")
         logger.debug(f"使用者輸入: {user_input[:100]}...")
 
+        budget = token_budget.plan(
+            self.system_prompt, user_input, memories, page_content, NotionService.format_memories
+        )
+        logger.info(f"Token 預算: {budget.describe()}")
+        page_content = budget.page_content
+
         # Build the page content section if provided
         page_content_section = ""
         if page_content:
@@ -48,14 +163,15 @@ class ClaudeService:
 
 """
 
-        # Build the user message with context
-        user_message = f"""## Joey 的記憶
+        # Build the user message with context（記憶在前，作為可快取的穩定前綴）
+        memories_section = f"""## Joey 的記憶
 
-{memories}
+{budget.memories_text}
 
 ---
 
-{page_content_section}## Joey 的任務
+"""
+        task_section = f"""{page_content_section}## Joey 的任務
 
 {user_input}
 
@@ -63,17 +179,38 @@ class ClaudeService:
 
 請以 JSON 格式回應。如果任務是建立網站，prompt_for_claude_code 必須包含上方「附件內容」的完整文字。"""
 
+        self._track_memories(budget.memories_text)
+
         try:
-            # Call Claude API (使用 to_thread 避免阻塞事件循環)
-            response = await asyncio.to_thread(
-                self.client.messages.create,
-                model=self.model,
-                max_tokens=CLAUDE_MAX_TOKENS,
-                system=self.system_prompt,
-                messages=[
-                    {"role": "user", "content": user_message}
-                ]
-            )
+            request = {
+                "model": self.model,
+                "max_tokens": budget.max_tokens,
+                "system": [self._text_block(self.system_prompt, cache=True)],
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [
+                            self._text_block(memories_section, cache=True),
+                            self._text_block(task_section),
+                        ]
+                    }
+                ],
+            }
+
+            if deferred_id:
+                # 可延後的工作：半價、可能需要數分鐘到數小時；直接使用最大輸出上限，避免再排一次 batch
+                response = await self.create_deferred(deferred_id, **{**request, "max_tokens": CLAUDE_MAX_TOKENS})
+            else:
+                if on_classified is not None:
+                    on_classified = self._once(on_classified)
+                started = time.perf_counter()
+                if self.fast_model:
+                    routed = await self._route_fast(request, on_classified)
+                    if routed is not None:
+                        return routed
+                response = await self._create_interactive(request, on_classified)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                metrics.histogram("claude_route_full_ms").observe(elapsed_ms)
 
             # Extract text content
             content = response.content[0].text
@@ -84,12 +221,222 @@ class ClaudeService:
 
             return parsed
 
+        except RetryJob:
+            # batch 尚未完成，不是失敗
+            raise
         except Exception as e:
             logger.error(f"Claude API 呼叫失敗: {e}", exc_info=True)
             raise
 
-    def _parse_json_response(self, content: str) -> ClaudeResponse:
-        """Parse JSON response from Claude, handling various formats."""
+    @staticmethod
+    def _once(callback: ClassifiedCallback) -> ClassifiedCallback:
+        """重試、hedge 或改由大模型處理時，on_classified 只呼叫一次"""
+        called = False
+
+        def wrapper(difficulty: str, title: str) -> None:
+            nonlocal called
+            if not called:
+                called = True
+                callback(difficulty, title)
+
+        return wrapper
+
+    async def _route_fast(
+        self,
+        request: dict,
+        on_classified: Optional[ClassifiedCallback]
+    ) -> Optional[ClaudeResponse]:
+        """先以小模型處理，可直接採用時回傳結果，需要改由大模型處理時回傳 None"""
+        content = request["messages"][0]["content"]
+        fast_request = {
+            **request,
+            "model": self.fast_model,
+            "messages": [{"role": "user", "content": [*content, self._text_block(FAST_ROUTE_INSTRUCTION)]}],
+        }
+        started = time.perf_counter()
+        reason = None
+        try:
+            response = await self._create_interactive(fast_request, on_classified, operation="stage1_fast")
+            parsed = self._parse_json_response(response.content[0].text, strict=True)
+        except CircuitOpenError as e:
+            reason = "circuit_open"
+            logger.warning(f"小模型斷路器開啟中: {e}")
+        except anthropic.APIError as e:
+            reason = "error"
+            logger.warning(f"小模型呼叫失敗: {e}")
+        except (ValueError, TypeError) as e:
+            # JSON 無效、不是物件或欄位驗證失敗（pydantic ValidationError 為 ValueError）
+            reason = "invalid_json"
+            logger.warning(f"小模型回應的 JSON 無效: {e}")
+        else:
+            if parsed.difficulty == "complex":
+                reason = "complex"
+            elif parsed.confidence is None or parsed.confidence < self.fast_min_confidence:
+                reason = "low_confidence"
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.histogram("claude_route_fast_ms").observe(elapsed_ms)
+        if reason is None:
+            metrics.incr("claude_route_fast")
+            logger.info(f"模型路由：{self.fast_model} 直接處理（{elapsed_ms:.0f} ms，confidence {parsed.confidence}）")
+            return parsed
+        metrics.incr(f"claude_route_escalated_{reason}")
+        logger.info(f"模型路由：改由 {self.model} 處理（原因 {reason}，小模型耗時 {elapsed_ms:.0f} ms）")
+        return None
+
+    async def _create_interactive(
+        self,
+        request: dict,
+        on_classified: Optional[ClassifiedCallback],
+        operation: str = "stage1"
+    ):
+        """互動呼叫（超過並行上限時在此等待），輸出被 max_tokens 截斷時以最大值重試一次
+
+        經過 ClaudeResilience（重試、斷路器、hedging），hedging 的 p95 依 operation 分開計算。
+        """
+        async def attempt():
+            if on_classified is not None and self.stream_stage1:
+                return await self._stream_message(request, on_classified, started)
+            return await self.client.messages.create(**request)
+
+        resilience = self._resilience_for(request["model"])
+        async with self._semaphore:
+            started = time.perf_counter()
+            response = await resilience.call(operation, attempt, hedge=True)
+            self._record_usage(response.usage)
+            if response.stop_reason == "max_tokens" and request["max_tokens"] < CLAUDE_MAX_TOKENS:
+                # 預估的輸出上限不夠，JSON 被截斷：以最大值重試一次
+                metrics.incr("claude_max_tokens_retries")
+                logger.warning(f"回應超過 max_tokens {request['max_tokens']}，以 {CLAUDE_MAX_TOKENS} 重試")
+                response = await resilience.call(
+                    operation,
+                    lambda: self.client.messages.create(**{**request, "max_tokens": CLAUDE_MAX_TOKENS})
+                )
+                self._record_usage(response.usage)
+            metrics.histogram("claude_api_ms").observe((time.perf_counter() - started) * 1000)
+        return response
+
+    def _resilience_for(self, model: str) -> ClaudeResilience:
+        """該模型的韌性層（斷路器與重試預算依模型分開）"""
+        resilience = self.resilience.get(model)
+        if resilience is None:
+            resilience = self.resilience[model] = ClaudeResilience(name=model)
+        return resilience
+
+    def resilience_snapshot(self) -> dict:
+        """各模型的斷路器與重試預算狀態（供 /metrics 使用）"""
+        return {model: resilience.snapshot() for model, resilience in self.resilience.items()}
+
+    async def create_deferred(self, custom_id: str, **params):
+        """
+        以 Message Batches API 送出可延後的請求（記憶整理、進化任務草擬、離峰處理的問題等）
+
+        參數與 messages.create 相同，custom_id 由呼叫端保存（例如 job checkpoint）；
+        請求會先累積再合併送出，不佔用互動呼叫的並行上限。
+        已完成時回傳 Message；尚未完成時拋出 RetryJob（不計入嘗試次數），任務佇列於
+        anthropic_batch_poll_seconds 後重新執行呼叫端，以同一個 custom_id 再次查詢。
+        失敗時拋出 BatchRequestError。
+        """
+        await self.batcher.submit(custom_id, params)
+        return await self._deferred_message(custom_id)
+
+    async def _deferred_message(self, custom_id: str):
+        """查詢已送出的 batch 請求，尚未完成時拋出 RetryJob"""
+        response = await self.batcher.result(custom_id)
+        if response is None:
+            raise RetryJob(
+                f"batch 請求 {custom_id} 尚未完成", retry_after=self.batcher.poll_seconds, count_attempt=False
+            )
+        self._record_usage(response.usage)
+        return response
+
+    async def deferred_result(self, deferred_id: str) -> Optional[ClaudeResponse]:
+        """
+        查詢 process_task(deferred_id=...) 送出的結果，不重新組合請求（不需要記憶與附件）
+
+        請求尚未寫入 batch（例如送出前程序中止）時回傳 None，由呼叫端重新走完整流程；
+        batch 尚未完成時拋出 RetryJob，請求失敗時拋出 BatchRequestError。
+        """
+        if not await self.batcher.submitted(deferred_id):
+            return None
+        response = await self._deferred_message(deferred_id)
+        return self._parse_json_response(response.content[0].text)
+
+    async def _stream_message(self, request: dict, on_classified: ClassifiedCallback, started: float):
+        """串流呼叫，邊接收邊掃描 difficulty / title，回傳完整的 Message"""
+        scanner = TopLevelFieldScanner(("difficulty", "title"))
+        async with self.client.messages.stream(**request) as stream:
+            async for text in stream.text_stream:
+                if scanner.done:
+                    continue
+                found = scanner.feed(text)
+                if scanner.done:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    metrics.histogram("claude_classified_ms").observe(elapsed_ms)
+                    logger.info(
+                        f"Stage 1 提前分類（{elapsed_ms:.0f} ms）: {found['difficulty']} - {found['title']}"
+                    )
+                    try:
+                        on_classified(found["difficulty"], found["title"])
+                    except Exception as e:
+                        logger.warning(f"on_classified 執行失敗: {e}")
+            return await stream.get_final_message()
+
+    async def summarize_chunk(self, text: str, index: int, total: int) -> str:
+        """摘要大型附件的其中一段（attachment_digest 的 map 階段）"""
+        async with self._semaphore:
+            started = time.perf_counter()
+            response = await self._resilience_for(self.model).call("digest", lambda: self.client.messages.create(
+                model=self.model,
+                max_tokens=ATTACHMENT_DIGEST_MAX_TOKENS,
+                messages=[{
+                    "role": "user",
+                    "content": (
+                        f"以下是一份長文件的第 {index}/{total} 段。請用繁體中文整理這一段的重點："
+                        "保留標題結構、關鍵事實、數字、名稱、網址與需求細節，省略重複與修飾性文字。"
+                        "只輸出整理後的內容，不要加開場白。\n\n"
+                        f"{text}"
+                    )
+                }]
+            ), hedge=True)
+            metrics.histogram("claude_digest_ms").observe((time.perf_counter() - started) * 1000)
+        self._record_usage(response.usage)
+        return response.content[0].text.strip()
+
+    def _text_block(self, text: str, cache: bool = False) -> dict:
+        """建立 text content block，cache=True 時標記為 prompt cache 斷點"""
+        block = {"type": "text", "text": text}
+        if cache and self.prompt_cache:
+            block["cache_control"] = {"type": "ephemeral"}
+        return block
+
+    def _track_memories(self, memories: str) -> None:
+        """記錄記憶區塊是否變動（變動後的第一次呼叫會重新寫入快取）"""
+        digest = hashlib.sha256(memories.encode("utf-8")).hexdigest()
+        if self._memories_digest is not None and digest != self._memories_digest:
+            metrics.incr("claude_memories_changed")
+            logger.info("記憶內容已變動，本次呼叫將重新建立記憶區塊的快取")
+        self._memories_digest = digest
+
+    @staticmethod
+    def _record_usage(usage) -> None:
+        """記錄 token 用量（含 prompt cache 讀取與寫入）"""
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_creation = getattr(usage, "cache_creation_input_tokens", None) or 0
+        metrics.incr("claude_input_tokens", usage.input_tokens)
+        metrics.incr("claude_output_tokens", usage.output_tokens)
+        metrics.incr("claude_cache_read_tokens", cache_read)
+        metrics.incr("claude_cache_creation_tokens", cache_creation)
+        logger.info(
+            f"Claude token 用量: input {usage.input_tokens}, cache read {cache_read}, "
+            f"cache write {cache_creation}, output {usage.output_tokens}"
+        )
+
+    def _parse_json_response(self, content: str, strict: bool = False) -> ClaudeResponse:
+        """Parse JSON response from Claude, handling various formats.
+
+        strict=True raises ValueError on invalid JSON instead of returning the fallback response.
+        """
 
         # Try to find JSON in the response
         json_str = content
@@ -111,10 +458,12 @@ class ClaudeService:
             data = json.loads(json_str)
             logger.debug(f"JSON 解析成功，難度: {data.get('difficulty', 'unknown')}")
         except json.JSONDecodeError as e:
+            if strict:
+                raise
             # If parsing fails, create a fallback response
             logger.warning(f"JSON 解析失敗，使用備用回應: {e}")
             logger.debug(f"原始內容: {content[:200]}...")
-            return ClaudeResponse(
+            fallback = ClaudeResponse(
                 difficulty="simple",
                 title="處理結果",
                 simple_result={
@@ -124,6 +473,9 @@ class ClaudeService:
                 memory_updates=[],
                 line_message="處理完成，請查看 Notion Review"
             )
+            # 備用回應不可進入回應快取，否則同樣的輸入會一直拿到這個結果
+            fallback._is_fallback = True
+            return fallback
 
         # Validate and create ClaudeResponse
         return ClaudeResponse(**data)
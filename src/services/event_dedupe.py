@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from src.config import settings
+from src.constants import DEDUPE_DB_FILENAME, DEDUPE_PRUNE_INTERVAL_SECONDS
+from src.models.line_event import LineEvent
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EventDeduplicator:
+    """
+    LINE webhook 事件去重（以 webhookEventId 為 key）
+
+    - 記憶體內為有上限的 LRU + TTL，命中時不需碰磁碟
+    - fast-ack 模式只用 filter() 做記憶體去重，持久化交給 event_queue：
+      事件以 webhookEventId 作為 unique_key 寫入，查重與寫入在同一個交易內完成
+    - 直接處理模式（LINE_FAST_ACK=false）用 reserve()，在單一 SQLite 交易內查重並寫入，
+      重啟後載回；過期紀錄在寫入時每 DEDUPE_PRUNE_INTERVAL_SECONDS 清除一次
+    - 只有 LINE 標記為重送（deliveryContext.isRedelivery）的事件需要查磁碟，首次送達的事件只寫入
+    """
+
+    def __init__(self):
+        self.db_path = settings.data_path / DEDUPE_DB_FILENAME
+        self.ttl_seconds = settings.line_dedupe_ttl_seconds
+        self.max_entries = settings.line_dedupe_max_entries
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self._pruned_at = 0.0
+        self._initialized = False
+
+    # ==================== SQLite 輔助方法 ====================
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _sync_load(self) -> list[tuple[str, float]]:
+        """建立資料表、清除過期紀錄，並回傳最近的事件 ID"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen_events "
+                "(event_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+            conn.execute("DELETE FROM seen_events WHERE seen_at < ?", (now - self.ttl_seconds,))
+            rows = conn.execute(
+                "SELECT event_id, seen_at FROM seen_events ORDER BY seen_at DESC LIMIT ?",
+                (self.max_entries,)
+            ).fetchall()
+        self._pruned_at = now
+        self._initialized = True
+        return list(reversed(rows))
+
+    def _sync_check_and_record(self, event_ids: list[str], redelivered_ids: list[str]) -> set[str]:
+        """單一交易內查詢重送的事件並寫入所有事件 ID，回傳磁碟上已存在（重複）的 ID"""
+        now = time.time()
+        cutoff = now - self.ttl_seconds
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                duplicates = set()
+                if redelivered_ids:
+                    placeholders = ",".join("?" * len(redelivered_ids))
+                    rows = conn.execute(
+                        f"SELECT event_id FROM seen_events WHERE seen_at >= ? AND event_id IN ({placeholders})",
+                        (cutoff, *redelivered_ids)
+                    ).fetchall()
+                    duplicates = {row[0] for row in rows}
+                conn.executemany(
+                    "INSERT OR REPLACE INTO seen_events (event_id, seen_at) VALUES (?, ?)",
+                    [(event_id, now) for event_id in event_ids if event_id not in duplicates]
+                )
+                if now - self._pruned_at >= DEDUPE_PRUNE_INTERVAL_SECONDS:
+                    conn.execute("DELETE FROM seen_events WHERE seen_at < ?", (cutoff,))
+                    self._pruned_at = now
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return duplicates
+
+    # ==================== 記憶體 LRU ====================
+
+    def _is_seen(self, event_id: str, now: float) -> bool:
+        seen_at = self._seen.get(event_id)
+        if seen_at is None:
+            return False
+        if now - seen_at > self.ttl_seconds:
+            del self._seen[event_id]
+            return False
+        self._seen.move_to_end(event_id)
+        return True
+
+    def _remember(self, event_id: str, now: float) -> None:
+        self._seen[event_id] = now
+        self._seen.move_to_end(event_id)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+
+    # ==================== 公開 API ====================
+
+    async def load(self) -> None:
+        """從磁碟載入最近的事件 ID（於 app lifespan 呼叫）"""
+        rows = await asyncio.to_thread(self._sync_load)
+        for event_id, seen_at in rows:
+            self._remember(event_id, seen_at)
+        logger.info(f"事件去重快取載入 {len(rows)} 筆")
+
+    def filter(self, events: list[LineEvent]) -> list[LineEvent]:
+        """
+        以記憶體 LRU 過濾重複事件並佔位，回傳需要處理的事件（不碰磁碟）。
+
+        佔位在同一個事件循環步驟內完成，因此同時抵達的重送也會被擋下；
+        排入佇列失敗時呼叫 release()。
+        """
+        now = time.time()
+        fresh = []
+        for event in events:
+            event_id = event.webhook_event_id
+            if event_id is None:
+                fresh.append(event)
+                continue
+            if self._is_seen(event_id, now):
+                self._drop(event_id)
+                continue
+            self._remember(event_id, now)
+            fresh.append(event)
+        return fresh
+
+    async def reserve(self, events: list[LineEvent]) -> list[LineEvent]:
+        """記憶體去重後，在單一 SQLite 交易內查重並寫入，回傳需要處理的新事件"""
+        if not self._initialized:
+            await self.load()
+
+        candidates = self.filter(events)
+        event_ids = [e.webhook_event_id for e in candidates if e.webhook_event_id is not None]
+        if not event_ids:
+            return candidates
+
+        redelivered_ids = [
+            e.webhook_event_id for e in candidates if e.webhook_event_id is not None and e.is_redelivery
+        ]
+        duplicates = await asyncio.to_thread(self._sync_check_and_record, event_ids, redelivered_ids)
+        fresh = []
+        for event in candidates:
+            if event.webhook_event_id in duplicates:
+                self._drop(event.webhook_event_id)
+            else:
+                fresh.append(event)
+        return fresh
+
+    def release(self, events: list[LineEvent]) -> None:
+        """排入佇列失敗時撤銷記憶體佔位，讓 LINE 重送時可以再次處理"""
+        for event in events:
+            if event.webhook_event_id is not None:
+                self._seen.pop(event.webhook_event_id, None)
+
+    def _drop(self, event_id: str) -> None:
+        metrics.incr("webhook_duplicate_events")
+        logger.info(f"略過重複的 webhook 事件: {event_id}")
+
+
+event_dedupe = EventDeduplicator()
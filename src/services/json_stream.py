@@ -0,0 +1,82 @@
+"""
+串流 JSON 的頂層欄位掃描
+
+Claude 串流回應時逐段餵入文字，第一個 `{` 之前的內容（例如 ```json 圍欄）會被略過，
+頂層物件中指定的字串欄位一完成就可取得，不需等待整個回應。
+只做掃描不做驗證，完整回應仍需以 json.loads 解析與驗證。
+"""
+
+import json
+from typing import Iterable
+
+
+class TopLevelFieldScanner:
+    """逐字元掃描 JSON，擷取頂層物件中指定的字串欄位"""
+
+    def __init__(self, fields: Iterable[str]):
+        self.wanted = set(fields)
+        self.found: dict[str, str] = {}
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._buffer: list[str] = []
+        self._expect_key = False
+        self._key = None
+
+    @property
+    def done(self) -> bool:
+        return self.wanted.issubset(self.found)
+
+    def feed(self, chunk: str) -> dict[str, str]:
+        """餵入一段文字，回傳目前已取得的欄位"""
+        if self.done:
+            return self.found
+        for char in chunk:
+            if self._in_string:
+                self._scan_string_char(char)
+                continue
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._expect_key = True
+                continue
+            if char == '"':
+                self._in_string = True
+                self._buffer = []
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and char == ",":
+                self._expect_key = True
+            elif self._depth == 1 and char == ":":
+                self._expect_key = False
+        return self.found
+
+    def _scan_string_char(self, char: str) -> None:
+        if self._escape:
+            self._buffer.append(char)
+            self._escape = False
+            return
+        if char == "\\":
+            self._buffer.append(char)
+            self._escape = True
+            return
+        if char != '"':
+            self._buffer.append(char)
+            return
+
+        # 字串結束，只處理頂層的 key 與 value
+        self._in_string = False
+        if self._depth != 1:
+            return
+        try:
+            value = json.loads(f'"{"".join(self._buffer)}"')
+        except ValueError:
+            return
+        if self._expect_key:
+            self._key = value
+        elif self._key in self.wanted and self._key not in self.found:
+            self.found[self._key] = value
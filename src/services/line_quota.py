@@ -0,0 +1,94 @@
+import logging
+import time
+from typing import Optional
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 通知政策等級
+QUOTA_LEVEL_NORMAL = "normal"
+QUOTA_LEVEL_REDUCED = "reduced"
+QUOTA_LEVEL_EXHAUSTED = "exhausted"
+
+
+class LineQuotaMeter:
+    """
+    LINE 每月訊息額度計量
+
+    本地累計 push / multicast 送出的訊息數（LINE 以收件者計，reply 不計），
+    並定期以 LINE 的 quota / consumption API 校正。用量達 line_quota_reduced_ratio 時
+    切換為 reduced 政策：只送出最終結果，並拉長 push 合併時間窗。
+    """
+
+    def __init__(self):
+        self.reduced_ratio = settings.line_quota_reduced_ratio
+        # None 表示尚未校正或方案沒有上限
+        self.limit: Optional[int] = None
+        self.server_usage = 0
+        self.local_usage = 0
+        self.reconciled_at: Optional[float] = None
+        self.exhausted = False
+        self._level = QUOTA_LEVEL_NORMAL
+
+    @property
+    def usage(self) -> int:
+        """估計的本月用量（最近一次校正值 + 之後本地送出的訊息數）"""
+        return self.server_usage + self.local_usage
+
+    @property
+    def ratio(self) -> Optional[float]:
+        if not self.limit:
+            return None
+        return self.usage / self.limit
+
+    @property
+    def level(self) -> str:
+        return self._level
+
+    def record(self, messages: int) -> None:
+        """記錄送出的計費訊息數"""
+        self.local_usage += messages
+        self._update_level()
+
+    def mark_exhausted(self) -> None:
+        """LINE 回覆已達每月上限（下次校正時重新判斷）"""
+        self.exhausted = True
+        self._update_level()
+
+    def reconcile(self, limit: Optional[int], total_usage: int) -> None:
+        """以 LINE API 回傳的額度與用量校正本地計數"""
+        self.limit = limit
+        self.server_usage = total_usage
+        self.local_usage = 0
+        self.reconciled_at = time.time()
+        self.exhausted = limit is not None and total_usage >= limit
+        self._update_level()
+
+    def _update_level(self) -> None:
+        ratio = self.ratio
+        if self.exhausted or (ratio is not None and ratio >= 1):
+            level = QUOTA_LEVEL_EXHAUSTED
+        elif ratio is not None and ratio >= self.reduced_ratio:
+            level = QUOTA_LEVEL_REDUCED
+        else:
+            level = QUOTA_LEVEL_NORMAL
+        if level != self._level:
+            logger.warning(f"LINE 額度政策 {self._level} → {level}（用量 {self.usage}/{self.limit}）")
+            self._level = level
+
+    def snapshot(self) -> dict:
+        """供 GET /quota 使用"""
+        return {
+            "level": self._level,
+            "limit": self.limit,
+            "usage": self.usage,
+            "server_usage": self.server_usage,
+            "local_usage_since_reconcile": self.local_usage,
+            "ratio": round(self.ratio, 4) if self.ratio is not None else None,
+            "reduced_ratio": self.reduced_ratio,
+            "reconciled_at": self.reconciled_at,
+        }
+
+
+line_quota = LineQuotaMeter()
@@ -1,107 +1,494 @@
 import asyncio
+import importlib.util
 import logging
+import uuid
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional, Union
+
+import httpx
 
 from linebot.v3 import WebhookHandler
-from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    MessagingApiBlob,
-    ReplyMessageRequest,
-    PushMessageRequest,
-    TextMessage,
-)
-from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.webhooks import MessageEvent, TextMessageContent
 
 from src.config import settings
+from src.constants import (
+    LINE_API_BASE_URL,
+    LINE_DATA_API_BASE_URL,
+    ATTACHMENT_DOWNLOAD_CHUNK_BYTES,
+    LINE_HTTP_KEEPALIVE_SECONDS,
+    LINE_MAX_MESSAGES_PER_REQUEST,
+    LINE_MULTICAST_MAX_RECIPIENTS,
+    LINE_MULTICAST_CONCURRENCY,
+    LINE_REPLY_TOKEN_TTL_SECONDS,
+    LINE_REPLY_TOKEN_SAFETY_MARGIN_SECONDS,
+    LINE_QUOTA_RECONCILE_INTERVAL_SECONDS,
+    LINE_QUOTA_REDUCED_PUSH_WINDOW_SECONDS,
+)
+from src.services.admission_control import TokenBucket
+from src.services.line_quota import line_quota, QUOTA_LEVEL_NORMAL
+from src.services.metrics import metrics
+from src.services.task_queue import outbound_queue, RetryJob
+from src.services.webhook_parser import verify_signature as verify_webhook_signature
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(slots=True)
+class MulticastResult:
+    """Outcome of handing a fan-out to LINE, per recipient.
+
+    Queued recipients are only scheduled: delivery happens later in outbound_queue,
+    and batches that run out of retries show up in GET /dead-letters.
+    """
+    # Recipients durably written to outbound_queue
+    queued: list[str] = field(default_factory=list)
+    # Recipients whose request LINE accepted (direct sends, before start())
+    sent: list[str] = field(default_factory=list)
+    # Recipient -> error for batches that could not be queued, or were rejected when sent directly
+    failed: dict[str, str] = field(default_factory=dict)
+
+
 class LineService:
-    """LINE Messaging API 服務"""
-    def __init__(self):
+    """LINE Messaging API 服務
+
+    所有呼叫共用同一個 httpx.AsyncClient（keep-alive 連線池，有安裝 h2 時使用 HTTP/2），
+    於 app lifespan 中 start() / close()；未啟動時（例如 scripts/ 直接呼叫）會自動建立。
+
+    啟動後 push 立即寫入 outbound_queue，延遲 line_push_coalesce_window_seconds 秒送出，
+    期間同一收件者的 push 依 coalesce_key 合併為一次請求（最多 5 則訊息），以減少計費的
+    push 次數；urgent=True 時立即送出。發送時全 channel 共用速率限制，429 / 5xx 依
+    Retry-After 或指數退避重試，並以 X-Line-Retry-Key 避免重試造成重複訊息。
+    保留中的 reply token（hold_reply_token）可讓快速完成的結果改用免費的 reply 送出。
+
+    送出的計費訊息記錄於 line_quota，並定期以 LINE 額度 API 校正；額度用量偏高時，
+    optional=True 的通知（例如任務建立、管理員通知）不再 push，其餘訊息以較長時間窗合併。
+    """
+    def __init__(
+        self,
+        api_base_url: Optional[str] = None,
+        data_api_base_url: Optional[str] = None
+    ):
         self.handler = WebhookHandler(settings.line_channel_secret)
-        self.configuration = Configuration(
-            access_token=settings.line_channel_access_token
-        )
         self.joey_user_id = settings.joey_line_user_id
+        self.channel_secret = settings.line_channel_secret.encode("utf-8")
+        # settings.line_api_base_url 可指向本地 stub（scripts/line_api_stub.py）
+        self.api_base_url = api_base_url or settings.line_api_base_url or LINE_API_BASE_URL
+        self.data_api_base_url = data_api_base_url or settings.line_api_base_url or LINE_DATA_API_BASE_URL
+        self._client: Optional[httpx.AsyncClient] = None
+        # HTTP/2 需要 h2 套件（httpx[http2]），未安裝時退回 HTTP/1.1 keep-alive
+        self.http2 = settings.line_http2 and importlib.util.find_spec("h2") is not None
+        self.push_window = settings.line_push_coalesce_window_seconds
+        self._push_limiter = TokenBucket(
+            settings.line_outbound_rate_per_second, settings.line_outbound_rate_per_second
+        )
+        # start() 後 push 經由 outbound_queue 發送；scripts/ 未啟動時直接發送
+        self._queue_pushes = False
+        self.reply_hold_seconds = min(
+            settings.line_reply_hold_seconds,
+            LINE_REPLY_TOKEN_TTL_SECONDS - LINE_REPLY_TOKEN_SAFETY_MARGIN_SECONDS
+        )
+        # reply token -> (逾時回覆訊息, 計時 task)
+        self._held_replies: dict[str, tuple[str, asyncio.Task]] = {}
+        self._quota_task: Optional[asyncio.Task] = None
 
-    def verify_signature(self, body: str, signature: str) -> bool:
-        """Verify LINE webhook signature."""
-        try:
-            self.handler.handle(body, signature)
+    # ==================== 連線管理 ====================
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """建立長駐的連線池 client"""
+        return httpx.AsyncClient(
+            http2=self.http2,
+            headers={"Authorization": f"Bearer {settings.line_channel_access_token}"},
+            timeout=httpx.Timeout(settings.line_http_timeout_seconds),
+            limits=httpx.Limits(
+                max_connections=settings.line_http_max_connections,
+                max_keepalive_connections=settings.line_http_max_connections,
+                keepalive_expiry=LINE_HTTP_KEEPALIVE_SECONDS,
+            ),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def start(self) -> None:
+        """建立連線池（於 app lifespan 呼叫）"""
+        self.client
+        self._queue_pushes = True
+        self._quota_task = asyncio.create_task(self._reconcile_quota_loop())
+        logger.info(f"LINE client 啟動（HTTP/2: {self.http2}）")
+
+    async def close(self) -> None:
+        """送出保留中 reply token 的確認訊息，並關閉連線池（未送出的 push 留在 outbound_queue）"""
+        if self._quota_task is not None:
+            self._quota_task.cancel()
+            self._quota_task = None
+        for reply_token in list(self._held_replies):
+            fallback_message, timer = self._held_replies.pop(reply_token)
+            timer.cancel()
+            await self._send_fallback_reply(reply_token, fallback_message)
+        self._queue_pushes = False
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, path: str, payload: dict) -> httpx.Response:
+        """POST 到 Messaging API，非 2xx 時拋出 httpx.HTTPStatusError"""
+        response = await self.client.post(f"{self.api_base_url}{path}", json=payload)
+        response.raise_for_status()
+        return response
+
+    # ==================== 簽名驗證 ====================
+
+    def verify_signature(self, body: bytes, signature: str) -> bool:
+        """Verify LINE webhook signature (constant-time, on raw bytes)."""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if verify_webhook_signature(body, signature, self.channel_secret):
             return True
-        except InvalidSignatureError:
-            logger.warning("LINE 簽名驗證失敗")
-            return False
+        logger.warning("LINE 簽名驗證失敗")
+        return False
 
-    def _sync_reply_message(self, reply_token: str, message: str) -> None:
-        """同步回覆 LINE 訊息（內部使用）"""
-        with ApiClient(self.configuration) as api_client:
-            api = MessagingApi(api_client)
-            api.reply_message(
-                ReplyMessageRequest(
-                    reply_token=reply_token,
-                    messages=[TextMessage(text=message)]
-                )
-            )
+    def get_handler(self) -> WebhookHandler:
+        """Get the webhook handler for registering event handlers."""
+        return self.handler
+
+    # ==================== 訊息發送 ====================
 
-    async def reply_message(self, reply_token: str, message: str) -> None:
-        """Reply to a LINE message."""
+    async def reply_message(self, reply_token: str, message: Union[str, list[str]]) -> None:
+        """Reply to a LINE message（傳入 list 時每個元素為一則訊息，最多 5 則）."""
+        texts = _as_texts(message)
+        if not texts:
+            logger.warning("略過空白的 LINE 回覆訊息")
+            return
         try:
-            await asyncio.to_thread(self._sync_reply_message, reply_token, message)
-            logger.debug(f"LINE 回覆訊息成功: {message[:50]}...")
+            await self._post(
+                "/v2/bot/message/reply",
+                {"replyToken": reply_token, "messages": [{"type": "text", "text": t} for t in texts]}
+            )
+            logger.debug(f"LINE 回覆訊息成功（{len(texts)} 則）: {texts[0][:50]}...")
         except Exception as e:
             logger.error(f"LINE 回覆訊息失敗: {e}")
             raise
 
-    def _sync_push_message(self, user_id: str, message: str) -> None:
-        """同步推送 LINE 訊息（內部使用）"""
-        with ApiClient(self.configuration) as api_client:
-            api = MessagingApi(api_client)
-            api.push_message(
-                PushMessageRequest(
+    async def push_message(
+        self,
+        user_id: str,
+        message: Union[str, list[str]],
+        urgent: bool = False,
+        optional: bool = False
+    ) -> None:
+        """
+        Push a message to a user.
+
+        傳入 list 時（例如 message_packer 打包好的長結果）每個元素為一則訊息，
+        會盡量放在同一個請求中送出。
+
+        訊息立即寫入 outbound_queue（由 worker 負責重試）：非 urgent 的訊息延遲一個時間窗，
+        期間同一收件者的 push 在佇列中合併為一個請求（最多 5 則）；urgent 的訊息連同
+        尚未送出的同收件者 push 立即送出。未啟動（直接發送）時立即發送，失敗會拋出例外。
+        optional 的訊息在額度用量偏高（line_quota.level 非 normal）時直接略過。
+        """
+        texts = _as_texts(message)
+        if not texts:
+            logger.warning(f"略過空白的 LINE 推送訊息至 {user_id[:8]}...")
+            return
+        if optional and line_quota.level != QUOTA_LEVEL_NORMAL:
+            metrics.incr("line_push_skipped_quota")
+            logger.info(f"LINE 額度政策為 {line_quota.level}，略過非必要通知: {texts[0][:50]}...")
+            return
+
+        messages = [{"type": "text", "text": text} for text in texts]
+        if not self._queue_pushes:
+            for start in range(0, len(messages), LINE_MAX_MESSAGES_PER_REQUEST):
+                await self.send_push(
+                    user_id, messages[start:start + LINE_MAX_MESSAGES_PER_REQUEST], str(uuid.uuid4())
+                )
+            return
+
+        window = 0 if urgent else self.push_window
+        if window > 0 and line_quota.level != QUOTA_LEVEL_NORMAL:
+            window = max(window, LINE_QUOTA_REDUCED_PUSH_WINDOW_SECONDS)
+        for start in range(0, len(messages), LINE_MAX_MESSAGES_PER_REQUEST):
+            batch = messages[start:start + LINE_MAX_MESSAGES_PER_REQUEST]
+            try:
+                # 同一則 push 的重試都使用同一個 retry key（合併時沿用既有任務的 key）
+                await outbound_queue.enqueue(
+                    "line_push",
+                    order_key=user_id,
+                    delay=window,
+                    coalesce_key=user_id,
+                    max_delay=window,
                     to=user_id,
-                    messages=[TextMessage(text=message)]
+                    messages=batch,
+                    retry_key=str(uuid.uuid4())
                 )
-            )
+            except Exception as e:
+                logger.error(f"LINE 推送訊息排入佇列失敗至 {user_id[:8]}...（{len(batch)} 則）: {e}")
+                raise
+
+    async def push_to_joey(
+        self,
+        message: Union[str, list[str]],
+        urgent: bool = False,
+        optional: bool = False
+    ) -> None:
+        """Push a message to Joey."""
+        texts = _as_texts(message)
+        if texts:
+            logger.info(f"推送訊息給 Joey: {texts[0][:50]}...")
+        await self.push_message(self.joey_user_id, message, urgent=urgent, optional=optional)
+
+    async def multicast(self, user_ids: list[str], message: str, optional: bool = False) -> MulticastResult:
+        """
+        將同一則訊息送給多位使用者
+
+        收件者去重後每 500 人一個 multicast 請求。啟動後所有請求以單一交易寫入 outbound_queue
+        （同 push 的重試機制），結果只代表已排入佇列；未啟動時直接發送，同時送出的請求數以
+        LINE_MULTICAST_CONCURRENCY 為上限。只有一位收件者時改用 push_message，可與其他 push 合併。
+        optional 的訊息在額度用量偏高時略過（收件者不列入結果）。
+        """
+        recipients = list(dict.fromkeys(user_id for user_id in user_ids if user_id))
+        result = MulticastResult()
+        if not _as_texts(message):
+            logger.warning("略過空白的 LINE multicast 訊息")
+            return result
+        if optional and line_quota.level != QUOTA_LEVEL_NORMAL:
+            metrics.incr("line_push_skipped_quota")
+            logger.info(f"LINE 額度政策為 {line_quota.level}，略過非必要的 multicast: {message[:50]}...")
+            return result
+        delivered = result.queued if self._queue_pushes else result.sent
+        if len(recipients) == 1:
+            try:
+                await self.push_message(recipients[0], message)
+            except Exception as e:
+                result.failed[recipients[0]] = str(e)[:200]
+            else:
+                delivered.append(recipients[0])
+            return result
 
-    async def push_message(self, user_id: str, message: str) -> None:
-        """Push a message to a user."""
+        messages = [{"type": "text", "text": message}]
+        batches = [
+            recipients[start:start + LINE_MULTICAST_MAX_RECIPIENTS]
+            for start in range(0, len(recipients), LINE_MULTICAST_MAX_RECIPIENTS)
+        ]
+
+        if self._queue_pushes:
+            try:
+                await outbound_queue.enqueue_many(
+                    "line_multicast",
+                    [{"to": batch, "messages": messages, "retry_key": str(uuid.uuid4())} for batch in batches]
+                )
+            except Exception as e:
+                logger.error(f"LINE multicast 排入佇列失敗（{len(recipients)} 位收件者）: {e}")
+                result.failed.update({user_id: str(e)[:200] for user_id in recipients})
+            else:
+                result.queued.extend(recipients)
+            return result
+
+        semaphore = asyncio.Semaphore(LINE_MULTICAST_CONCURRENCY)
+
+        async def send_batch(batch: list[str]) -> None:
+            async with semaphore:
+                try:
+                    await self.send_multicast(batch, messages, str(uuid.uuid4()))
+                except Exception as e:
+                    logger.error(f"LINE multicast 失敗（{len(batch)} 位收件者）: {e}")
+                    result.failed.update({user_id: str(e)[:200] for user_id in batch})
+                else:
+                    result.sent.extend(batch)
+
+        await asyncio.gather(*(send_batch(batch) for batch in batches))
+        return result
+
+    async def send_push(self, to: str, messages: list[dict], retry_key: str) -> None:
+        """發送一次 push 請求（outbound_queue 的 handler）"""
+        await self._send_with_retry_key("/v2/bot/message/push", {"to": to, "messages": messages}, retry_key)
+        # LINE 以收件者計算訊息數，一次請求內的多則訊息只算一則
+        line_quota.record(1)
+        metrics.incr("line_push_requests")
+        metrics.incr("line_push_messages", len(messages))
+        logger.debug(f"LINE 推送訊息成功至 {to[:8]}...（{len(messages)} 則）")
+
+    async def send_multicast(self, to: list[str], messages: list[dict], retry_key: str) -> None:
+        """發送一次 multicast 請求（outbound_queue 的 handler）"""
+        await self._send_with_retry_key("/v2/bot/message/multicast", {"to": to, "messages": messages}, retry_key)
+        line_quota.record(len(to))
+        metrics.incr("line_multicast_requests")
+        metrics.incr("line_multicast_recipients", len(to))
+        logger.debug(f"LINE multicast 成功（{len(to)} 位收件者，{len(messages)} 則）")
+
+    async def _send_with_retry_key(self, path: str, payload: dict, retry_key: str) -> None:
+        """
+        發送可重試的請求（push / multicast）
+
+        429 / 5xx / 連線錯誤拋出 RetryJob（有 Retry-After 時依其等待），
+        409 表示相同 retry key 的請求先前已被接受，視為成功；其他 4xx 為永久失敗。
+        """
+        await self._push_limiter.acquire()
         try:
-            await asyncio.to_thread(self._sync_push_message, user_id, message)
-            logger.debug(f"LINE 推送訊息成功至 {user_id[:8]}...: {message[:50]}...")
-        except Exception as e:
-            logger.error(f"LINE 推送訊息失敗至 {user_id[:8]}...: {e}")
-            raise
+            response = await self.client.post(
+                f"{self.api_base_url}{path}",
+                json=payload,
+                headers={"X-Line-Retry-Key": retry_key}
+            )
+        except httpx.TransportError as e:
+            metrics.incr("line_push_retries")
+            raise RetryJob(f"LINE {path} 連線錯誤: {e}") from e
 
-    async def push_to_joey(self, message: str) -> None:
-        """Push a message to Joey."""
-        logger.info(f"推送訊息給 Joey: {message[:50]}...")
-        await self.push_message(self.joey_user_id, message)
+        if response.status_code == 409:
+            logger.info(f"LINE {path} 已送出過（retry key {retry_key[:8]}...），略過")
+            return
+        if response.status_code == 429 and "monthly limit" in response.text:
+            # 每月額度已用完，重試無意義；保留在 dead-letter
+            line_quota.mark_exhausted()
+            response.raise_for_status()
+        if response.status_code == 429 or response.status_code >= 500:
+            metrics.incr("line_push_retries")
+            raise RetryJob(
+                f"LINE {path} HTTP {response.status_code}",
+                retry_after=_parse_retry_after(response.headers.get("Retry-After"))
+            )
+        response.raise_for_status()
 
-    def get_handler(self) -> WebhookHandler:
-        """Get the webhook handler for registering event handlers."""
-        return self.handler
+    # ==================== 額度計量 ====================
+
+    async def fetch_quota(self) -> tuple[Optional[int], int]:
+        """查詢本月訊息額度與用量，回傳 (上限, 用量)；方案沒有上限時上限為 None"""
+        quota, consumption = await asyncio.gather(
+            self.client.get(f"{self.api_base_url}/v2/bot/message/quota"),
+            self.client.get(f"{self.api_base_url}/v2/bot/message/quota/consumption"),
+        )
+        quota.raise_for_status()
+        consumption.raise_for_status()
+        quota_json = quota.json()
+        limit = quota_json.get("value") if quota_json.get("type") == "limited" else None
+        return limit, consumption.json().get("totalUsage", 0)
+
+    async def reconcile_quota(self) -> None:
+        """以 LINE API 校正本地額度計數"""
+        limit, total_usage = await self.fetch_quota()
+        line_quota.reconcile(limit, total_usage)
+        logger.info(f"LINE 額度校正: {total_usage}/{limit if limit is not None else '無上限'}")
+
+    async def _reconcile_quota_loop(self) -> None:
+        """定期校正額度（失敗時沿用本地計數）"""
+        while True:
+            try:
+                await self.reconcile_quota()
+            except Exception as e:
+                logger.warning(f"LINE 額度校正失敗: {e}")
+            await asyncio.sleep(LINE_QUOTA_RECONCILE_INTERVAL_SECONDS)
+
+    # ==================== Reply token 保留 ====================
 
-    def _sync_get_message_content(self, message_id: str) -> bytes:
-        """同步下載 LINE 訊息內容（檔案、圖片等）"""
-        with ApiClient(self.configuration) as api_client:
-            api_blob = MessagingApiBlob(api_client)
-            response = api_blob.get_message_content(message_id)
-            return response
+    def hold_reply_token(self, reply_token: str, fallback_message: str) -> None:
+        """
+        保留 reply token，讓任務結果有機會以 reply 送出。
+
+        reply_hold_seconds 內未被 claim_reply_token 取走時，改以此 token 回覆 fallback_message
+        （例如「處理中」），之後的結果再以 push 送出。
+        """
+        timer = asyncio.create_task(self._release_reply_token_later(reply_token))
+        self._held_replies[reply_token] = (fallback_message, timer)
+
+    def claim_reply_token(self, reply_token: Optional[str]) -> bool:
+        """取走保留中的 reply token，成功時呼叫端須自行使用此 token 回覆"""
+        held = self._held_replies.pop(reply_token, None) if reply_token else None
+        if held is None:
+            return False
+        held[1].cancel()
+        return True
+
+    async def _release_reply_token_later(self, reply_token: str) -> None:
+        """時間窗結束仍未取走時，以 reply token 回覆確認訊息"""
+        await asyncio.sleep(self.reply_hold_seconds)
+        held = self._held_replies.pop(reply_token, None)
+        if held is not None:
+            metrics.incr("line_reply_hold_expired")
+            await self._send_fallback_reply(reply_token, held[0])
+
+    async def _send_fallback_reply(self, reply_token: str, message: str) -> None:
+        try:
+            await self.reply_message(reply_token, message)
+        except Exception:
+            pass  # 已在 reply_message 記錄
+
+    async def reply_or_push_to_joey(
+        self,
+        reply_token: Optional[str],
+        message: Union[str, list[str]],
+        urgent: bool = False,
+        optional: bool = False
+    ) -> None:
+        """reply token 仍保留中時以 reply 送出（免費，不受額度政策影響），否則 push 給 Joey"""
+        if self.claim_reply_token(reply_token):
+            try:
+                await self.reply_message(reply_token, message)
+                metrics.incr("line_reply_hold_used")
+                return
+            except Exception:
+                logger.warning("以保留的 reply token 回覆失敗，改用 push")
+        await self.push_to_joey(message, urgent=urgent, optional=optional)
+
+    # ==================== 訊息內容下載 ====================
 
     async def get_message_content(self, message_id: str) -> bytes:
         """下載 LINE 訊息內容（檔案、圖片等）"""
         try:
-            content = await asyncio.to_thread(self._sync_get_message_content, message_id)
+            response = await self.client.get(
+                f"{self.data_api_base_url}/v2/bot/message/{message_id}/content"
+            )
+            response.raise_for_status()
             logger.debug(f"成功下載訊息內容: {message_id}")
-            return content
+            return response.content
         except Exception as e:
             logger.error(f"下載訊息內容失敗: {e}")
             raise
 
+    async def iter_message_content(
+        self,
+        message_id: str,
+        chunk_size: int = ATTACHMENT_DOWNLOAD_CHUNK_BYTES
+    ) -> AsyncIterator[bytes]:
+        """以串流方式下載 LINE 訊息內容，逐塊回傳（不將整個檔案載入記憶體）"""
+        url = f"{self.data_api_base_url}/v2/bot/message/{message_id}/content"
+        try:
+            async with self.client.stream(
+                "GET", url, timeout=httpx.Timeout(settings.line_http_timeout_seconds, read=60.0)
+            ) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(chunk_size):
+                    yield chunk
+            logger.debug(f"成功串流下載訊息內容: {message_id}")
+        except Exception as e:
+            logger.error(f"串流下載訊息內容失敗: {e}")
+            raise
+
+
+def _as_texts(message: Union[str, list[str]]) -> list[str]:
+    """統一為訊息清單，並去除 LINE 會拒絕的空白訊息"""
+    texts = [message] if isinstance(message, str) else message
+    return [text for text in texts if text and text.strip()]
+
+
+def _merge_push(existing: dict, new: dict) -> Optional[dict]:
+    """合併同一收件者尚未送出的 push（合計超過 5 則時回傳 None，另外排入新任務）"""
+    messages = existing["messages"] + new["messages"]
+    if len(messages) > LINE_MAX_MESSAGES_PER_REQUEST:
+        return None
+    return {**existing, "messages": messages}
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 標頭（秒數），無法解析時回傳 None 改用指數退避"""
+    try:
+        return max(float(value), 0.0) if value else None
+    except ValueError:
+        return None
+
 
 line_service = LineService()
+
+outbound_queue.register("line_push", line_service.send_push, merge=_merge_push)
+outbound_queue.register("line_multicast", line_service.send_multicast)
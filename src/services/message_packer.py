@@ -0,0 +1,162 @@
+"""
+長訊息打包：將結果切成 LINE 文字泡泡
+
+LINE 單則文字訊息上限 5000 字（以 UTF-16 計算，emoji 佔 2），一次請求最多 5 則。
+依段落與 code block 邊界切分（code block 過長時依行切分並補上 ``` 圍欄），
+壓縮多餘空行後依序填滿泡泡；5 則仍放不下時，最後一則以續看連結結尾。
+結果在任務完成時打包一次，之後的重試（outbound_queue）直接使用打包好的訊息。
+"""
+
+import re
+from typing import Optional
+
+from src.constants import LINE_MAX_MESSAGES_PER_REQUEST, LINE_TEXT_MAX_CHARS
+
+_FENCE = re.compile(r"^\s*```")
+
+
+def line_length(text: str) -> int:
+    """LINE 計算的字數（UTF-16 code units）"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def fits(text: str, max_bubbles: int = LINE_MAX_MESSAGES_PER_REQUEST) -> bool:
+    """文字能否完整放進 max_bubbles 則泡泡"""
+    return len(_fill_bubbles(_split_segments(text), LINE_TEXT_MAX_CHARS)) <= max_bubbles
+
+
+def pack_text(
+    text: str,
+    continuation_url: Optional[str] = None,
+    max_bubbles: int = LINE_MAX_MESSAGES_PER_REQUEST,
+    max_chars: int = LINE_TEXT_MAX_CHARS
+) -> list[str]:
+    """
+    將文字打包為最多 max_bubbles 則、每則最多 max_chars 字的訊息
+
+    放不下時截斷最後一則並附上續看提示（有 continuation_url 時附上連結）。
+    空白文字回傳空清單（LINE 不接受空白訊息），呼叫端應略過發送。
+    """
+    bubbles = _fill_bubbles(_split_segments(text), max_chars)
+    if len(bubbles) <= max_bubbles:
+        return bubbles
+
+    pointer = (
+        f"\n\n⋯（內容過長，完整內容：{continuation_url}）"
+        if continuation_url else
+        "\n\n⋯（內容過長，已截斷）"
+    )
+    packed = bubbles[:max_bubbles]
+    packed[-1] = _truncate(packed[-1], max_chars - line_length(pointer)) + pointer
+    return packed
+
+
+def _split_segments(text: str) -> list[str]:
+    """切成段落與 code block（code block 內的空行保留）"""
+    segments: list[str] = []
+    current: list[str] = []
+    in_code = False
+
+    def flush() -> None:
+        if current:
+            segments.append("\n".join(current))
+            current.clear()
+
+    for line in text.replace("\r\n", "\n").split("\n"):
+        line = line.rstrip()
+        if _FENCE.match(line):
+            if in_code:
+                current.append(line)
+                flush()
+            else:
+                flush()
+                current.append(line)
+            in_code = not in_code
+        elif in_code:
+            current.append(line)
+        elif not line:
+            flush()
+        else:
+            current.append(line)
+    flush()
+    return segments
+
+
+def _fill_bubbles(segments: list[str], max_chars: int) -> list[str]:
+    """依序將段落填入泡泡，段落之間以空行分隔"""
+    bubbles: list[str] = []
+    current = ""
+    for segment in segments:
+        for piece in _fit_segment(segment, max_chars):
+            candidate = f"{current}\n\n{piece}" if current else piece
+            if line_length(candidate) <= max_chars:
+                current = candidate
+            else:
+                bubbles.append(current)
+                current = piece
+    if current:
+        bubbles.append(current)
+    return bubbles
+
+
+def _fit_segment(segment: str, max_chars: int) -> list[str]:
+    """過長的段落依行切分；code block 每一塊都補上開頭與結尾的圍欄"""
+    if line_length(segment) <= max_chars:
+        return [segment]
+
+    lines = segment.split("\n")
+    is_code = len(lines) > 1 and _FENCE.match(lines[0]) and _FENCE.match(lines[-1])
+    if is_code:
+        opening, closing = lines[0], lines[-1]
+        body_lines = lines[1:-1]
+        budget = max_chars - line_length(opening) - line_length(closing) - 2
+    else:
+        opening = closing = None
+        body_lines = lines
+        budget = max_chars
+
+    pieces: list[str] = []
+    current: list[str] = []
+    current_length = 0
+    for line in body_lines:
+        for part in _hard_split(line, budget):
+            part_length = line_length(part) + 1
+            if current and current_length + part_length > budget:
+                pieces.append("\n".join(current))
+                current, current_length = [], 0
+            current.append(part)
+            current_length += part_length
+    if current:
+        pieces.append("\n".join(current))
+
+    if is_code:
+        return [f"{opening}\n{piece}\n{closing}" for piece in pieces]
+    return pieces
+
+
+def _hard_split(line: str, max_chars: int) -> list[str]:
+    """單行超過上限時依字元切分（不切開 surrogate pair）"""
+    if line_length(line) <= max_chars:
+        return [line]
+    parts = []
+    start = 0
+    length = 0
+    for i, char in enumerate(line):
+        char_length = 2 if ord(char) > 0xFFFF else 1
+        if length + char_length > max_chars:
+            parts.append(line[start:i])
+            start, length = i, 0
+        length += char_length
+    parts.append(line[start:])
+    return parts
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """截斷到 max_chars 字以內，盡量在換行處截斷"""
+    if line_length(text) <= max_chars:
+        return text
+    cut = _hard_split(text, max_chars)[0]
+    newline = cut.rfind("\n")
+    if newline > len(cut) // 2:
+        cut = cut[:newline]
+    return cut.rstrip()
@@ -0,0 +1,82 @@
+import bisect
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# 延遲直方圖的桶上界（毫秒），最後一個桶收集其餘所有值
+DEFAULT_LATENCY_BUCKETS_MS = (
+    0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000
+)
+
+
+class LatencyHistogram:
+    """固定桶的延遲直方圖（毫秒），百分位數以桶上界估算"""
+
+    def __init__(self, buckets: tuple = DEFAULT_LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        """記錄一筆延遲"""
+        self.counts[bisect.bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, p: float) -> float:
+        """估算第 p 百分位（0-100），回傳所在桶的上界"""
+        if self.count == 0:
+            return 0.0
+        target = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        """輸出統計摘要"""
+        buckets = {f"le_{b}": n for b, n in zip(self.buckets, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": buckets,
+        }
+
+
+class MetricsRegistry:
+    """程序內的簡易指標登錄表（直方圖與計數器），供 /metrics 端點輸出"""
+
+    def __init__(self):
+        self._histograms: dict[str, LatencyHistogram] = {}
+        self._counters: dict[str, int] = defaultdict(int)
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        """取得（或建立）指定名稱的直方圖"""
+        if name not in self._histograms:
+            self._histograms[name] = LatencyHistogram()
+        return self._histograms[name]
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        """累加計數器"""
+        self._counters[name] += amount
+
+    def snapshot(self) -> dict:
+        """輸出所有指標"""
+        return {
+            "histograms": {name: h.snapshot() for name, h in self._histograms.items()},
+            "counters": dict(self._counters),
+        }
+
+
+metrics = MetricsRegistry()
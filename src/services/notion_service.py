@@ -2,11 +2,17 @@ import asyncio
 import logging
 from datetime import datetime
 from functools import partial
-from typing import Any, Callable, Optional
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, Optional
 from notion_client import Client
 
 from src.config import settings
-from src.constants import NOTION_MAX_TEXT_LENGTH
+from src.constants import (
+    ATTACHMENT_NOTION_PREVIEW_CHARS,
+    NOTION_MAX_BLOCKS_PER_REQUEST,
+    NOTION_MAX_TEXT_LENGTH,
+)
+from src.models.attachment import Attachment
 
 logger = logging.getLogger(__name__)
 
@@ -100,30 +106,78 @@ class NotionService:
 
     # ==================== Inbox CRUD ====================
 
-    def _build_text_blocks(self, content: str) -> list:
-        """將長文字內容轉換為 Notion blocks（每個 block 最多 2000 字符）"""
-        blocks = []
+    @staticmethod
+    def _iter_text_blocks(chunks: Iterable[str]) -> Iterator[dict]:
+        """將文字串流逐段轉換為 Notion blocks，不需先組成完整字串"""
         # 每個 block 最多 2000 字符，留一些餘量
         chunk_size = 1900
+        buffer = ""
 
-        for i in range(0, len(content), chunk_size):
-            chunk = content[i:i + chunk_size]
-            blocks.append({
+        def paragraph(text: str) -> dict:
+            return {
                 "object": "block",
                 "type": "paragraph",
                 "paragraph": {
-                    "rich_text": [{"type": "text", "text": {"content": chunk}}]
+                    "rich_text": [{"type": "text", "text": {"content": text}}]
                 }
-            })
+            }
 
-        return blocks
+        for chunk in chunks:
+            buffer += chunk
+            while len(buffer) >= chunk_size:
+                yield paragraph(buffer[:chunk_size])
+                buffer = buffer[chunk_size:]
+        if buffer:
+            yield paragraph(buffer)
+
+    def _iter_page_content_chunks(
+        self,
+        page_content: Optional[str],
+        attachments: Optional[list[Attachment]]
+    ) -> Iterator[str]:
+        """依序產生頁面內容：page_content 之後接每個附件的開頭預覽（只讀取預覽長度）"""
+        if page_content:
+            yield page_content
+        for attachment in attachments or []:
+            yield f"\n📎 {attachment.file_name}（{attachment.size_label()}）\n\n"
+            preview = attachment.read_text(ATTACHMENT_NOTION_PREVIEW_CHARS + 1)
+            if len(preview) > ATTACHMENT_NOTION_PREVIEW_CHARS:
+                yield preview[:ATTACHMENT_NOTION_PREVIEW_CHARS]
+                yield f"\n\n…（僅顯示前 {ATTACHMENT_NOTION_PREVIEW_CHARS} 字元）"
+            else:
+                yield preview
+
+    def _sync_create_page_with_blocks(self, create_params: dict, blocks: Iterator[dict]) -> dict:
+        """建立頁面，超過單次上限的 blocks 分批附加（Notion 每次最多 100 個）"""
+        first_batch = list(islice(blocks, NOTION_MAX_BLOCKS_PER_REQUEST))
+        if first_batch:
+            create_params = {**create_params, "children": first_batch}
+        response = self.client.pages.create(**create_params)
+
+        while True:
+            batch = list(islice(blocks, NOTION_MAX_BLOCKS_PER_REQUEST))
+            if not batch:
+                break
+            self.client.blocks.children.append(block_id=response["id"], children=batch)
+        return response
+
+    def _sync_update_page_with_blocks(self, page_id: str, properties: dict, blocks: Iterator[dict]) -> dict:
+        """更新既有頁面的屬性，並將 blocks 分批附加到頁面 body"""
+        response = self.client.pages.update(page_id=page_id, properties=properties)
+        while True:
+            batch = list(islice(blocks, NOTION_MAX_BLOCKS_PER_REQUEST))
+            if not batch:
+                break
+            self.client.blocks.children.append(block_id=page_id, children=batch)
+        return response
 
     async def create_inbox_task(
         self,
         title: str,
         raw_input: str,
         source: str = "line",
-        page_content: str = None
+        page_content: str = None,
+        attachments: Optional[list[Attachment]] = None
     ) -> str:
         """Create a new task in Inbox database. Returns the page ID.
 
@@ -132,6 +186,7 @@ class NotionService:
             raw_input: 原始輸入（會被截斷到 2000 字符）
             source: 來源（line, web 等）
             page_content: 完整內容（會存到頁面 body，不受 2000 字符限制）
+            attachments: 磁碟上的附件，只有開頭預覽會附加到頁面 body
         """
         logger.info(f"建立 Inbox 任務: {title}")
         try:
@@ -146,13 +201,14 @@ class NotionService:
                 }
             }
 
-            # 如果有完整內容，加到頁面 body
-            if page_content:
-                create_params["children"] = self._build_text_blocks(page_content)
-
+            # 如果有完整內容或附件，串流轉換為 blocks 加到頁面 body
+            blocks = self._iter_text_blocks(
+                self._iter_page_content_chunks(page_content, attachments)
+            )
             response = await self._run_sync(
-                self.client.pages.create,
-                **create_params
+                self._sync_create_page_with_blocks,
+                create_params,
+                blocks
             )
             logger.debug(f"Inbox 任務建立成功: {response['id']}")
             return response["id"]
@@ -188,28 +244,57 @@ class NotionService:
 
     # ==================== Review CRUD ====================
 
+    async def create_review_placeholder(self, title: str, difficulty: str, source_task_id: str) -> str:
+        """Stage 1 串流中得知難度與標題時先建立 Review 頁面，完整結果稍後以 page_id 填入"""
+        logger.info(f"預先建立 Review 任務: {title}")
+        response = await self._run_sync(
+            self.client.pages.create,
+            parent={"database_id": self.review_db_id},
+            properties={
+                "Name": self._build_title(title),
+                "Difficulty": self._build_select(difficulty),
+                "Status": self._build_select("pending_review"),
+                "ProcessedAt": self._build_date(),
+                "SourceTaskId": self._build_rich_text(source_task_id, truncate=False),
+            }
+        )
+        logger.debug(f"Review 任務預先建立成功: {response['id']}")
+        return response["id"]
+
     async def create_review_task_simple(
         self,
         title: str,
         summary: str,
         result: str,
-        source_task_id: str
+        source_task_id: str,
+        page_content: Optional[str] = None,
+        page_id: Optional[str] = None
     ) -> str:
-        """Create a simple review task with direct result."""
+        """Create a simple review task with direct result.
+
+        page_content（例如超過 Result 欄位長度或 LINE 放不下的完整結果）會存到頁面 body，
+        作為 LINE 訊息的續看頁面。有 page_id 時填入預先建立的頁面，不另建新頁面。
+        """
         logger.info(f"建立簡單 Review 任務: {title}")
         try:
+            properties = {
+                "Name": self._build_title(title),
+                "Difficulty": self._build_select("simple"),
+                "Status": self._build_select("pending_review"),
+                "Summary": self._build_rich_text(summary),
+                "Result": self._build_rich_text(result),
+                "ProcessedAt": self._build_date(),
+                "SourceTaskId": self._build_rich_text(source_task_id, truncate=False),
+            }
+            blocks = self._iter_text_blocks([page_content] if page_content else [])
+            if page_id:
+                await self._run_sync(self._sync_update_page_with_blocks, page_id, properties, blocks)
+                logger.debug(f"簡單 Review 任務填入完成: {page_id}")
+                return page_id
             response = await self._run_sync(
-                self.client.pages.create,
-                parent={"database_id": self.review_db_id},
-                properties={
-                    "Name": self._build_title(title),
-                    "Difficulty": self._build_select("simple"),
-                    "Status": self._build_select("pending_review"),
-                    "Summary": self._build_rich_text(summary),
-                    "Result": self._build_rich_text(result),
-                    "ProcessedAt": self._build_date(),
-                    "SourceTaskId": self._build_rich_text(source_task_id, truncate=False),
-                }
+                self._sync_create_page_with_blocks,
+                {"parent": {"database_id": self.review_db_id}, "properties": properties},
+                blocks
             )
             logger.debug(f"簡單 Review 任務建立成功: {response['id']}")
             return response["id"]
@@ -226,27 +311,36 @@ class NotionService:
         prompt_for_claude_code: str,
         estimated_time: str,
         reason: str,
-        source_task_id: str
+        source_task_id: str,
+        page_id: Optional[str] = None
     ) -> str:
-        """Create a complex review task with analysis and prompt for Claude Code."""
+        """Create a complex review task with analysis and prompt for Claude Code.
+
+        有 page_id 時填入預先建立的頁面，不另建新頁面。
+        """
         logger.info(f"建立複雜 Review 任務: {title}")
         try:
+            properties = {
+                "Name": self._build_title(title),
+                "Difficulty": self._build_select("complex"),
+                "Status": self._build_select("pending_review"),
+                "Summary": self._build_rich_text(summary),
+                "Analysis": self._build_rich_text(analysis),
+                "Preparation": self._build_rich_text(preparation),
+                "PromptForClaudeCode": self._build_rich_text(prompt_for_claude_code),
+                "EstimatedTime": self._build_rich_text(estimated_time, truncate=False),
+                "Reason": self._build_rich_text(reason),
+                "ProcessedAt": self._build_date(),
+                "SourceTaskId": self._build_rich_text(source_task_id, truncate=False),
+            }
+            if page_id:
+                await self._run_sync(self.client.pages.update, page_id=page_id, properties=properties)
+                logger.debug(f"複雜 Review 任務填入完成: {page_id}")
+                return page_id
             response = await self._run_sync(
                 self.client.pages.create,
                 parent={"database_id": self.review_db_id},
-                properties={
-                    "Name": self._build_title(title),
-                    "Difficulty": self._build_select("complex"),
-                    "Status": self._build_select("pending_review"),
-                    "Summary": self._build_rich_text(summary),
-                    "Analysis": self._build_rich_text(analysis),
-                    "Preparation": self._build_rich_text(preparation),
-                    "PromptForClaudeCode": self._build_rich_text(prompt_for_claude_code),
-                    "EstimatedTime": self._build_rich_text(estimated_time, truncate=False),
-                    "Reason": self._build_rich_text(reason),
-                    "ProcessedAt": self._build_date(),
-                    "SourceTaskId": self._build_rich_text(source_task_id, truncate=False),
-                }
+                properties=properties
             )
             logger.debug(f"複雜 Review 任務建立成功: {response['id']}")
             return response["id"]
@@ -309,8 +403,11 @@ class NotionService:
 
     async def format_memories_for_prompt(self) -> str:
         """Format memories as a string for Claude prompt."""
-        memories = await self.get_all_memories()
+        return self.format_memories(await self.get_all_memories())
 
+    @staticmethod
+    def format_memories(memories: list[dict]) -> str:
+        """Format already fetched memories (e.g. after token budgeting) for Claude prompt."""
         if not memories:
             return "目前沒有儲存的記憶。"
 
@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from src.config import settings
+from src.constants import (
+    RESPONSE_CACHE_DB_FILENAME,
+    RESPONSE_CACHE_MINHASH_PERMUTATIONS,
+    RESPONSE_CACHE_SHINGLE_SIZE,
+)
+from src.models.claude_response import ClaudeResponse
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+# MinHash 使用的 universal hashing：(a * h + b) mod p
+_MINHASH_PRIME = (1 << 61) - 1
+
+
+def normalize_input(text: str) -> str:
+    """正規化使用者輸入：NFKC、不分大小寫、合併空白"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+def _digest(text: Optional[str]) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def _minhash_params() -> list[tuple[int, int]]:
+    """固定的 MinHash 參數（由序號導出，重啟後簽章仍可比較）"""
+    params = []
+    for i in range(RESPONSE_CACHE_MINHASH_PERMUTATIONS):
+        seed = hashlib.blake2b(f"minhash-{i}".encode(), digest_size=16).digest()
+        a = int.from_bytes(seed[:8], "big") % (_MINHASH_PRIME - 1) + 1
+        b = int.from_bytes(seed[8:], "big") % _MINHASH_PRIME
+        params.append((a, b))
+    return params
+
+
+_MINHASH_PARAMS = _minhash_params()
+
+
+def minhash_signature(text: str) -> list[int]:
+    """以字元 shingle 計算 MinHash 簽章（中文沒有空白分詞，因此用字元而非單字）"""
+    size = RESPONSE_CACHE_SHINGLE_SIZE
+    shingles = {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        for s in shingles
+    ]
+    return [min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in _MINHASH_PARAMS]
+
+
+def estimate_similarity(left: list[int], right: list[int]) -> float:
+    """兩個 MinHash 簽章估計的 Jaccard 相似度"""
+    return sum(1 for x, y in zip(left, right) if x == y) / len(left)
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    key: str
+    # 附件內容 hash + 記憶版本；近似比對只在相同 context 內進行
+    context: str
+    signature: Optional[list[int]]
+    response: ClaudeResponse
+    created_at: float
+
+
+class ResponseCache:
+    """
+    Stage 1 回應快取（位於 ClaudeService.process_task 之前）
+
+    - key 為正規化後的使用者輸入 + 附件內容 hash + 記憶版本（記憶內容的 hash），
+      記憶變動後舊的回應自然不再命中
+    - 記憶體內為 LRU + TTL，寫入同步存到 SQLite，重啟後載回
+    - 只快取不含記憶更新的簡單任務（複雜任務會觸發 Claude Code 執行，不適合重播），
+      且必須是嚴格解析成功的 JSON（非備用回應）並由模型標記 cacheable（與時間、即時資訊無關）
+    - response_cache_near_duplicate 開啟時，未完全命中會以 MinHash 比對近似的輸入
+    """
+
+    def __init__(self):
+        self.enabled = settings.response_cache_enabled
+        self.db_path = settings.data_path / RESPONSE_CACHE_DB_FILENAME
+        self.ttl_seconds = settings.response_cache_ttl_seconds
+        self.max_entries = settings.response_cache_max_entries
+        self.near_duplicate = settings.response_cache_near_duplicate
+        self.similarity_threshold = settings.response_cache_similarity_threshold
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._initialized = False
+
+    # ==================== SQLite 輔助方法 ====================
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _sync_load(self) -> list[tuple]:
+        """建立資料表、清除過期紀錄，並回傳最近使用的快取"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        cutoff = time.time() - self.ttl_seconds
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "cache_key TEXT PRIMARY KEY, context TEXT NOT NULL, signature TEXT, "
+                "response TEXT NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+            conn.commit()
+            rows = conn.execute(
+                "SELECT cache_key, context, signature, response, created_at FROM responses "
+                "ORDER BY used_at DESC LIMIT ?",
+                (self.max_entries,)
+            ).fetchall()
+        self._initialized = True
+        return list(reversed(rows))
+
+    def _sync_store(self, entry: CacheEntry, evicted: list[str]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(cache_key, context, signature, response, created_at, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    entry.key,
+                    entry.context,
+                    json.dumps(entry.signature) if entry.signature else None,
+                    entry.response.model_dump_json(),
+                    entry.created_at,
+                    entry.created_at,
+                )
+            )
+            if evicted:
+                conn.executemany("DELETE FROM responses WHERE cache_key = ?", [(k,) for k in evicted])
+            conn.commit()
+
+    def _sync_touch(self, key: str, used_at: float) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE responses SET used_at = ? WHERE cache_key = ?", (used_at, key))
+            conn.commit()
+
+    # ==================== 記憶體 LRU ====================
+
+    def _remember(self, entry: CacheEntry) -> list[str]:
+        """加入快取並回傳被淘汰的 key"""
+        self._entries[entry.key] = entry
+        self._entries.move_to_end(entry.key)
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            evicted.append(key)
+        return evicted
+
+    def _is_fresh(self, entry: CacheEntry, now: float) -> bool:
+        if now - entry.created_at <= self.ttl_seconds:
+            return True
+        self._entries.pop(entry.key, None)
+        return False
+
+    def _find_near(self, context: str, signature: list[int], now: float) -> Optional[tuple[CacheEntry, float]]:
+        best = None
+        for entry in list(self._entries.values()):
+            if entry.context != context or not entry.signature or not self._is_fresh(entry, now):
+                continue
+            similarity = estimate_similarity(signature, entry.signature)
+            if similarity >= self.similarity_threshold and (best is None or similarity > best[1]):
+                best = (entry, similarity)
+        return best
+
+    @staticmethod
+    def _keys(user_input: str, page_content: Optional[str], memories: str) -> tuple[str, str, str]:
+        normalized = normalize_input(user_input)
+        context = f"{_digest(page_content)}:{_digest(memories)}"
+        return normalized, context, _digest(f"{normalized}\n{context}")
+
+    # ==================== 公開 API ====================
+
+    async def load(self) -> None:
+        """從磁碟載入快取（於 app lifespan 呼叫）"""
+        if not self.enabled:
+            return
+        rows = await asyncio.to_thread(self._sync_load)
+        loaded = 0
+        for key, context, signature, response, created_at in rows:
+            try:
+                parsed = ClaudeResponse.model_validate_json(response)
+            except ValueError:
+                continue
+            if not parsed.cacheable:
+                # 舊版本寫入、未經模型標記的回應
+                continue
+            self._remember(CacheEntry(key, context, json.loads(signature) if signature else None, parsed, created_at))
+            loaded += 1
+        logger.info(f"回應快取載入 {loaded} 筆")
+
+    async def get(
+        self,
+        user_input: str,
+        page_content: Optional[str],
+        memories: str
+    ) -> Optional[ClaudeResponse]:
+        """查詢快取，命中時回傳先前的回應"""
+        if not self.enabled:
+            return None
+        if not self._initialized:
+            await self.load()
+
+        now = time.time()
+        normalized, context, key = self._keys(user_input, page_content, memories)
+        entry = self._entries.get(key)
+        if entry is not None and self._is_fresh(entry, now):
+            metrics.incr("response_cache_hits")
+            logger.info(f"回應快取命中: {entry.response.title}")
+        elif self.near_duplicate:
+            match = self._find_near(context, minhash_signature(normalized), now)
+            if match is None:
+                metrics.incr("response_cache_misses")
+                return None
+            entry, similarity = match
+            metrics.incr("response_cache_near_hits")
+            logger.info(f"回應快取近似命中（相似度 {similarity:.2f}）: {entry.response.title}")
+        else:
+            metrics.incr("response_cache_misses")
+            return None
+
+        self._entries.move_to_end(entry.key)
+        try:
+            await asyncio.to_thread(self._sync_touch, entry.key, now)
+        except sqlite3.Error as e:
+            logger.warning(f"更新回應快取使用時間失敗: {e}")
+        return entry.response.model_copy(deep=True)
+
+    async def put(
+        self,
+        user_input: str,
+        page_content: Optional[str],
+        memories: str,
+        response: ClaudeResponse
+    ) -> None:
+        """快取簡單任務的回應（記憶更新已在第一次處理時套用，不會重播）"""
+        if not self.is_cacheable(response):
+            return
+        if not self._initialized:
+            await self.load()
+
+        normalized, context, key = self._keys(user_input, page_content, memories)
+        signature = minhash_signature(normalized) if self.near_duplicate else None
+        entry = CacheEntry(key, context, signature, response.model_copy(deep=True), time.time())
+        evicted = self._remember(entry)
+        try:
+            await asyncio.to_thread(self._sync_store, entry, evicted)
+        except sqlite3.Error as e:
+            # 寫入失敗只影響重啟後的快取，不影響本次任務
+            logger.warning(f"回應快取寫入磁碟失敗: {e}")
+
+    def is_cacheable(self, response: ClaudeResponse) -> bool:
+        """只快取解析成功、模型標記為 cacheable、且不含記憶更新的簡單任務"""
+        if not self.enabled or response.difficulty != "simple" or not response.simple_result:
+            return False
+        if response.is_fallback:
+            metrics.incr("response_cache_skipped_fallback")
+            return False
+        if not response.cacheable:
+            metrics.incr("response_cache_skipped_uncacheable")
+            return False
+        # 記憶更新後記憶版本改變，這個 key 不會再被查到
+        return not response.memory_updates
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "near_duplicate": self.near_duplicate}
+
+
+response_cache = ResponseCache()
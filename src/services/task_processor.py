@@ -1,12 +1,21 @@
+import asyncio
 import logging
 import re
+import uuid
 from typing import Optional
 
 from src.services.notion_service import notion_service
 from src.services.claude_service import claude_service
 from src.services.claude_code_service import claude_code_service
 from src.services.line_service import line_service
+from src.services.message_packer import pack_text, fits
+from src.services.response_cache import response_cache
+from src.services.attachment_digest import attachment_digest
+from src.services.attachment_store import attachment_store
+from src.services.task_queue import JobCheckpoint, RetryJob, task_queue, stage2_queue
 from src.models.claude_response import ClaudeResponse
+from src.models.attachment import Attachment
+from src.constants import ATTACHMENT_STAGE1_MAX_CHARS, NOTION_MAX_TEXT_LENGTH
 
 logger = logging.getLogger(__name__)
 
@@ -87,130 +96,198 @@ class TaskProcessor:
         user_input: str,
         source: str = "line",
         reply_token: Optional[str] = None,
-        page_content: str = None
+        page_content: str = None,
+        attachments: Optional[list[Attachment]] = None,
+        deferred: bool = False,
+        job_id: Optional[int] = None
     ) -> None:
         """
         Main task processing flow:
-        1. Create Inbox task
-        2. Read Memory
-        3. Stage 1: Claude API analyzes task
+        1. Read Memory (a response cache hit for a simple task is replied to here)
+        2. Create Inbox task (attachments are streamed into the page body)
+        3. Stage 1: Claude API analyzes task (skipped on a response cache hit)
         4. Create Review task (with status)
-        5. Stage 2: If complex, execute with Claude Code
+        5. Stage 2: If complex, queue it on stage2_queue (see run_stage2)
         6. Update Memory (if needed)
         7. Delete Inbox task
         8. Push notification to Joey
+
+        reply_token is a reply token held by line_service: the first message after
+        Stage 1 is sent on it (free) if it has not expired, otherwise it is pushed.
+
+        deferred=True sends Stage 1 through the Message Batches API (half price,
+        minutes to hours) for work that is not waiting on a reply. The batch request id
+        is checkpointed and the job is rescheduled (RetryJob) until the result is ready,
+        so no worker waits on the batch.
+
+        job_id is the task_queue job running this task. Progress is checkpointed on it,
+        so a job re-run after a lost lease or a restart skips the steps that already
+        happened (Notion pages, replies, the Stage 2 job) instead of repeating them.
         """
-        inbox_task_id = None
-        review_task_id = None
+        checkpoint = await task_queue.load_checkpoint(job_id)
+        inbox_task_id = checkpoint.get("inbox_task_id")
+        review_task_id = checkpoint.get("review_task_id")
+        review_placeholder: Optional[asyncio.Task] = None
+
+        async def create_review_placeholder(title: str, difficulty: str) -> str:
+            page_id = await notion_service.create_review_placeholder(title, difficulty, inbox_task_id)
+            await checkpoint.save(review_task_id=page_id)
+            return page_id
+
+        def on_classified(difficulty: str, title: str) -> None:
+            # Stage 1 串流中得知難度與標題：與剩下的生成並行建立 Review 頁面
+            nonlocal review_placeholder
+            if difficulty in ("simple", "complex") and review_placeholder is None and review_task_id is None:
+                review_placeholder = asyncio.create_task(create_review_placeholder(title, difficulty))
 
         try:
-            # Step 1: Create Inbox task
-            logger.info("Creating inbox task...")
-            title = user_input[:50] + "..." if len(user_input) > 50 else user_input
-            inbox_task_id = await notion_service.create_inbox_task(
-                title=title,
-                raw_input=user_input,
-                source=source,
-                page_content=page_content
-            )
-            logger.info(f"Inbox task created: {inbox_task_id}")
+            saved_response = checkpoint.get("response")
+            deferred_id = checkpoint.get("deferred_id")
+            polled = None
+            if saved_response is None and deferred_id is not None:
+                # 等待 batch 結果的重新執行：先查結果，尚未完成時直接拋出 RetryJob，
+                # 不重讀 Notion 記憶、附件，也不重查快取與摘要
+                polled = await claude_service.deferred_result(deferred_id)
+
+            if saved_response is not None:
+                # 重新執行的任務：沿用先前的 Stage 1 結果
+                logger.info(f"任務 #{job_id} 重新執行，沿用先前的 Stage 1 結果")
+                response = ClaudeResponse.model_validate(saved_response)
+            else:
+                # Step 1: Read Memory (also the memory version of the response cache key)
+                logger.info("Reading memories...")
+                memories = await notion_service.get_all_memories()
+                memories_text = notion_service.format_memories(memories)
+                stage1_content = page_content
+                if attachments:
+                    # Stage 1 prompt 與快取 key 需要附件文字，此處才從磁碟讀入（每個附件有讀取上限）
+                    stage1_content = await asyncio.to_thread(
+                        self._combine_page_content, page_content, attachments
+                    )
 
-            # Update status to processing
-            await notion_service.update_inbox_status(inbox_task_id, "processing")
+                # 回應快取：相同的簡單任務不呼叫 Claude，放得進 LINE 訊息時立即回覆
+                # （batch 結果已完成時記憶與附件只讀這一次，供下方寫入快取）
+                response = polled or await response_cache.get(user_input, stage1_content, memories_text)
+                if response is not None and polled is None:
+                    messages = pack_text(response.line_message)
+                    replied = bool(messages) and fits(response.line_message)
+                    if replied:
+                        await line_service.reply_or_push_to_joey(reply_token, messages)
+                    await checkpoint.save(response=response.model_dump(mode="json"), replied=replied)
+
+            # Step 2: Create Inbox task
+            if inbox_task_id is None:
+                logger.info("Creating inbox task...")
+                title = user_input[:50] + "..." if len(user_input) > 50 else user_input
+                inbox_task_id = await notion_service.create_inbox_task(
+                    title=title,
+                    raw_input=user_input,
+                    source=source,
+                    page_content=page_content,
+                    attachments=attachments
+                )
+                await checkpoint.save(inbox_task_id=inbox_task_id)
+                logger.info(f"Inbox task created: {inbox_task_id}")
 
-            # Step 2: Read Memory
-            logger.info("Reading memories...")
-            memories = await notion_service.format_memories_for_prompt()
+                # Update status to processing
+                await notion_service.update_inbox_status(inbox_task_id, "processing")
 
             # ============================================
             # Stage 1: Claude API Analysis (fast)
             # ============================================
-            logger.info("Stage 1: Calling Claude API for task analysis...")
-            if page_content:
-                logger.info(f"傳遞 page_content 到 Claude API，長度: {len(page_content)} 字元")
-            response = await claude_service.process_task(
-                user_input=user_input,
-                memories=memories,
-                page_content=page_content
-            )
+            if polled is not None:
+                await self._save_stage1(
+                    checkpoint, response, user_input, stage1_content, memories_text, page_content, attachments
+                )
+            elif response is None:
+                # 大型附件先分段並行摘要，Stage 1 只看摘要（重新執行時沿用已完成的摘要）
+                digest_content = checkpoint.get("digest_content")
+                if digest_content is None:
+                    digest = await attachment_digest.digest(stage1_content)
+                    if digest:
+                        if digest.omitted_tokens:
+                            await line_service.push_to_joey(
+                                f"📎 附件過長，只摘要了開頭與結尾（中段約 {digest.omitted_tokens} tokens 未摘要）",
+                                optional=True
+                            )
+                        digest_content = digest.content
+                        await checkpoint.save(digest_content=digest_content)
+
+                if deferred and deferred_id is None:
+                    deferred_id = f"task-{job_id}-{uuid.uuid4().hex}"
+                    await checkpoint.save(deferred_id=deferred_id)
+
+                logger.info("Stage 1: Calling Claude API for task analysis...")
+                if stage1_content:
+                    logger.info(f"傳遞 page_content 到 Claude API，長度: {len(stage1_content)} 字元")
+                try:
+                    response = await claude_service.process_task(
+                        user_input=user_input,
+                        memories=memories,
+                        page_content=digest_content or stage1_content,
+                        on_classified=on_classified,
+                        deferred_id=deferred_id
+                    )
+                finally:
+                    # Stage 1 失敗時預先建立的頁面也交由下方的錯誤處理標記為 failed
+                    review_task_id = await self._await_review_placeholder(review_placeholder) or review_task_id
+                await self._save_stage1(
+                    checkpoint, response, user_input, stage1_content, memories_text, page_content, attachments
+                )
             logger.info(f"Claude response - difficulty: {response.difficulty}")
 
-            # Step 4: Create Review task
-            logger.info("Creating review task...")
-            review_task_id = await self._create_review_task(response, inbox_task_id)
-
-            # Notify Joey that task is being processed
-            if response.difficulty == "complex":
-                await line_service.push_to_joey(
-                    f"📝 任務已建立：{response.title}\n\n"
-                    f"難度：複雜任務\n"
-                    f"狀態：執行中...\n\n"
-                    f"我會在完成後通知你。"
+            # Step 4: Create Review task（有預先建立的頁面時填入該頁面）
+            if not checkpoint.get("review_ready"):
+                logger.info("Creating review task...")
+                review_task_id = await self._create_review_task(
+                    response, inbox_task_id, page_id=review_task_id
                 )
+                await checkpoint.save(review_task_id=review_task_id, review_ready=True)
 
             # ============================================
             # Stage 2: Claude Code Execution (for complex tasks)
             # ============================================
             if response.difficulty == "complex" and response.complex_result:
-                logger.info("Stage 2: Executing complex task with Claude Code...")
-
-                # Update review task status to executing
-                await notion_service.update_review_task_status(review_task_id, "executing")
-
-                # Execute with Claude Code (Ralph Wiggum retry loop enabled)
-                # 長時間任務支援：每次迭代最多 6 小時，最多重試 10 次
-                # 理論上可以跑 60 小時（2.5 天）
-                execution_result = await claude_code_service.execute_task_with_retry(
-                    prompt=response.complex_result.prompt_for_claude_code,
+                # Notify Joey that task is being processed
+                if not checkpoint.get("created_notified"):
+                    await line_service.reply_or_push_to_joey(
+                        reply_token,
+                        f"📝 任務已建立：{response.title}\n\n"
+                        f"難度：複雜任務\n"
+                        f"狀態：執行中...\n\n"
+                        f"我會在完成後通知你。",
+                        optional=True
+                    )
+                    await checkpoint.save(created_notified=True)
+
+                # Claude Code 可能執行數小時：交給 stage2_queue，不佔用這個 worker
+                # （unique_key 讓重新執行的任務不會再排一次）
+                stage2_job_id = await stage2_queue.enqueue(
+                    "claude_code",
+                    unique_key=f"task-{job_id}" if job_id is not None else None,
+                    review_task_id=review_task_id,
                     title=response.title,
-                    max_retries=10,  # 最多重試 10 次
-                    timeout_seconds=21600  # 每次最多 6 小時
+                    prompt=response.complex_result.prompt_for_claude_code,
+                    attachments_dir=checkpoint.get("stage2_attachments")
                 )
-
-                # Update review task with result
-                if execution_result["success"]:
-                    await notion_service.update_review_task_result(
-                        page_id=review_task_id,
-                        status="completed",
-                        result=execution_result["output"][:2000],
-                        folder_path=execution_result["folder_path"]
-                    )
-
-                    # Extract URLs from output
-                    urls = extract_result_urls(execution_result["output"])
-
-                    # Build Notion URL
-                    notion_url = f"https://notion.so/{review_task_id.replace('-', '')}"
-
-                    # Send simplified success notification
-                    message_parts = [f"✅ {response.title}"]
-
-                    if urls["deploy_url"]:
-                        message_parts.append(f"\n🌐 {urls['deploy_url']}")
-
-                    message_parts.append(f"\n📋 {notion_url}")
-
-                    await line_service.push_to_joey("".join(message_parts))
+                await checkpoint.save(stage2_queued=True)
+                logger.info(f"Stage 2 queued: #{stage2_job_id}")
+            elif not checkpoint.get("replied"):
+                # Simple task - send the result; long results are packed into up to
+                # 5 bubbles, with the review page as the full view
+                notion_url = f"https://notion.so/{review_task_id.replace('-', '')}"
+                messages = pack_text(response.line_message, continuation_url=notion_url)
+                if messages:
+                    await line_service.reply_or_push_to_joey(reply_token, messages)
                 else:
-                    await notion_service.update_review_task_result(
-                        page_id=review_task_id,
-                        status="failed",
-                        result=f"執行失敗：{execution_result['error']}"
-                    )
-
-                    # Send failure notification
-                    await line_service.push_to_joey(
-                        f"❌ 任務失敗：{response.title}\n\n"
-                        f"錯誤：{execution_result['error'][:300]}"
-                    )
-            else:
-                # Simple task - just send the result
-                await line_service.push_to_joey(response.line_message)
+                    logger.warning("LINE 訊息為空白，不發送（結果見 Review 頁面）")
+                await checkpoint.save(replied=True)
 
             # Step 5: Update Memory (if needed)
-            if response.memory_updates:
+            if response.memory_updates and not checkpoint.get("memories_updated"):
                 logger.info(f"Processing {len(response.memory_updates)} memory updates...")
                 await self._process_memory_updates(response)
+                await checkpoint.save(memories_updated=True)
 
             # Step 6: Delete Inbox task
             logger.info("Deleting inbox task...")
@@ -218,13 +295,16 @@ class TaskProcessor:
 
             logger.info("Task processing completed successfully")
 
+        except RetryJob:
+            # Stage 1 的 batch 尚未完成：任務稍後重新執行，已完成的步驟由 checkpoint 略過
+            raise
         except Exception as e:
             logger.error(f"Error processing task: {e}", exc_info=True)
 
             # Try to notify Joey about the error
             try:
                 error_message = f"❌ 處理任務時發生錯誤\n\n原始訊息：{user_input[:100]}...\n\n錯誤：{str(e)[:200]}"
-                await line_service.push_to_joey(error_message)
+                await line_service.reply_or_push_to_joey(reply_token, error_message, urgent=True)
             except Exception as notify_error:
                 logger.error(f"Failed to send error notification: {notify_error}")
 
@@ -246,21 +326,184 @@ class TaskProcessor:
                 except Exception:
                     pass
 
+            # Stage 2 沒有排入時，保留給它的原文也不再需要
+            if not checkpoint.get("stage2_queued"):
+                await attachment_store.delete_stage2(checkpoint.get("stage2_attachments"))
+
             raise
 
+    async def run_stage2(
+        self,
+        review_task_id: str,
+        title: str,
+        prompt: str,
+        attachments_dir: Optional[str] = None,
+        job_id: Optional[int] = None
+    ) -> None:
+        """
+        Stage 2 job (stage2_queue): execute a complex task with Claude Code.
+
+        The execution result is checkpointed before Notion and LINE are updated, so a
+        job re-run after a restart reports the finished run instead of executing it again.
+        attachments_dir holds the original attachment files kept by Stage 1; they are
+        copied into the task folder and deleted once the job finishes.
+        """
+        checkpoint = await stage2_queue.load_checkpoint(job_id)
+        try:
+            execution_result = checkpoint.get("result")
+            if execution_result is None:
+                logger.info("Stage 2: Executing complex task with Claude Code...")
+
+                # Update review task status to executing
+                await notion_service.update_review_task_status(review_task_id, "executing")
+
+                # Execute with Claude Code (Ralph Wiggum retry loop enabled)
+                # 長時間任務支援：每次迭代最多 6 小時，最多重試 10 次
+                # 理論上可以跑 60 小時（2.5 天）
+                execution_result = await claude_code_service.execute_task_with_retry(
+                    prompt=prompt,
+                    title=title,
+                    max_retries=10,  # 最多重試 10 次
+                    timeout_seconds=21600,  # 每次最多 6 小時
+                    attachments_dir=attachments_dir
+                )
+                await checkpoint.save(result=execution_result)
+
+            # Update review task with result
+            if execution_result["success"]:
+                await notion_service.update_review_task_result(
+                    page_id=review_task_id,
+                    status="completed",
+                    result=execution_result["output"][:2000],
+                    folder_path=execution_result["folder_path"]
+                )
+
+                # Extract URLs from output
+                urls = extract_result_urls(execution_result["output"])
+
+                # Build Notion URL
+                notion_url = f"https://notion.so/{review_task_id.replace('-', '')}"
+
+                # Send simplified success notification
+                message_parts = [f"✅ {title}"]
+
+                if urls["deploy_url"]:
+                    message_parts.append(f"\n🌐 {urls['deploy_url']}")
+
+                message_parts.append(f"\n📋 {notion_url}")
+
+                await line_service.push_to_joey("".join(message_parts))
+            else:
+                await notion_service.update_review_task_result(
+                    page_id=review_task_id,
+                    status="failed",
+                    result=f"執行失敗：{execution_result['error']}"
+                )
+
+                # Send failure notification
+                await line_service.push_to_joey(
+                    f"❌ 任務失敗：{title}\n\n"
+                    f"錯誤：{execution_result['error'][:300]}"
+                )
+
+        except Exception as e:
+            logger.error(f"Error executing Stage 2: {e}", exc_info=True)
+            try:
+                await line_service.push_to_joey(
+                    f"❌ 執行任務時發生錯誤：{title}\n\n錯誤：{str(e)[:200]}", urgent=True
+                )
+            except Exception as notify_error:
+                logger.error(f"Failed to send error notification: {notify_error}")
+            try:
+                await notion_service.update_review_task_result(
+                    page_id=review_task_id,
+                    status="failed",
+                    result=f"錯誤：{str(e)[:500]}"
+                )
+            except Exception:
+                pass
+            await attachment_store.delete_stage2(attachments_dir)
+            raise
+
+        await attachment_store.delete_stage2(attachments_dir)
+
+    @staticmethod
+    async def _save_stage1(
+        checkpoint: JobCheckpoint,
+        response: ClaudeResponse,
+        user_input: str,
+        stage1_content: Optional[str],
+        memories_text: str,
+        page_content: Optional[str],
+        attachments: Optional[list[Attachment]]
+    ) -> None:
+        """寫入回應快取並將 Stage 1 結果存進 checkpoint（需要時保留原文給 Stage 2）"""
+        await response_cache.put(user_input, stage1_content, memories_text, response)
+        stage2_attachments = None
+        if checkpoint.get("digest_content") and response.complex_result:
+            # Claude Code 需要完整原文（例如建立網站），不只是摘要：
+            # 原文保留成檔案，Stage 2 複製到任務資料夾（不放進命令列參數）
+            stage2_attachments = await attachment_store.keep_for_stage2(page_content, attachments)
+        await checkpoint.save(
+            response=response.model_dump(mode="json"), stage2_attachments=stage2_attachments
+        )
+
+    @staticmethod
+    def _combine_page_content(page_content: Optional[str], attachments: list[Attachment]) -> str:
+        """將 page_content 與附件文字合併為單一字串（每個附件標註檔名，最多讀入 ATTACHMENT_STAGE1_MAX_CHARS）"""
+        parts = [page_content] if page_content else []
+        for attachment in attachments:
+            text = attachment.read_text(ATTACHMENT_STAGE1_MAX_CHARS + 1)
+            if len(text) > ATTACHMENT_STAGE1_MAX_CHARS:
+                logger.warning(f"附件 {attachment.file_name} 過長，Stage 1 只讀入前 {ATTACHMENT_STAGE1_MAX_CHARS} 字元")
+                text = (
+                    text[:ATTACHMENT_STAGE1_MAX_CHARS]
+                    + f"\n\n[附件過長（{attachment.size_label()}），僅讀入前 {ATTACHMENT_STAGE1_MAX_CHARS} 字元]"
+                )
+            parts.append(f"📎 {attachment.file_name}\n\n{text}")
+        return "\n\n---\n\n".join(parts)
+
+    @staticmethod
+    def _full_result_content(response: ClaudeResponse) -> Optional[str]:
+        """Result 欄位或 LINE 訊息放不下的完整內容（存到 Review 頁面 body）"""
+        parts = []
+        if response.simple_result and len(response.simple_result.result) > NOTION_MAX_TEXT_LENGTH:
+            parts.append(response.simple_result.result)
+        if not fits(response.line_message):
+            parts.append(response.line_message)
+        return "\n\n---\n\n".join(parts) or None
+
+    @staticmethod
+    async def _await_review_placeholder(placeholder: Optional[asyncio.Task]) -> Optional[str]:
+        """取得預先建立的 Review 頁面 ID，建立失敗時回傳 None（改為最後再建立）"""
+        if placeholder is None:
+            return None
+        try:
+            return await placeholder
+        except Exception as e:
+            logger.warning(f"預先建立 Review 任務失敗，改於 Stage 1 完成後建立: {e}")
+            return None
+
     async def _create_review_task(
         self,
         response: ClaudeResponse,
-        source_task_id: str
+        source_task_id: str,
+        page_id: Optional[str] = None
     ) -> str:
-        """Create appropriate review task based on difficulty."""
+        """Create appropriate review task based on difficulty.
+
+        page_id is a placeholder created while Stage 1 was streaming; it is filled
+        in place of creating a new page.
+        """
 
         if response.difficulty == "simple" and response.simple_result:
             return await notion_service.create_review_task_simple(
                 title=response.title,
                 summary=response.simple_result.summary,
                 result=response.simple_result.result,
-                source_task_id=source_task_id
+                source_task_id=source_task_id,
+                page_content=self._full_result_content(response),
+                page_id=page_id
             )
         elif response.difficulty == "complex" and response.complex_result:
             return await notion_service.create_review_task_complex(
@@ -271,7 +514,8 @@ class TaskProcessor:
                 prompt_for_claude_code=response.complex_result.prompt_for_claude_code,
                 estimated_time=response.complex_result.estimated_time,
                 reason=response.complex_result.reason,
-                source_task_id=source_task_id
+                source_task_id=source_task_id,
+                page_id=page_id
             )
         else:
             # Fallback: create simple task with available info
@@ -279,7 +523,9 @@ class TaskProcessor:
                 title=response.title,
                 summary="無法解析完整回應",
                 result=response.line_message,
-                source_task_id=source_task_id
+                source_task_id=source_task_id,
+                page_content=self._full_result_content(response),
+                page_id=page_id
             )
 
     async def _process_memory_updates(self, response: ClaudeResponse) -> None:
@@ -321,3 +567,5 @@ class TaskProcessor:
 
 
 task_processor = TaskProcessor()
+
+stage2_queue.register("claude_code", task_processor.run_stage2, pass_job_id=True)
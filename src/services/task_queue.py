@@ -0,0 +1,610 @@
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+from src.config import settings
+from src.constants import (
+    TASK_QUEUE_DB_FILENAME,
+    TASK_QUEUE_LEASE_SECONDS,
+    TASK_QUEUE_POLL_INTERVAL_SECONDS,
+    TASK_QUEUE_RETENTION_DAYS,
+    TASK_QUEUE_RETRY_BASE_SECONDS,
+    TASK_QUEUE_RETRY_MAX_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[..., Awaitable[Any]]
+JobMerger = Callable[[dict, dict], Optional[dict]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL DEFAULT 'tasks',
+    kind TEXT NOT NULL,
+    order_key TEXT,
+    coalesce_key TEXT,
+    unique_key TEXT,
+    payload TEXT NOT NULL,
+    checkpoint TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (queue, status, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_order_key ON jobs (queue, order_key, id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_unique_key ON jobs (queue, unique_key);
+"""
+
+
+class RetryJob(Exception):
+    """Handler 拋出此例外表示暫時性失敗，任務會延後重試（計入嘗試次數）
+
+    retry_after 為 None 時依嘗試次數指數退避（含 jitter）。
+    count_attempt=False 表示任務還在等待外部結果（例如輪詢 Message Batch），
+    不是失敗：於 retry_after 後再執行，不計入嘗試次數。
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, count_attempt: bool = True):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.count_attempt = count_attempt
+
+
+class JobCheckpoint:
+    """
+    任務的執行進度（存在 jobs.checkpoint，以 job ID 為 key）
+
+    租約逾期或重啟後任務會從頭重新執行，handler 以 checkpoint 略過已完成的步驟
+    （例如已建立的 Notion 頁面），避免重複的副作用。job_id 為 None（不經佇列直接呼叫）時只存在記憶體。
+    """
+
+    def __init__(self, queue: Optional["TaskQueue"], job_id: Optional[int], values: dict):
+        self._queue = queue
+        self.job_id = job_id
+        self.values = values
+        self._lock = asyncio.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.values.get(key, default)
+
+    async def save(self, **values) -> None:
+        """更新進度（合併到既有的值）並寫入磁碟"""
+        self.values.update(values)
+        if self._queue is None or self.job_id is None:
+            return
+        # 依呼叫順序寫入，並行的 save 不會以較舊的內容覆蓋較新的內容
+        async with self._lock:
+            data = json.dumps(self.values, ensure_ascii=False)
+            await asyncio.to_thread(self._queue._sync_save_checkpoint, self.job_id, data)
+
+
+class TaskQueue:
+    """
+    持久化任務佇列（SQLite）
+
+    Webhook 將任務寫入佇列後立即返回，由固定數量的 worker 依序取出執行：
+    - 任務存在磁碟上，程序重啟（部署、launchctl kickstart）後會繼續處理
+    - Worker 取得任務時取得租約，執行期間持續續約；
+      租約逾期代表 worker 已死亡，任務會被其他 worker 回收
+    - 回收次數達 max_attempts 後標記為 failed，避免毒任務無限循環
+    - Handler 拋出例外視為最終失敗（task_processor 已自行通知錯誤並清理 Notion 頁面）；
+      拋出 RetryJob 時延後重試，嘗試次數用盡後標記為 failed（count_attempt=False 的等待不計入）
+    - failed 任務保留 TASK_QUEUE_RETENTION_DAYS 天，可用 failed_jobs() 檢視（dead-letter）
+
+    多個佇列共用同一個 DB 檔，以 name 區分，各自擁有獨立的 worker pool，
+    避免短任務（webhook 事件）被長任務（Claude Code）卡住。
+
+    帶有 order_key 的任務（例如同一個 userId 的事件）依寫入順序逐一執行：
+    同一個 key 前面還有未完成的任務時，後面的任務不會被取出。
+
+    帶有 delay 的任務在 run_at 之前不會被取出；若同時指定 coalesce_key，
+    等待期間寫入的同 key 任務會以 register 時提供的 merge 函式合併進同一個任務，
+    並延後 run_at（debounce），但不超過建立時間 + max_delay；不帶 delay 的任務合併後立即執行。
+
+    帶有 unique_key 的任務在同一個佇列中只會寫入一次（重複寫入回傳既有任務 ID），
+    讓重新執行的 handler 可以安全地再次排入後續任務。
+    register 時指定 pass_job_id=True 的 handler 會收到 job_id，可用 load_checkpoint() 記錄進度。
+    """
+
+    def __init__(
+        self,
+        name: str = "tasks",
+        worker_count: Optional[int] = None,
+        max_attempts: Optional[int] = None
+    ):
+        self.name = name
+        self.db_path = settings.data_path / TASK_QUEUE_DB_FILENAME
+        self.worker_count = worker_count or settings.task_queue_workers
+        self.max_attempts = max_attempts or settings.task_queue_max_attempts
+        self._handlers: dict[str, JobHandler] = {}
+        self._mergers: dict[str, JobMerger] = {}
+        self._pass_job_id: set[str] = set()
+        self._workers: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._instance_id = uuid.uuid4().hex[:8]
+        self._initialized = False
+
+    # ==================== SQLite 輔助方法 ====================
+
+    @contextmanager
+    def _connect(self):
+        """開啟 SQLite 連線（每次操作獨立連線，供 to_thread 使用）"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self) -> None:
+        """建立資料表並清除過期的已完成任務"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (
+                ("order_key", "TEXT"),
+                ("coalesce_key", "TEXT"),
+                ("run_at", "REAL"),
+                ("unique_key", "TEXT"),
+                ("checkpoint", "TEXT"),
+            ):
+                if columns and column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+            conn.executescript(_SCHEMA)
+            cutoff = time.time() - TASK_QUEUE_RETENTION_DAYS * 86400
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (cutoff,)
+            )
+        self._initialized = True
+
+    def _ensure_db(self) -> None:
+        if not self._initialized:
+            self._init_db()
+
+    def _sync_enqueue(
+        self,
+        kind: str,
+        payloads: list[dict],
+        order_keys: list[Optional[str]],
+        delay: float = 0,
+        coalesce_key: Optional[str] = None,
+        max_delay: Optional[float] = None,
+        unique_keys: Optional[list[Optional[str]]] = None
+    ) -> list[int]:
+        """同步寫入任務（單一交易，內部使用）"""
+        self._ensure_db()
+        now = time.time()
+        run_at = now + delay if delay > 0 else None
+        merge = self._mergers.get(kind)
+        unique_keys = unique_keys or [None] * len(payloads)
+        job_ids = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for payload, order_key, unique_key in zip(payloads, order_keys, unique_keys):
+                if unique_key is not None:
+                    existing = conn.execute(
+                        "SELECT id FROM jobs WHERE queue = ? AND unique_key = ?", (self.name, unique_key)
+                    ).fetchone()
+                    if existing is not None:
+                        logger.info(f"略過重複的任務 {self.name}: {unique_key}（既有任務 #{existing['id']}）")
+                        job_ids.append(existing["id"])
+                        continue
+
+                if coalesce_key is not None and merge is not None:
+                    # 只合併尚未嘗試過的延遲任務（重試中的任務 payload 已送出過，不可更動）
+                    existing = conn.execute(
+                        "SELECT id, payload, created_at FROM jobs "
+                        "WHERE queue = ? AND kind = ? AND coalesce_key = ? "
+                        "AND status = 'pending' AND attempts = 0 AND run_at > ? ORDER BY id DESC LIMIT 1",
+                        (self.name, kind, coalesce_key, now)
+                    ).fetchone()
+                    if existing is not None:
+                        merged = merge(json.loads(existing["payload"]), payload)
+                        if merged is not None:
+                            new_run_at = run_at
+                            if max_delay is not None and run_at is not None:
+                                new_run_at = min(run_at, existing["created_at"] + max_delay)
+                            conn.execute(
+                                "UPDATE jobs SET payload = ?, run_at = ?, updated_at = ? WHERE id = ?",
+                                (json.dumps(merged, ensure_ascii=False), new_run_at, now, existing["id"])
+                            )
+                            job_ids.append(existing["id"])
+                            continue
+                        if run_at is None:
+                            # 無法合併的立即任務：同 key 的延遲任務一併提前，不讓它擋住後面的任務
+                            conn.execute(
+                                "UPDATE jobs SET run_at = NULL, updated_at = ? WHERE id = ?",
+                                (now, existing["id"])
+                            )
+
+                cursor = conn.execute(
+                    "INSERT INTO jobs (queue, kind, order_key, coalesce_key, unique_key, payload, run_at, "
+                    "max_attempts, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.name, kind, order_key, coalesce_key, unique_key, json.dumps(payload, ensure_ascii=False),
+                     run_at, self.max_attempts, now, now)
+                )
+                job_ids.append(cursor.lastrowid)
+            conn.execute("COMMIT")
+        return job_ids
+
+    def _sync_claim(self, owner: str) -> tuple[Optional[sqlite3.Row], Optional[float]]:
+        """取得下一個可執行任務（已到 run_at 的 pending 或租約逾期的 running）
+
+        沒有可執行任務時回傳 (None, 下一個延遲任務的 run_at)。
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = conn.execute(
+                        "SELECT * FROM jobs j WHERE queue = ? "
+                        "AND ((status = 'pending' AND (run_at IS NULL OR run_at <= ?)) "
+                        "     OR (status = 'running' AND lease_expires_at < ?)) "
+                        "AND (order_key IS NULL OR NOT EXISTS ("
+                        "    SELECT 1 FROM jobs k WHERE k.queue = j.queue AND k.order_key = j.order_key "
+                        "    AND k.id < j.id AND k.status IN ('pending', 'running'))) "
+                        "ORDER BY id LIMIT 1",
+                        (self.name, now, now)
+                    ).fetchone()
+                    if row is None:
+                        next_run_at = conn.execute(
+                            "SELECT MIN(run_at) FROM jobs WHERE queue = ? AND status = 'pending'",
+                            (self.name,)
+                        ).fetchone()[0]
+                        conn.execute("COMMIT")
+                        return None, next_run_at
+
+                    if row["attempts"] >= row["max_attempts"]:
+                        # 已被回收太多次，不再嘗試
+                        conn.execute(
+                            "UPDATE jobs SET status = 'failed', lease_owner = NULL, "
+                            "last_error = COALESCE(last_error, 'worker lost too many times'), "
+                            "updated_at = ? WHERE id = ?",
+                            (now, row["id"])
+                        )
+                        logger.error(f"任務 #{row['id']} 已達最大嘗試次數，標記為 failed")
+                        continue
+
+                    if row["status"] == "running":
+                        logger.warning(
+                            f"回收任務 #{row['id']}（原 worker {row['lease_owner']} 租約逾期）"
+                        )
+
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                        "lease_owner = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                        (owner, now + TASK_QUEUE_LEASE_SECONDS, now, row["id"])
+                    )
+                    conn.execute("COMMIT")
+                    return row, None
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _sync_renew(self, job_id: int, owner: str) -> None:
+        """續約（內部使用）"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (now + TASK_QUEUE_LEASE_SECONDS, now, job_id, owner)
+            )
+
+    def _sync_finish(self, job_id: int, owner: str, status: str, error: Optional[str] = None) -> None:
+        """標記任務結束（done / failed）"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, lease_owner = NULL, "
+                "lease_expires_at = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (status, error, time.time(), job_id, owner)
+            )
+
+    def _sync_retry(
+        self, job_id: int, owner: str, run_at: float, error: str, count_attempt: bool = True
+    ) -> None:
+        """暫時性失敗，任務回到 pending 並於 run_at 後重試（count_attempt=False 時退還這次嘗試）"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', run_at = ?, last_error = ?, lease_owner = NULL, "
+                "lease_expires_at = NULL, attempts = attempts - ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (run_at, error, 0 if count_attempt else 1, time.time(), job_id, owner)
+            )
+
+    def _sync_release(self, job_id: int, owner: str) -> None:
+        """正常關機時歸還任務，不計入嘗試次數"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = MAX(attempts - 1, 0), "
+                "lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (time.time(), job_id, owner)
+            )
+
+    def _sync_load_checkpoint(self, job_id: int) -> dict:
+        self._ensure_db()
+        with self._connect() as conn:
+            row = conn.execute("SELECT checkpoint FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["checkpoint"]) if row is not None and row["checkpoint"] else {}
+
+    def _sync_save_checkpoint(self, job_id: int, data: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET checkpoint = ?, updated_at = ? WHERE id = ?",
+                (data, time.time(), job_id)
+            )
+
+    def _sync_stats(self) -> dict:
+        """依狀態統計任務數量"""
+        self._ensure_db()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs WHERE queue = ? GROUP BY status",
+                (self.name,)
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def _sync_backlog(self) -> dict:
+        """統計可執行的 pending（已到 run_at）、running 與尚未到 run_at 的 waiting 任務數"""
+        self._ensure_db()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT "
+                "COALESCE(SUM(status = 'pending' AND (run_at IS NULL OR run_at <= ?)), 0) AS pending, "
+                "COALESCE(SUM(status = 'running'), 0) AS running, "
+                "COALESCE(SUM(status = 'pending' AND run_at > ?), 0) AS waiting "
+                "FROM jobs WHERE queue = ? AND status IN ('pending', 'running')",
+                (time.time(), time.time(), self.name)
+            ).fetchone()
+        return dict(row)
+
+    def _sync_failed_jobs(self, limit: int) -> list[dict]:
+        """最近失敗的任務（新到舊），不含 payload（可能有使用者輸入、userId、reply token）"""
+        self._ensure_db()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, kind, attempts, last_error, created_at, updated_at FROM jobs "
+                "WHERE queue = ? AND status = 'failed' ORDER BY updated_at DESC LIMIT ?",
+                (self.name, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    # ==================== 公開 API ====================
+
+    def register(
+        self,
+        kind: str,
+        handler: JobHandler,
+        merge: Optional[JobMerger] = None,
+        pass_job_id: bool = False
+    ) -> None:
+        """註冊任務類型對應的 handler（payload 會以 keyword arguments 傳入）
+
+        merge(existing_payload, new_payload) 用於合併 debounce 期間同 coalesce_key 的任務，
+        回傳 None 表示放不進既有任務，另外寫入新任務。
+        pass_job_id=True 時另外以 job_id 傳入任務 ID（供 load_checkpoint 使用）。
+        """
+        self._handlers[kind] = handler
+        if merge is not None:
+            self._mergers[kind] = merge
+        if pass_job_id:
+            self._pass_job_id.add(kind)
+
+    async def enqueue(
+        self,
+        kind: str,
+        order_key: Optional[str] = None,
+        delay: float = 0,
+        coalesce_key: Optional[str] = None,
+        max_delay: Optional[float] = None,
+        unique_key: Optional[str] = None,
+        **payload
+    ) -> int:
+        """將任務寫入佇列，回傳 job ID（與既有任務合併時回傳該任務 ID）
+
+        Args:
+            kind: 任務類型（需先 register）
+            order_key: 排序 key，見 enqueue_many
+            delay: 延遲秒數，run_at 之前不會被取出
+            coalesce_key: 延遲期間同 key 的任務合併為一個（需 register merge 函式）
+            max_delay: 合併時 run_at 最多延後到建立後幾秒
+            unique_key: 同一個佇列中已有相同 unique_key 的任務時不再寫入，回傳既有任務 ID
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_ids = await asyncio.to_thread(
+            self._sync_enqueue, kind, [payload], [order_key], delay, coalesce_key, max_delay, [unique_key]
+        )
+        logger.info(f"任務已排入佇列 {self.name}: #{job_ids[0]} ({kind})")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_ids[0]
+
+    async def enqueue_many(
+        self,
+        kind: str,
+        payloads: list[dict],
+        order_keys: Optional[list[Optional[str]]] = None,
+        unique_keys: Optional[list[Optional[str]]] = None
+    ) -> list[int]:
+        """以單一交易寫入多個任務，回傳 job ID 清單
+
+        Args:
+            kind: 任務類型（需先 register）
+            payloads: 每個任務的參數
+            order_keys: 每個任務的排序 key，同一個 key 的任務依序執行（None 表示不限制）
+            unique_keys: 每個任務的 unique_key；查重與寫入在同一個交易內完成，重複的任務不再寫入
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if not payloads:
+            return []
+        order_keys = order_keys or [None] * len(payloads)
+        job_ids = await asyncio.to_thread(
+            self._sync_enqueue, kind, payloads, order_keys, 0, None, None, unique_keys
+        )
+        logger.info(f"任務已排入佇列 {self.name}: {job_ids} ({kind})")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_ids
+
+    async def load_checkpoint(self, job_id: Optional[int]) -> JobCheckpoint:
+        """讀取任務的執行進度（job_id 為 None 時回傳只存在記憶體的空進度）"""
+        values = await asyncio.to_thread(self._sync_load_checkpoint, job_id) if job_id is not None else {}
+        return JobCheckpoint(self, job_id, values)
+
+    async def stats(self) -> dict:
+        """取得佇列統計（pending / running / done / failed）"""
+        return await asyncio.to_thread(self._sync_stats)
+
+    async def backlog(self) -> dict:
+        """取得目前的工作量：可執行的 pending、running 與等待 run_at 的 waiting（延後重試、等待 batch 結果）"""
+        return await asyncio.to_thread(self._sync_backlog)
+
+    async def failed_jobs(self, limit: int = 50) -> list[dict]:
+        """取得最近失敗的任務，供檢視 dead-letter（只含 ID、錯誤與嘗試次數，payload 留在 DB）"""
+        return await asyncio.to_thread(self._sync_failed_jobs, limit)
+
+    async def depth(self) -> int:
+        """尚未完成的任務數（pending + running）"""
+        stats = await self.stats()
+        return stats.get("pending", 0) + stats.get("running", 0)
+
+    @property
+    def running(self) -> bool:
+        """Worker 是否已啟動"""
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        """啟動 worker（於 app lifespan 呼叫）"""
+        await asyncio.to_thread(self._ensure_db)
+        self._wakeup = asyncio.Event()
+        for i in range(self.worker_count):
+            owner = f"{self.name}-{self._instance_id}-{i}"
+            self._workers.append(asyncio.create_task(self._worker_loop(owner)))
+        logger.info(f"任務佇列 {self.name} 啟動: {self.worker_count} 個 worker，DB: {self.db_path}")
+
+    async def stop(self) -> None:
+        """停止 worker，執行中的任務歸還佇列待下次啟動處理"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        logger.info(f"任務佇列 {self.name} 已停止")
+
+    # ==================== Worker ====================
+
+    async def _worker_loop(self, owner: str) -> None:
+        """持續取出並執行任務"""
+        while True:
+            # 先清除再取任務，避免錯過取任務期間寫入的通知
+            self._wakeup.clear()
+            try:
+                job, next_run_at = await asyncio.to_thread(self._sync_claim, owner)
+            except Exception as e:
+                logger.error(f"Worker {owner} 取得任務失敗: {e}", exc_info=True)
+                job, next_run_at = None, None
+
+            if job is None:
+                timeout = TASK_QUEUE_POLL_INTERVAL_SECONDS
+                if next_run_at is not None:
+                    timeout = min(timeout, max(next_run_at - time.time(), 0.05))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run_job(job, owner)
+
+    async def _heartbeat(self, job_id: int, owner: str) -> None:
+        """執行期間定期續約"""
+        while True:
+            await asyncio.sleep(TASK_QUEUE_LEASE_SECONDS / 3)
+            try:
+                await asyncio.to_thread(self._sync_renew, job_id, owner)
+            except Exception as e:
+                logger.warning(f"任務 #{job_id} 續約失敗: {e}")
+
+    async def _run_job(self, job: sqlite3.Row, owner: str) -> None:
+        """執行單一任務並記錄結果"""
+        job_id = job["id"]
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            logger.error(f"任務 #{job_id} 類型未註冊: {job['kind']}")
+            await asyncio.to_thread(
+                self._sync_finish, job_id, owner, "failed", f"Unknown job kind: {job['kind']}"
+            )
+            return
+
+        logger.info(f"Worker {owner} 開始執行任務 #{job_id}（第 {job['attempts'] + 1} 次）")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, owner))
+        payload = json.loads(job["payload"])
+        if job["kind"] in self._pass_job_id:
+            payload["job_id"] = job_id
+        try:
+            await handler(**payload)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self._sync_release, job_id, owner)
+            logger.info(f"任務 #{job_id} 已歸還佇列（服務關閉）")
+            raise
+        except RetryJob as e:
+            attempts = job["attempts"] + 1
+            if not e.count_attempt:
+                logger.info(f"任務 #{job_id} 等待中，{e.retry_after or 0:.0f} 秒後再執行: {e}")
+                await asyncio.to_thread(
+                    self._sync_retry, job_id, owner, time.time() + (e.retry_after or 0), str(e)[:500], False
+                )
+            elif attempts >= job["max_attempts"]:
+                logger.error(f"任務 #{job_id} 重試 {attempts} 次仍失敗: {e}")
+                await asyncio.to_thread(self._sync_finish, job_id, owner, "failed", str(e)[:500])
+            else:
+                delay = e.retry_after
+                if delay is None:
+                    delay = min(TASK_QUEUE_RETRY_BASE_SECONDS * 2 ** (attempts - 1), TASK_QUEUE_RETRY_MAX_SECONDS)
+                    delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"任務 #{job_id} 暫時失敗，{delay:.1f} 秒後重試: {e}")
+                await asyncio.to_thread(
+                    self._sync_retry, job_id, owner, time.time() + delay, str(e)[:500]
+                )
+        except Exception as e:
+            logger.error(f"任務 #{job_id} 執行失敗: {e}", exc_info=True)
+            await asyncio.to_thread(self._sync_finish, job_id, owner, "failed", str(e)[:500])
+        else:
+            await asyncio.to_thread(self._sync_finish, job_id, owner, "done")
+            logger.info(f"任務 #{job_id} 完成")
+        finally:
+            heartbeat.cancel()
+
+
+task_queue = TaskQueue()
+
+# Claude Code（Stage 2）可能執行數小時，與 Stage 1 分開，不佔用 task_queue 的 worker
+stage2_queue = TaskQueue(name="stage2", worker_count=settings.task_queue_stage2_workers)
+
+# Webhook 事件的 out-of-band 處理（回覆、通知、記錄），與長任務分開
+event_queue = TaskQueue(name="events", worker_count=settings.line_event_workers)
+
+# LINE push 發送佇列（429 / 5xx 退避重試，失敗的訊息留在佇列中供檢視）
+outbound_queue = TaskQueue(
+    name="outbound",
+    worker_count=settings.line_outbound_workers,
+    max_attempts=settings.line_outbound_max_attempts
+)
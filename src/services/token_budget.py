@@ -0,0 +1,191 @@
+"""
+Stage 1 prompt 的 token 預算
+
+以本地估算計算各段 prompt 的 token 數（不額外呼叫 API），超過 anthropic_input_token_budget 時
+依優先順序縮減：先丟棄 low、再丟棄 medium 重要性的記憶，接著截斷附件內容（保留頭尾），
+最後才截斷 high 記憶；使用者輸入與 system prompt 不縮減。
+max_tokens 依預期的回應類型選擇：短問題給較小的輸出上限，附件需完整帶入
+prompt_for_claude_code 時依附件大小放寬（上限為 CLAUDE_MAX_TOKENS）。
+"""
+
+import bisect
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from src.config import settings
+from src.constants import (
+    CLAUDE_DEFAULT_REPLY_MAX_TOKENS,
+    CLAUDE_MAX_TOKENS,
+    CLAUDE_SHORT_INPUT_TOKENS,
+    CLAUDE_SHORT_REPLY_MAX_TOKENS,
+)
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# CJK 字元（含全形標點）大約一字一 token，其餘文字大約四字元一 token
+# 以連續的一段為單位比對，比逐字比對快很多（中文內容尤其明顯）
+_WIDE_RUNS = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]+")
+
+# 記憶的丟棄順序（越前面越先丟棄）
+_MEMORY_DROP_ORDER = ("low", "medium")
+
+_TRUNCATION_MARKER = "\n\n⋯（內容過長，已省略約 {tokens} tokens）⋯\n\n"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """估計文字的 token 數（保守估計，略高於實際值）"""
+    if not text:
+        return 0
+    wide = sum(map(len, _WIDE_RUNS.findall(text)))
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def _longest_prefix(text: str, max_tokens: int) -> int:
+    """估計 token 數不超過 max_tokens 的最長開頭字元數"""
+    # 每個字元至少 1/4 token，更長的開頭不可能符合
+    region = text[:max_tokens * 4 + 4]
+    starts, ends, wide_before = [], [], []
+    wide = 0
+    for match in _WIDE_RUNS.finditer(region):
+        starts.append(match.start())
+        ends.append(match.end())
+        wide_before.append(wide)
+        wide += match.end() - match.start()
+
+    def tokens(length: int) -> int:
+        i = bisect.bisect_left(starts, length) - 1
+        wide = 0 if i < 0 else wide_before[i] + min(length, ends[i]) - starts[i]
+        return wide + math.ceil((length - wide) / 4)
+
+    low, high = 0, len(region)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if tokens(mid) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def truncate_middle(text: str, max_tokens: int) -> str:
+    """保留頭尾、省略中間，使估計的 token 數（含省略標記）不超過 max_tokens"""
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    # 標記中的數字不會超過 total 的位數，以此估計標記本身的 token 數
+    keep_tokens = max_tokens - estimate_tokens(_TRUNCATION_MARKER.format(tokens=total))
+    if keep_tokens <= 0:
+        return text[:_longest_prefix(text, max_tokens)]
+
+    # 頭部多保留一些（通常是標題與說明）；分段估計的合計不低於合併後的估計
+    head = text[:_longest_prefix(text, keep_tokens * 2 // 3)]
+    tail_tokens = keep_tokens - estimate_tokens(head)
+    tail_region = text[len(head):][-(tail_tokens * 4 + 4):]
+    tail_length = _longest_prefix(tail_region[::-1], tail_tokens)
+    tail = tail_region[len(tail_region) - tail_length:]
+    marker = _TRUNCATION_MARKER.format(tokens=total - estimate_tokens(head) - estimate_tokens(tail))
+    return head + marker + tail
+
+
+@dataclass(slots=True)
+class PromptBudget:
+    """縮減後的 prompt 內容與各段 token 數"""
+    memories_text: str
+    page_content: Optional[str]
+    max_tokens: int
+    sections: dict[str, int] = field(default_factory=dict)
+    dropped_memories: int = 0
+    truncated: list[str] = field(default_factory=list)
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(self.sections.values())
+
+    def describe(self) -> str:
+        parts = ", ".join(f"{name} {tokens}" for name, tokens in self.sections.items())
+        notes = []
+        if self.dropped_memories:
+            notes.append(f"丟棄 {self.dropped_memories} 則記憶")
+        if self.truncated:
+            notes.append(f"截斷 {'、'.join(self.truncated)}")
+        suffix = f"（{'；'.join(notes)}）" if notes else ""
+        return f"{parts}，合計 {self.input_tokens}，max_tokens {self.max_tokens}{suffix}"
+
+
+class TokenBudgeter:
+    """依 anthropic_input_token_budget 縮減 Stage 1 prompt 並選擇 max_tokens"""
+
+    def __init__(self):
+        self.input_budget = settings.anthropic_input_token_budget
+
+    def plan(
+        self,
+        system_prompt: str,
+        user_input: str,
+        memories: list[dict],
+        page_content: Optional[str],
+        format_memories: Callable[[list[dict]], str]
+    ) -> PromptBudget:
+        """回傳符合預算的記憶與附件內容，並記錄各段 token 數"""
+        fixed = estimate_tokens(system_prompt) + estimate_tokens(user_input)
+        kept = list(memories)
+        memory_tokens = estimate_tokens(format_memories(kept))
+        content_tokens = estimate_tokens(page_content)
+        budget = PromptBudget(memories_text="", page_content=page_content, max_tokens=0)
+
+        # 1. 依重要性由低到高丟棄記憶
+        for importance in _MEMORY_DROP_ORDER:
+            if fixed + memory_tokens + content_tokens <= self.input_budget:
+                break
+            remaining = [m for m in kept if m.get("importance") != importance]
+            budget.dropped_memories += len(kept) - len(remaining)
+            kept = remaining
+            memory_tokens = estimate_tokens(format_memories(kept))
+
+        # 2. 截斷附件內容
+        over = fixed + memory_tokens + content_tokens - self.input_budget
+        if over > 0 and page_content:
+            budget.page_content = truncate_middle(page_content, max(0, content_tokens - over))
+            content_tokens = estimate_tokens(budget.page_content)
+            budget.truncated.append("附件")
+
+        # 3. 最後才截斷剩下的記憶
+        memories_text = format_memories(kept)
+        over = fixed + memory_tokens + content_tokens - self.input_budget
+        if over > 0 and kept:
+            memories_text = truncate_middle(memories_text, max(0, memory_tokens - over))
+            budget.truncated.append("記憶")
+
+        budget.memories_text = memories_text
+        budget.sections = {
+            "system": estimate_tokens(system_prompt),
+            "memories": estimate_tokens(memories_text),
+            "attachment": content_tokens,
+            "task": estimate_tokens(user_input),
+        }
+        budget.max_tokens = self.output_tokens(user_input, budget.page_content)
+        if budget.dropped_memories or budget.truncated:
+            metrics.incr("claude_prompt_trimmed")
+        return budget
+
+    @staticmethod
+    def output_tokens(user_input: str, page_content: Optional[str]) -> int:
+        """
+        依預期回應類型選擇 max_tokens
+
+        - 有附件：複雜任務的 prompt_for_claude_code 需完整帶入附件，依附件大小放寬
+        - 短問題且沒有附件：多半是簡單任務的簡短回答
+        - 其他：預設值
+        """
+        if page_content:
+            return min(CLAUDE_MAX_TOKENS, CLAUDE_DEFAULT_REPLY_MAX_TOKENS + estimate_tokens(page_content))
+        if estimate_tokens(user_input) <= CLAUDE_SHORT_INPUT_TOKENS:
+            return CLAUDE_SHORT_REPLY_MAX_TOKENS
+        return CLAUDE_DEFAULT_REPLY_MAX_TOKENS
+
+
+token_budget = TokenBudgeter()
@@ -0,0 +1,56 @@
+"""
+LINE webhook 簽名驗證與解析
+
+直接在原始 bytes 上計算 HMAC（不做 decode / encode 來回轉換），以常數時間比對簽名，
+有安裝 orjson 時使用 orjson 解析，最後轉為 LineEvent。
+此模組不依賴 settings，channel secret 由呼叫端傳入，方便 benchmark 獨立執行。
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+
+from src.models.line_event import LineEvent
+
+try:
+    import orjson
+except ImportError:  # orjson 為選用套件
+    orjson = None
+
+
+class WebhookSignatureError(ValueError):
+    """X-Line-Signature 與內容不符"""
+
+
+class WebhookPayloadError(ValueError):
+    """Webhook body 不是合法的 JSON 物件"""
+
+
+def json_loads(body: bytes):
+    """解析 JSON（優先使用 orjson）"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def verify_signature(body: bytes, signature: str, channel_secret: bytes) -> bool:
+    """以常數時間比對 LINE 簽名"""
+    digest = hmac.new(channel_secret, body, hashlib.sha256).digest()
+    expected = base64.b64encode(digest)
+    return hmac.compare_digest(expected, signature.encode("ascii", errors="replace"))
+
+
+def parse_webhook(body: bytes, signature: str, channel_secret: bytes) -> list[LineEvent]:
+    """驗證簽名並解析事件（先驗證再解析，未通過驗證的內容不會被解析）"""
+    if not verify_signature(body, signature, channel_secret):
+        raise WebhookSignatureError("Invalid signature")
+
+    try:
+        payload = json_loads(body)
+    except ValueError as e:
+        raise WebhookPayloadError(f"Invalid JSON: {e}") from e
+    if not isinstance(payload, dict):
+        raise WebhookPayloadError("Webhook body must be a JSON object")
+
+    return [LineEvent.from_dict(event) for event in payload.get("events", [])]
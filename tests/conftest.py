@@ -0,0 +1,21 @@
+"""Test settings: dummy credentials and an isolated data directory.
+
+Set before any src module is imported, since src.config reads the environment at import time.
+"""
+
+import os
+import tempfile
+
+for name in (
+    "LINE_CHANNEL_SECRET",
+    "LINE_CHANNEL_ACCESS_TOKEN",
+    "JOEY_LINE_USER_ID",
+    "NOTION_API_KEY",
+    "NOTION_INBOX_DB_ID",
+    "NOTION_REVIEW_DB_ID",
+    "NOTION_MEMORY_DB_ID",
+    "ANTHROPIC_API_KEY",
+):
+    os.environ.setdefault(name, "test")
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="joey-ai-agent-test-")
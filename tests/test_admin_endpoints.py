@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from src.api import health
+from src.config import settings
+from src.services.task_queue import TaskQueue
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    queue = TaskQueue(name="outbound", worker_count=1, max_attempts=1)
+    queue.db_path = tmp_path / "queue.db"
+    monkeypatch.setitem(health.QUEUES, "outbound", queue)
+    app = FastAPI()
+    app.include_router(health.router)
+    return app, queue
+
+
+def request_from(host: str, headers: dict = None) -> Request:
+    return Request({
+        "type": "http",
+        "client": (host, 50000),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    })
+
+
+def test_admin_endpoints_require_the_token_when_configured(app, monkeypatch):
+    app, _ = app
+    monkeypatch.setattr(settings, "admin_api_token", "s3cret")
+    client = TestClient(app)
+
+    assert client.get("/quota").status_code == 401
+    assert client.get("/quota", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert client.get("/quota", headers={"X-Admin-Token": "s3cret"}).status_code == 200
+    assert client.get("/health").status_code == 200
+
+
+def test_without_a_token_only_direct_local_requests_are_allowed(monkeypatch):
+    monkeypatch.setattr(settings, "admin_api_token", "")
+
+    health.require_admin(request_from("127.0.0.1"))
+    with pytest.raises(HTTPException) as remote:
+        health.require_admin(request_from("203.0.113.5"))
+    assert remote.value.status_code == 403
+    # Cloudflare Tunnel 轉發的請求同樣來自 localhost
+    with pytest.raises(HTTPException):
+        health.require_admin(request_from("127.0.0.1", {"CF-Connecting-IP": "203.0.113.5"}))
+
+
+def test_dead_letters_do_not_expose_payloads(app, monkeypatch):
+    app, queue = app
+    monkeypatch.setattr(settings, "admin_api_token", "s3cret")
+
+    async def broken(**payload):
+        raise ValueError("LINE HTTP 400")
+
+    queue.register("line_push", broken)
+
+    async def scenario():
+        await queue.enqueue("line_push", to="U123", messages=[{"type": "text", "text": "secret"}])
+        job, _ = await asyncio.to_thread(queue._sync_claim, "w1")
+        await queue._run_job(job, "w1")
+
+    asyncio.run(scenario())
+    response = TestClient(app).get("/dead-letters", headers={"X-Admin-Token": "s3cret"})
+    [job] = response.json()["jobs"]
+    assert job["last_error"] == "LINE HTTP 400"
+    assert job["attempts"] == 1
+    assert "payload" not in job
+    assert "U123" not in response.text
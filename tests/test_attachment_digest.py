@@ -0,0 +1,63 @@
+import asyncio
+from pathlib import Path
+
+from src.constants import ATTACHMENT_DIGEST_CHUNK_TOKENS
+from src.models.attachment import Attachment
+from src.services.attachment_digest import AttachmentDigester, split_chunks
+from src.services.attachment_store import AttachmentStore
+from src.services.claude_code_service import ClaudeCodeService
+from src.services.token_budget import estimate_tokens
+
+
+def test_chunks_stay_within_the_token_budget():
+    text = "\n\n".join(["段落" * 300] * 20 + ["x" * 50000])
+    chunks = split_chunks(text, chunk_tokens=1000)
+    assert all(estimate_tokens(chunk) <= 1000 for chunk in chunks)
+    assert "".join(chunks).replace("\n\n", "") == text.replace("\n\n", "")
+
+
+def test_chunk_count_is_capped_and_the_omission_reported():
+    digester = AttachmentDigester()
+    digester.max_chunks = 4
+    text = "\n\n".join(f"第 {i} 段 " + "內容" * 2000 for i in range(40))
+
+    chunks, omitted = digester.prepare_chunks(text)
+    assert len(chunks) == 4
+    assert all(estimate_tokens(chunk) <= ATTACHMENT_DIGEST_CHUNK_TOKENS for chunk in chunks)
+    assert omitted > 0
+    # 保留開頭與結尾
+    assert chunks[0].startswith("第 0 段") and chunks[-1].endswith("內容")
+
+
+def test_small_attachment_is_split_without_truncation():
+    digester = AttachmentDigester()
+    chunks, omitted = digester.prepare_chunks("短文字")
+    assert chunks == ["短文字"] and omitted == 0
+
+
+def test_original_files_reach_the_task_folder_by_path(tmp_path):
+    spooled = tmp_path / "spooled.txt"
+    spooled.write_text("附件內文" * 100, encoding="utf-8")
+    store = AttachmentStore()
+    store.root = tmp_path / "attachments"
+
+    attachment = Attachment(file_name="../notes.txt", path=str(spooled), size_bytes=spooled.stat().st_size)
+    directory = asyncio.run(store.keep_for_stage2("訊息內容", [attachment]))
+
+    task_folder = tmp_path / "task"
+    task_folder.mkdir()
+    note = ClaudeCodeService._copy_attachments(directory, task_folder)
+    assert "attachments/01_notes.txt" in note and "attachments/message.txt" in note
+    assert "附件內文" not in note
+    assert (task_folder / "attachments" / "01_notes.txt").read_text(encoding="utf-8") == spooled.read_text(encoding="utf-8")
+
+    asyncio.run(store.delete_stage2(directory))
+    assert not Path(directory).exists()
+
+
+def test_text_only_message_is_kept_without_attachments(tmp_path):
+    store = AttachmentStore()
+    store.root = tmp_path / "attachments"
+
+    directory = asyncio.run(store.keep_for_stage2("很長的訊息內容", None))
+    assert [path.name for path in Path(directory).iterdir()] == ["message.txt"]
@@ -0,0 +1,20 @@
+import asyncio
+import json
+
+from src.constants import AUDIT_LOG_BATCH_SIZE
+from src.services.audit_log import AuditLog
+
+
+def test_stop_writes_every_queued_record(tmp_path):
+    log = AuditLog()
+    log.path = tmp_path / "audit.jsonl"
+    total = AUDIT_LOG_BATCH_SIZE * 2 + 5
+
+    async def scenario():
+        for index in range(total):
+            log.record("text", index=index)
+        await log.stop()
+
+    asyncio.run(scenario())
+    lines = log.path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["index"] for line in lines] == list(range(total))
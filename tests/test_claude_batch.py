@@ -0,0 +1,135 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from anthropic.types import Message
+
+from src.services.claude_batch import BatchRequestError, MessageBatcher
+
+PARAMS = {"model": "m", "max_tokens": 10, "messages": [{"role": "user", "content": "hi"}]}
+
+
+def make_message(text: str) -> Message:
+    return Message.model_validate({
+        "id": "msg_1", "type": "message", "role": "assistant", "model": "m",
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn", "stop_sequence": None,
+        "usage": {"input_tokens": 1, "output_tokens": 1},
+    })
+
+
+class FakeBatches:
+    """只實作 MessageBatcher 用到的 batch 端點"""
+
+    def __init__(self):
+        self.created: list[list[str]] = []
+        self.ended = False
+
+    async def create(self, requests):
+        self.created.append([r["custom_id"] for r in requests])
+        return SimpleNamespace(id=f"batch-{len(self.created)}")
+
+    async def retrieve(self, batch_id):
+        return SimpleNamespace(processing_status="ended" if self.ended else "in_progress")
+
+    async def results(self, batch_id):
+        async def entries():
+            for custom_id in self.created[int(batch_id.split("-")[1]) - 1]:
+                if custom_id == "bad":
+                    result = SimpleNamespace(type="expired")
+                else:
+                    result = SimpleNamespace(type="succeeded", message=make_message(f"done {custom_id}"))
+                yield SimpleNamespace(custom_id=custom_id, result=result)
+        return entries()
+
+
+@pytest.fixture
+def batches():
+    return FakeBatches()
+
+
+def make_batcher(tmp_path, batches) -> MessageBatcher:
+    client = SimpleNamespace(messages=SimpleNamespace(batches=batches))
+    batcher = MessageBatcher(lambda: client)
+    batcher.db_path = tmp_path / "batches.db"
+    batcher.window_seconds = 0
+    batcher.poll_seconds = 0
+    return batcher
+
+
+def test_requests_are_submitted_once_and_resolved_by_polling(tmp_path, batches):
+    batcher = make_batcher(tmp_path, batches)
+
+    async def scenario():
+        batcher.window_seconds = 60
+        await batcher.submit("a", PARAMS)
+        await batcher.submit("bad", PARAMS)
+        assert batches.created == []  # 等待時間窗
+        batcher.window_seconds = 0
+        await batcher.submit("a", PARAMS)  # 重新執行的呼叫端不會重複送出
+        assert batches.created == [["a", "bad"]]
+        assert await batcher.result("a") is None
+        batches.ended = True
+        return await batcher.result("a")
+
+    message = asyncio.run(scenario())
+    assert message.content[0].text == "done a"
+    with pytest.raises(BatchRequestError, match="expired"):
+        asyncio.run(batcher.result("bad"))
+    assert batches.created == [["a", "bad"]]
+
+
+def test_batch_state_survives_a_restart(tmp_path, batches):
+    first = make_batcher(tmp_path, batches)
+    first.window_seconds = 60
+    asyncio.run(first.submit("a", PARAMS))
+    asyncio.run(first.close())
+
+    # 重啟後：時間窗已過的請求在下一次查詢時送出，結果以同一個 custom_id 取得
+    restarted = make_batcher(tmp_path, batches)
+    assert asyncio.run(restarted.result("a")) is None
+    assert batches.created == [["a"]]
+    batches.ended = True
+    assert asyncio.run(make_batcher(tmp_path, batches).result("a")).content[0].text == "done a"
+
+
+def test_unknown_request_raises(tmp_path, batches):
+    with pytest.raises(BatchRequestError):
+        asyncio.run(make_batcher(tmp_path, batches).result("missing"))
+
+
+def test_pending_deferred_task_is_polled_without_rereading_memories(tmp_path, batches, monkeypatch):
+    from src.services import task_processor as module
+    from src.services.task_queue import JobCheckpoint, RetryJob
+
+    memory_reads = []
+
+    async def get_all_memories():
+        memory_reads.append(1)
+        return []
+
+    checkpoint = JobCheckpoint(None, None, {"inbox_task_id": "inbox", "deferred_id": "task-1"})
+
+    async def load_checkpoint(job_id):
+        return checkpoint
+
+    batcher = make_batcher(tmp_path, batches)
+    monkeypatch.setattr(module.claude_service, "batcher", batcher)
+    monkeypatch.setattr(module.notion_service, "get_all_memories", get_all_memories)
+    monkeypatch.setattr(module.task_queue, "load_checkpoint", load_checkpoint)
+
+    async def scenario():
+        await batcher.submit("task-1", PARAMS)
+        with pytest.raises(RetryJob):
+            await module.task_processor.process_task("整理資料", deferred=True, job_id=1)
+
+    asyncio.run(scenario())
+    assert memory_reads == []
+    assert batches.created == [["task-1"]]
+
+
+def test_deferred_result_is_none_for_a_request_never_submitted(tmp_path, batches, monkeypatch):
+    from src.services.claude_service import claude_service
+
+    monkeypatch.setattr(claude_service, "batcher", make_batcher(tmp_path, batches))
+    assert asyncio.run(claude_service.deferred_result("missing")) is None
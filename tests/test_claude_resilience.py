@@ -0,0 +1,227 @@
+import asyncio
+
+import anthropic
+import httpx
+import pytest
+
+from src.constants import CLAUDE_HEDGE_WINDOW_SIZE
+from src.services.claude_resilience import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    ClaudeResilience,
+    RetryBudget,
+    classify_error,
+)
+
+
+def api_error(status: int) -> anthropic.APIStatusError:
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(status, request=request, headers={"retry-after": "0"})
+    error_class = {400: anthropic.BadRequestError, 429: anthropic.RateLimitError}.get(
+        status, anthropic.InternalServerError
+    )
+    return error_class(f"HTTP {status}", response=response, body=None)
+
+
+def test_errors_are_classified_by_status():
+    assert classify_error(api_error(429)) == "rate_limited"
+    assert classify_error(api_error(529)) == "overloaded"
+    assert classify_error(api_error(503)) == "server"
+    assert classify_error(api_error(400)) is None
+    assert classify_error(ValueError("bad json")) is None
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    for _ in range(2):
+        breaker.check()
+        breaker.record_failure()
+    assert breaker.state == CIRCUIT_CLOSED
+
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    # reset_seconds 之後只放行一個探測請求
+    breaker.opened_at -= 30
+    breaker.check()
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED and breaker.failures == 0
+    breaker.check()
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    breaker.opened_at -= 30
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_cancelled_probe_lets_the_next_request_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    breaker.check()
+    breaker.release()
+    breaker.check()
+
+
+def test_retry_budget_caps_retries_to_a_ratio_of_calls():
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+    for _ in range(10):
+        budget.deposit()
+    assert budget.tokens == 2
+
+
+@pytest.fixture
+def resilience():
+    r = ClaudeResilience()
+    r.max_retries = 3
+    r.hedging = False
+    r.budget = RetryBudget(ratio=0.1, max_tokens=10)
+    r.breaker = CircuitBreaker(failure_threshold=5, reset_seconds=30)
+    return r
+
+
+def failing_then(results: list):
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        result = results[len(calls) - 1]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return attempt, calls
+
+
+def test_retryable_errors_are_retried_until_success(resilience):
+    attempt, calls = failing_then([api_error(529), api_error(429), "ok"])
+    assert asyncio.run(resilience.call("test", attempt)) == "ok"
+    assert len(calls) == 3
+    assert resilience.breaker.failures == 0
+
+
+def test_client_errors_are_not_retried(resilience):
+    attempt, calls = failing_then([api_error(400), "ok"])
+    with pytest.raises(anthropic.BadRequestError):
+        asyncio.run(resilience.call("test", attempt))
+    assert len(calls) == 1
+    assert resilience.breaker.state == CIRCUIT_CLOSED
+
+
+def test_exhausted_budget_stops_retrying(resilience):
+    resilience.budget = RetryBudget(ratio=0, max_tokens=1)
+    resilience.budget.tokens = 1
+    attempt, calls = failing_then([api_error(503), api_error(503), "ok"])
+    with pytest.raises(anthropic.InternalServerError):
+        asyncio.run(resilience.call("test", attempt))
+    assert len(calls) == 2
+
+
+def test_open_breaker_fails_fast_without_calling_the_api(resilience):
+    resilience.breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    attempt, calls = failing_then([api_error(503)] * 5)
+    with pytest.raises(anthropic.InternalServerError):
+        asyncio.run(resilience.call("test", attempt))
+    assert len(calls) == 2  # 第二次失敗即開啟，不再重試
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilience.call("test", attempt))
+    assert len(calls) == 2
+
+
+def routing_service(fast_attempt):
+    """小模型呼叫 fast_attempt()，大模型回傳固定的 simple 回應"""
+    from types import SimpleNamespace
+
+    from src.services.claude_service import ClaudeService
+
+    service = ClaudeService()
+    service.fast_model = "fast"
+    service.model = "full"
+    service.resilience = {model: ClaudeResilience(name=model) for model in ("fast", "full")}
+    for resilience in service.resilience.values():
+        resilience.max_retries = 0
+        resilience.hedging = False
+        resilience.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30, name=resilience.breaker.name)
+    reply = '{"difficulty": "simple", "title": "t", "simple_result": {"summary": "s", "result": "r"}, ' \
+            '"memory_updates": [], "line_message": "ok"}'
+
+    async def create(**request):
+        if request["model"] == "fast":
+            return await fast_attempt()
+        return SimpleNamespace(
+            content=[SimpleNamespace(text=reply)], stop_reason="end_turn",
+            usage=SimpleNamespace(input_tokens=1, output_tokens=1)
+        )
+
+    service._client = SimpleNamespace(messages=SimpleNamespace(create=create))
+    return service
+
+
+def run_stage1(service):
+    return asyncio.run(service.process_task(user_input="hi", memories=[]))
+
+
+def test_fast_model_failures_do_not_open_the_full_model_breaker():
+    async def overloaded():
+        raise api_error(529)
+
+    service = routing_service(overloaded)
+    assert run_stage1(service).line_message == "ok"
+    assert service.resilience["fast"].breaker.state == CIRCUIT_OPEN
+    assert service.resilience["full"].breaker.state == CIRCUIT_CLOSED
+
+    # 小模型斷路器開啟中：不送出請求，直接改由大模型處理
+    assert run_stage1(service).line_message == "ok"
+    assert set(service.resilience_snapshot()) == {"fast", "full"}
+
+
+def test_unexpected_fast_route_errors_are_not_swallowed():
+    async def broken():
+        raise RuntimeError("bug")
+
+    with pytest.raises(RuntimeError):
+        run_stage1(routing_service(broken))
+
+
+def test_hedge_delay_is_the_p95_of_recent_attempts():
+    resilience = ClaudeResilience()
+
+    async def ok():
+        return "ok"
+
+    for _ in range(5):
+        asyncio.run(resilience._attempt("create", ok))
+    assert resilience._hedge_delay("create") is None  # 樣本不足
+
+    # 一般延遲 6-7 秒（直方圖 bucket 上限會把 p95 變成 10 秒）
+    window = resilience._latencies["create"]
+    window.clear()
+    window.extend([6000 + i * 10 for i in range(100)] + [60000] * 300)
+    assert len(window) == CLAUDE_HEDGE_WINDOW_SIZE
+    window.extend(6000 + i * 10 for i in range(CLAUDE_HEDGE_WINDOW_SIZE))
+    assert resilience._hedge_delay("create") == pytest.approx(7.89)
+    assert resilience._hedge_delay("stream") is None
@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import pytest
+
+from src.models.line_event import LineEvent
+from src.services.event_dedupe import EventDeduplicator
+from src.services.task_queue import TaskQueue
+
+
+def make_event(event_id: str, redelivery: bool = False) -> LineEvent:
+    return LineEvent.from_dict({
+        "type": "message",
+        "webhookEventId": event_id,
+        "deliveryContext": {"isRedelivery": redelivery},
+        "source": {"userId": "U1"},
+        "message": {"type": "text", "id": "m1", "text": "hi"},
+    })
+
+
+@pytest.fixture
+def dedupe(tmp_path):
+    d = EventDeduplicator()
+    d.db_path = tmp_path / "events.db"
+    return d
+
+
+def ids(events: list[LineEvent]) -> list[str]:
+    return [event.webhook_event_id for event in events]
+
+
+def test_filter_drops_duplicates_until_released(dedupe):
+    first = dedupe.filter([make_event("e1"), make_event("e2"), make_event("e1")])
+    assert ids(first) == ["e1", "e2"]
+    assert dedupe.filter([make_event("e1", redelivery=True)]) == []
+
+    dedupe.release(first)
+    assert ids(dedupe.filter([make_event("e1", redelivery=True)])) == ["e1"]
+
+
+def test_reserve_persists_across_restarts(dedupe, tmp_path):
+    assert ids(asyncio.run(dedupe.reserve([make_event("e1")]))) == ["e1"]
+
+    restarted = EventDeduplicator()
+    restarted.db_path = tmp_path / "events.db"
+    assert ids(asyncio.run(restarted.reserve([make_event("e1", redelivery=True), make_event("e2")]))) == ["e2"]
+    assert ids(asyncio.run(restarted.reserve([make_event("e2", redelivery=True)]))) == []
+    with restarted._connect() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_reserve_checks_disk_even_when_memory_is_cold(dedupe):
+    asyncio.run(dedupe.reserve([make_event("e1")]))
+    dedupe._seen.clear()
+    assert asyncio.run(dedupe.reserve([make_event("e1", redelivery=True)])) == []
+
+
+def test_expired_rows_are_pruned_on_insert(dedupe):
+    asyncio.run(dedupe.load())
+    with dedupe._connect() as conn:
+        conn.execute(
+            "INSERT INTO seen_events (event_id, seen_at) VALUES (?, ?)",
+            ("old", time.time() - dedupe.ttl_seconds - 1)
+        )
+
+    dedupe._pruned_at = 0
+    asyncio.run(dedupe.reserve([make_event("e1")]))
+    with dedupe._connect() as conn:
+        rows = {row[0] for row in conn.execute("SELECT event_id FROM seen_events")}
+    assert rows == {"e1"}
+
+
+def test_event_queue_unique_key_blocks_redelivery_after_restart(tmp_path):
+    queue = TaskQueue(name="events", worker_count=1)
+    queue.db_path = tmp_path / "queue.db"
+    queue.register("line_event", lambda event: None)
+
+    async def scenario():
+        first = await queue.enqueue_many("line_event", [{"event": {}}], ["U1"], ["e1"])
+        again = await queue.enqueue_many("line_event", [{"event": {}}, {"event": {}}], ["U1", "U1"], ["e1", "e2"])
+        return first, again
+
+    first, again = asyncio.run(scenario())
+    assert again[0] == first[0]
+    assert queue._sync_stats() == {"pending": 2}
+
+
+def test_only_redeliveries_are_looked_up_on_disk(dedupe):
+    asyncio.run(dedupe.reserve([make_event("e1")]))
+    dedupe._seen.clear()
+    # 首次送達的事件只寫入；LINE 標記為重送的事件才查磁碟
+    assert ids(asyncio.run(dedupe.reserve([make_event("e1")]))) == ["e1"]
+    dedupe._seen.clear()
+    assert asyncio.run(dedupe.reserve([make_event("e1", redelivery=True)])) == []
+
+
+@pytest.fixture
+def webhook(tmp_path, monkeypatch):
+    from src.api import line_webhook
+    from src.services.admission_control import AdmissionDecision
+    from src.services.task_queue import event_queue, task_queue
+
+    for queue in (event_queue, task_queue):
+        monkeypatch.setattr(queue, "db_path", tmp_path / "queue.db")
+        monkeypatch.setattr(queue, "_initialized", False)
+    acknowledged = []
+
+    async def admit(user_id):
+        return AdmissionDecision(admitted=True)
+
+    async def acknowledge(user_id, reply_token, decision, message):
+        acknowledged.append(reply_token)
+        return None
+
+    monkeypatch.setattr(line_webhook.admission_control, "admit", admit)
+    monkeypatch.setattr(line_webhook, "acknowledge", acknowledge)
+    return line_webhook, acknowledged
+
+
+def text_event(event_id: str) -> dict:
+    return {
+        "type": "message",
+        "webhookEventId": event_id,
+        "replyToken": "r1",
+        "source": {"userId": "test"},
+        "message": {"type": "text", "id": "m1", "text": "hi"},
+    }
+
+
+def test_rerun_event_job_does_not_acknowledge_or_enqueue_twice(webhook):
+    line_webhook, acknowledged = webhook
+    from src.services.task_queue import event_queue, task_queue
+
+    async def scenario():
+        [job_id] = await event_queue.enqueue_many("line_event", [{"event": text_event("e1")}], ["test"], ["e1"])
+        await line_webhook.process_queued_line_event(text_event("e1"), job_id=job_id)
+        # 租約逾期後重新執行
+        await line_webhook.process_queued_line_event(text_event("e1"), job_id=job_id)
+        # 排入任務後、記錄進度前當機：任務仍以 unique_key 去重
+        checkpoint = await event_queue.load_checkpoint(job_id)
+        checkpoint.values.pop("task_queued")
+        await checkpoint.save()
+        await line_webhook.process_queued_line_event(text_event("e1"), job_id=job_id)
+
+    asyncio.run(scenario())
+    assert acknowledged == ["r1"]
+    with task_queue._connect() as conn:
+        rows = conn.execute("SELECT unique_key FROM jobs WHERE queue = 'tasks'").fetchall()
+    assert [row[0] for row in rows] == ["task:e1"]
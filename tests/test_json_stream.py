@@ -0,0 +1,59 @@
+import json
+
+from src.services.json_stream import TopLevelFieldScanner
+
+
+def feed_in_chunks(scanner: TopLevelFieldScanner, text: str, size: int) -> dict[str, str]:
+    for start in range(0, len(text), size):
+        scanner.feed(text[start:start + size])
+    return scanner.found
+
+
+def test_fields_split_across_chunks():
+    text = json.dumps({"summary": "整理會議紀錄", "reply": "好的，已收到"}, ensure_ascii=False)
+    for size in (1, 2, 3, 7):
+        scanner = TopLevelFieldScanner(["summary", "reply"])
+        assert feed_in_chunks(scanner, text, size) == {"summary": "整理會議紀錄", "reply": "好的，已收到"}
+        assert scanner.done
+
+
+def test_field_is_available_before_the_object_closes():
+    scanner = TopLevelFieldScanner(["reply"])
+    assert scanner.feed('{"reply": "先回覆", "details": "尚未') == {"reply": "先回覆"}
+    assert scanner.done
+
+
+def test_escaped_quotes_and_backslashes():
+    value = 'He said "hi" \\ path\\to\n下一行'
+    text = json.dumps({"reply": value}, ensure_ascii=False)
+    scanner = TopLevelFieldScanner(["reply"])
+    assert feed_in_chunks(scanner, text, 1) == {"reply": value}
+
+
+def test_nested_values_are_skipped():
+    text = json.dumps({
+        "meta": {"reply": "巢狀的值", "list": ["reply", "}"]},
+        "items": [{"reply": "陣列中的值"}],
+        "reply": "頂層的值",
+    }, ensure_ascii=False)
+    scanner = TopLevelFieldScanner(["reply", "meta"])
+    assert feed_in_chunks(scanner, text, 5) == {"reply": "頂層的值"}
+    assert not scanner.done
+
+
+def test_string_values_are_not_mistaken_for_keys():
+    scanner = TopLevelFieldScanner(["reply"])
+    scanner.feed('{"note": "reply", "reply": "正確的值"}')
+    assert scanner.found == {"reply": "正確的值"}
+
+
+def test_fenced_output_is_scanned_from_the_first_brace():
+    text = '好的，以下是結果：\n```json\n{"reply": "完成"}\n```'
+    scanner = TopLevelFieldScanner(["reply"])
+    assert feed_in_chunks(scanner, text, 4) == {"reply": "完成"}
+
+
+def test_feed_stops_once_all_fields_are_found():
+    scanner = TopLevelFieldScanner(["reply"])
+    scanner.feed('{"reply": "第一個"')
+    assert scanner.feed(', "reply": "第二個"}') == {"reply": "第一個"}
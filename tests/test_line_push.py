@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+from src.services.line_service import LineService
+from src.services.task_queue import outbound_queue
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbound_queue, "db_path", tmp_path / "queue.db")
+    monkeypatch.setattr(outbound_queue, "_initialized", False)
+    s = LineService()
+    s.push_window = 3
+    s._queue_pushes = True
+    return s
+
+
+def pending_pushes() -> list[dict]:
+    with outbound_queue._connect() as conn:
+        rows = conn.execute("SELECT payload, run_at FROM jobs WHERE kind = 'line_push' ORDER BY id").fetchall()
+    return [{**json.loads(row["payload"]), "run_at": row["run_at"]} for row in rows]
+
+
+def texts(push: dict) -> list[str]:
+    return [message["text"] for message in push["messages"]]
+
+
+def test_push_is_queued_immediately_and_coalesced_per_recipient(service):
+    async def scenario():
+        await service.push_message("U1", "a")
+        await service.push_message("U1", "b")
+        await service.push_message("U2", "c")
+
+    asyncio.run(scenario())
+    pushes = pending_pushes()
+    assert [(p["to"], texts(p)) for p in pushes] == [("U1", ["a", "b"]), ("U2", ["c"])]
+    assert all(p["run_at"] is not None for p in pushes)
+
+
+def test_urgent_push_sends_pending_messages_with_it(service):
+    async def scenario():
+        await service.push_message("U1", "a")
+        await service.push_message("U1", "error", urgent=True)
+
+    asyncio.run(scenario())
+    [push] = pending_pushes()
+    assert texts(push) == ["a", "error"]
+    assert push["run_at"] is None
+
+
+def test_push_over_five_messages_is_split_into_requests(service):
+    asyncio.run(service.push_message("U1", [str(i) for i in range(7)]))
+    assert [texts(p) for p in pending_pushes()] == [["0", "1", "2", "3", "4"], ["5", "6"]]
+
+
+def test_multicast_reports_recipients_as_queued(service):
+    recipients = [f"U{i}" for i in range(501)] + ["U0"]
+    result = asyncio.run(service.multicast(recipients, "hello"))
+
+    assert len(result.queued) == 501 and not result.sent and not result.failed
+    with outbound_queue._connect() as conn:
+        batches = [json.loads(row[0])["to"] for row in conn.execute(
+            "SELECT payload FROM jobs WHERE kind = 'line_multicast' ORDER BY id"
+        )]
+    assert [len(batch) for batch in batches] == [500, 1]
+
+
+def test_direct_multicast_reports_sent_and_failed_batches(service, monkeypatch):
+    service._queue_pushes = False
+
+    async def send_multicast(to, messages, retry_key):
+        if "U500" in to:
+            raise RuntimeError("LINE HTTP 400")
+
+    monkeypatch.setattr(service, "send_multicast", send_multicast)
+    result = asyncio.run(service.multicast([f"U{i}" for i in range(501)], "hello"))
+
+    assert len(result.sent) == 500 and not result.queued
+    assert result.failed == {"U500": "LINE HTTP 400"}
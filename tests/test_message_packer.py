@@ -0,0 +1,39 @@
+from src.constants import LINE_MAX_MESSAGES_PER_REQUEST, LINE_TEXT_MAX_CHARS
+from src.services.line_service import _as_texts
+from src.services.message_packer import fits, line_length, pack_text
+
+
+def test_empty_or_whitespace_text_packs_to_no_messages():
+    assert pack_text("") == []
+    assert pack_text("  \n\n\t") == []
+    assert _as_texts(["", " ", "ok"]) == ["ok"]
+
+
+def test_short_text_is_a_single_bubble():
+    assert pack_text("hello\n\n\n\nworld") == ["hello\n\nworld"]
+
+
+def test_emoji_count_as_two_units():
+    assert line_length("😀") == 2
+    text = "😀" * (LINE_TEXT_MAX_CHARS // 2 + 1)
+    bubbles = pack_text(text)
+    assert len(bubbles) == 2
+    assert all(line_length(b) <= LINE_TEXT_MAX_CHARS for b in bubbles)
+
+
+def test_every_bubble_respects_the_limits():
+    paragraphs = "\n\n".join("x" * 3000 for _ in range(20))
+    bubbles = pack_text(paragraphs, continuation_url="https://notion.so/abc")
+    assert len(bubbles) == LINE_MAX_MESSAGES_PER_REQUEST
+    assert all(line_length(b) <= LINE_TEXT_MAX_CHARS for b in bubbles)
+    assert bubbles[-1].endswith("完整內容：https://notion.so/abc）")
+    assert not fits(paragraphs)
+
+
+def test_long_code_block_is_split_with_fences_on_every_piece():
+    code = "```python\n" + "\n".join(f"print({i})" for i in range(1000)) + "\n```"
+    bubbles = pack_text(code)
+    assert len(bubbles) > 1
+    for bubble in bubbles:
+        assert bubble.startswith("```python\n") and bubble.endswith("\n```")
+        assert line_length(bubble) <= LINE_TEXT_MAX_CHARS
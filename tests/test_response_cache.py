@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import pytest
+
+from src.models.claude_response import ClaudeResponse
+from src.services.claude_service import claude_service
+from src.services.response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = ResponseCache()
+    c.enabled = True
+    c.db_path = tmp_path / "cache.db"
+    c.ttl_seconds = 3600
+    return c
+
+
+def simple_response(**overrides) -> ClaudeResponse:
+    data = {
+        "difficulty": "simple",
+        "title": "翻譯",
+        "simple_result": {"summary": "翻譯", "result": "Good morning"},
+        "line_message": "Good morning",
+        "cacheable": True,
+    }
+    return ClaudeResponse(**{**data, **overrides})
+
+
+def put_then_get(cache: ResponseCache, response: ClaudeResponse, user_input: str = "早安翻英文"):
+    async def scenario():
+        await cache.put(user_input, None, "memories", response)
+        return await cache.get(user_input, None, "memories")
+
+    return asyncio.run(scenario())
+
+
+def test_cacheable_simple_response_is_served_again(cache):
+    hit = put_then_get(cache, simple_response())
+    assert hit is not None and hit.line_message == "Good morning"
+
+
+def test_fallback_from_unparseable_output_is_not_cached(cache):
+    fallback = claude_service._parse_json_response("抱歉，我無法以 JSON 回覆")
+    assert fallback.is_fallback
+    assert put_then_get(cache, fallback) is None
+
+    parsed = claude_service._parse_json_response(simple_response().model_dump_json())
+    assert not parsed.is_fallback
+
+
+def test_responses_not_marked_cacheable_are_not_cached(cache):
+    assert put_then_get(cache, simple_response(cacheable=False)) is None
+    assert put_then_get(cache, simple_response(memory_updates=[
+        {"action": "create", "title": "偏好", "content": "喜歡簡短回覆"}
+    ])) is None
+
+
+def test_entries_expire_after_the_ttl(cache):
+    asyncio.run(cache.put("早安翻英文", None, "memories", simple_response()))
+    for entry in cache._entries.values():
+        entry.created_at = time.time() - cache.ttl_seconds - 1
+    assert asyncio.run(cache.get("早安翻英文", None, "memories")) is None
+
+
+def test_legacy_rows_without_the_cacheable_flag_are_not_loaded(cache, tmp_path):
+    asyncio.run(cache.put("早安翻英文", None, "memories", simple_response()))
+    with cache._connect() as conn:
+        conn.execute(
+            "UPDATE responses SET response = ?",
+            (simple_response().model_dump_json(exclude={"cacheable"}),)
+        )
+        conn.commit()
+
+    restarted = ResponseCache()
+    restarted.enabled = True
+    restarted.db_path = tmp_path / "cache.db"
+    assert asyncio.run(restarted.get("早安翻英文", None, "memories")) is None
@@ -0,0 +1,274 @@
+import asyncio
+
+import pytest
+
+from src.services.task_queue import RetryJob, TaskQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = TaskQueue(name="test", worker_count=1, max_attempts=3)
+    q.db_path = tmp_path / "queue.db"
+    return q
+
+
+def expire_leases(queue: TaskQueue) -> None:
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET lease_expires_at = 0 WHERE status = 'running'")
+
+
+async def claim_and_run(queue: TaskQueue, owner: str = "w1") -> None:
+    job, _ = await asyncio.to_thread(queue._sync_claim, owner)
+    assert job is not None
+    await queue._run_job(job, owner)
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue):
+    queue.register("noop", lambda: None)
+    job_id = asyncio.run(queue.enqueue("noop"))
+
+    job, _ = queue._sync_claim("w1")
+    assert job["id"] == job_id
+    assert queue._sync_claim("w2")[0] is None
+
+    expire_leases(queue)
+    job, _ = queue._sync_claim("w2")
+    assert job["id"] == job_id
+    assert job["lease_owner"] == "w1"  # row as read before the reclaim
+    assert queue._sync_stats() == {"running": 1}
+
+
+def test_job_lost_too_many_times_is_dead_lettered(queue):
+    queue.register("noop", lambda: None)
+    job_id = asyncio.run(queue.enqueue("noop"))
+
+    for attempt in range(3):
+        job, _ = queue._sync_claim(f"w{attempt}")
+        assert job["id"] == job_id
+        expire_leases(queue)
+
+    assert queue._sync_claim("w9")[0] is None
+    failed = asyncio.run(queue.failed_jobs())
+    assert [job["id"] for job in failed] == [job_id]
+    assert failed[0]["last_error"] == "worker lost too many times"
+
+
+def test_retry_job_is_rescheduled_until_attempts_run_out(queue):
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        raise RetryJob("LINE HTTP 503", retry_after=0)
+
+    queue.register("flaky", flaky)
+
+    async def scenario():
+        await queue.enqueue("flaky")
+        await claim_and_run(queue)
+        assert queue._sync_stats() == {"pending": 1}
+        await claim_and_run(queue)
+        await claim_and_run(queue)
+
+    asyncio.run(scenario())
+    assert len(calls) == 3
+    failed = asyncio.run(queue.failed_jobs())
+    assert failed[0]["last_error"] == "LINE HTTP 503"
+    assert failed[0]["attempts"] == 3
+
+
+def test_handler_exception_fails_the_job_immediately(queue):
+    async def broken():
+        raise ValueError("bad payload")
+
+    queue.register("broken", broken)
+
+    async def scenario():
+        await queue.enqueue("broken")
+        await claim_and_run(queue)
+
+    asyncio.run(scenario())
+    assert queue._sync_stats() == {"failed": 1}
+
+
+def test_successful_job_is_done_and_receives_payload(queue):
+    received = []
+
+    async def handler(text: str):
+        received.append(text)
+
+    queue.register("echo", handler)
+
+    async def scenario():
+        await queue.enqueue("echo", text="hello")
+        await claim_and_run(queue)
+
+    asyncio.run(scenario())
+    assert received == ["hello"]
+    assert queue._sync_stats() == {"done": 1}
+
+
+def test_order_key_holds_back_later_jobs_of_the_same_key(queue):
+    queue.register("noop", lambda: None)
+    first, second, other = asyncio.run(
+        queue.enqueue_many("noop", [{}, {}, {}], ["user-a", "user-a", "user-b"])
+    )
+
+    assert queue._sync_claim("w1")[0]["id"] == first
+    assert queue._sync_claim("w2")[0]["id"] == other
+    assert queue._sync_claim("w3")[0] is None
+
+    queue._sync_finish(first, "w1", "done")
+    assert queue._sync_claim("w3")[0]["id"] == second
+
+
+def test_unique_key_enqueues_only_once(queue):
+    queue.register("noop", lambda: None)
+
+    async def scenario():
+        first = await queue.enqueue("noop", unique_key="task-1")
+        again = await queue.enqueue("noop", unique_key="task-1")
+        other = await queue.enqueue("noop", unique_key="task-2")
+        return first, again, other
+
+    first, again, other = asyncio.run(scenario())
+    assert first == again
+    assert other != first
+    assert queue._sync_stats() == {"pending": 2}
+
+
+def test_checkpoint_is_persisted_per_job(queue):
+    queue.register("noop", lambda: None)
+
+    async def scenario():
+        job_id = await queue.enqueue("noop")
+        checkpoint = await queue.load_checkpoint(job_id)
+        await checkpoint.save(inbox_task_id="page-1")
+        await checkpoint.save(replied=True)
+        return job_id
+
+    job_id = asyncio.run(scenario())
+    reloaded = asyncio.run(queue.load_checkpoint(job_id))
+    assert reloaded.values == {"inbox_task_id": "page-1", "replied": True}
+
+    in_memory = asyncio.run(queue.load_checkpoint(None))
+    asyncio.run(in_memory.save(step=1))
+    assert in_memory.get("step") == 1
+
+
+def test_delayed_jobs_with_the_same_coalesce_key_are_merged(queue):
+    def merge(existing: dict, new: dict) -> dict:
+        return {"texts": existing["texts"] + new["texts"]}
+
+    queue.register("message", lambda texts: None, merge=merge)
+
+    async def scenario():
+        first = await queue.enqueue("message", delay=60, coalesce_key="user-a", texts=["a"])
+        second = await queue.enqueue("message", delay=60, coalesce_key="user-a", texts=["b"])
+        other = await queue.enqueue("message", delay=60, coalesce_key="user-b", texts=["c"])
+        return first, second, other
+
+    first, second, other = asyncio.run(scenario())
+    assert first == second != other
+    with queue._connect() as conn:
+        payload = conn.execute("SELECT payload FROM jobs WHERE id = ?", (first,)).fetchone()[0]
+    assert payload == '{"texts": ["a", "b"]}'
+
+
+def merge_up_to_three(existing: dict, new: dict):
+    texts = existing["texts"] + new["texts"]
+    return {"texts": texts} if len(texts) <= 3 else None
+
+
+def test_merge_that_does_not_fit_enqueues_a_new_job(queue):
+    queue.register("message", lambda texts: None, merge=merge_up_to_three)
+
+    async def scenario():
+        first = await queue.enqueue("message", delay=60, coalesce_key="u", texts=["a", "b"])
+        second = await queue.enqueue("message", delay=60, coalesce_key="u", texts=["c", "d"])
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first != second
+    assert queue._sync_stats() == {"pending": 2}
+
+
+def test_immediate_job_merges_and_expedites_the_delayed_one(queue):
+    queue.register("message", lambda texts: None, merge=merge_up_to_three)
+
+    async def scenario():
+        first = await queue.enqueue("message", delay=60, coalesce_key="u", texts=["a"])
+        merged = await queue.enqueue("message", coalesce_key="u", texts=["b"])
+        return first, merged
+
+    first, merged = asyncio.run(scenario())
+    assert first == merged
+    job, _ = queue._sync_claim("w1")
+    assert job["id"] == first
+    assert job["payload"] == '{"texts": ["a", "b"]}'
+
+
+def test_immediate_job_that_does_not_fit_expedites_the_delayed_one(queue):
+    queue.register("message", lambda texts: None, merge=merge_up_to_three)
+
+    async def scenario():
+        first = await queue.enqueue("message", delay=60, coalesce_key="u", order_key="u", texts=["a", "b"])
+        second = await queue.enqueue("message", coalesce_key="u", order_key="u", texts=["c", "d"])
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert queue._sync_claim("w1")[0]["id"] == first
+    queue._sync_finish(first, "w1", "done")
+    assert queue._sync_claim("w1")[0]["id"] == second
+
+
+def test_job_already_attempted_is_not_merged_into(queue):
+    queue.register("message", lambda texts: None, merge=merge_up_to_three)
+
+    async def scenario():
+        first = await queue.enqueue("message", delay=60, coalesce_key="u", texts=["a"])
+        # 模擬送出失敗後以 RetryJob 重新排程
+        with queue._connect() as conn:
+            conn.execute("UPDATE jobs SET attempts = 1 WHERE id = ?", (first,))
+        second = await queue.enqueue("message", delay=60, coalesce_key="u", texts=["b"])
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first != second
+
+
+def test_waiting_retry_does_not_use_up_attempts(queue):
+    calls = []
+
+    async def poll():
+        calls.append(1)
+        if len(calls) < 5:
+            raise RetryJob("batch 尚未完成", retry_after=0, count_attempt=False)
+
+    queue.register("poll", poll)
+
+    async def scenario():
+        await queue.enqueue("poll")
+        for _ in range(5):
+            await claim_and_run(queue)
+
+    asyncio.run(scenario())
+    assert len(calls) == 5
+    assert queue._sync_stats() == {"done": 1}
+
+
+def test_backlog_counts_only_runnable_jobs(queue):
+    async def poll():
+        raise RetryJob("batch 尚未完成", retry_after=60, count_attempt=False)
+
+    queue.register("poll", poll)
+    queue.register("noop", lambda: None)
+
+    async def scenario():
+        for _ in range(3):
+            await queue.enqueue("poll")
+            await claim_and_run(queue)
+        await queue.enqueue("noop")
+        return await queue.backlog()
+
+    assert asyncio.run(scenario()) == {"pending": 1, "running": 0, "waiting": 3}
+    assert queue._sync_stats() == {"pending": 4}
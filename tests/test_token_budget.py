@@ -0,0 +1,58 @@
+import pytest
+
+from src.services.notion_service import NotionService
+from src.services.token_budget import TokenBudgeter, estimate_tokens, truncate_middle
+
+
+def test_estimate_counts_wide_characters_as_one_token():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("中文字") == 3
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("中文 abcd") == 2 + 2
+
+
+@pytest.mark.parametrize("text", [
+    "a" * 10000,
+    "中" * 5000,
+    ("標題說明 " + "mixed 中英 text 😀\n") * 500,
+])
+@pytest.mark.parametrize("max_tokens", [0, 10, 100, 1000])
+def test_truncated_text_including_the_marker_fits_the_budget(text, max_tokens):
+    truncated = truncate_middle(text, max_tokens)
+    assert estimate_tokens(truncated) <= max_tokens
+    if max_tokens >= 100:
+        # 只省略必要的部分，標記之外幾乎用滿預算
+        assert estimate_tokens(truncated) >= max_tokens - 5
+        assert truncated.startswith(text[:20]) and truncated.endswith(text[-5:])
+
+
+def test_text_within_budget_is_unchanged():
+    assert truncate_middle("short", 10) == "short"
+
+
+def memory(title: str, importance: str, size: int) -> dict:
+    return {"title": title, "category": "context", "importance": importance, "content": "記" * size}
+
+
+def test_plan_truncates_the_attachment_without_touching_memories():
+    budgeter = TokenBudgeter()
+    budgeter.input_budget = 3000
+    memories = [memory("high", "high", 500)]
+
+    budget = budgeter.plan("system", "task", memories, "附" * 10000, NotionService.format_memories)
+
+    assert budget.truncated == ["附件"]
+    assert budget.memories_text == NotionService.format_memories(memories)
+    assert budget.input_tokens <= budgeter.input_budget
+
+
+def test_plan_drops_low_importance_memories_first():
+    budgeter = TokenBudgeter()
+    budgeter.input_budget = 1000
+    memories = [memory("low", "low", 800), memory("high", "high", 300)]
+
+    budget = budgeter.plan("system", "task", memories, None, NotionService.format_memories)
+
+    assert budget.dropped_memories == 1
+    assert "【high】" in budget.memories_text and "【low】" not in budget.memories_text
+    assert budget.truncated == []